@@ -0,0 +1,264 @@
+"""
+Admission control for the ingest endpoints.
+
+After a power or network restore all sensors send their backlog at once. Instead of passing the burst to
+the database, ingest requests are admitted by:
+
+* a global and a per sensor token bucket (readings per second with a burst allowance),
+* a bounded ingest queue: the number of admitted readings not yet written is limited by a capacity,
+* priority lanes: backlog replays are only admitted while the queue is below the high-water mark,
+  real-time readings are admitted up to the full capacity. Each lane has its own token buckets, so a
+  backlog replay (which may leave its buckets in debt) never delays the real-time readings of a sensor.
+
+Rejected requests get 429 Too Many Requests with a Retry-After of the bucket refill time, or of the
+measured queue drain rate (capped at MAX_RETRY_AFTER), so well behaved clients spread their retries.
+"""
+
+import math
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, Iterator, Optional
+from fastapi import HTTPException
+from .config import get_settings
+from .metrics import INGEST_ADMISSION, INGEST_QUEUE_DEPTH
+
+REALTIME = "realtime"
+BACKLOG = "backlog"
+MAX_RETRY_AFTER = 60  # Seconds, cap of the queue drain estimate.
+LANES = (REALTIME, BACKLOG)
+
+
+class AdmissionRejected(Exception):
+    """Raised when an ingest request is not admitted."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Ingest rejected ({reason}), retry after {retry_after} s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Token bucket of `rate` tokens per second up to `burst` tokens. Not thread-safe, guarded by the caller."""
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, n: int, now: float) -> float:
+        """
+        Seconds until n tokens can be taken, 0 when they can be taken now.
+        Requests larger than the burst are admitted with a full bucket and leave it in debt.
+        """
+        self._refill(now)
+        needed = min(n, self.burst)
+        return 0.0 if self.tokens >= needed else (needed - self.tokens) / self.rate
+
+    def take(self, n: int) -> None:
+        self.tokens -= n
+
+    @property
+    def full(self) -> bool:
+        return self.tokens >= self.burst
+
+
+class AdmissionController:
+    """Token buckets per lane, bounded ingest queue and priority lanes in front of the ingest endpoints."""
+
+    def __init__(
+        self,
+        global_rate: float,
+        global_burst: float,
+        sensor_rate: float,
+        sensor_burst: float,
+        queue_capacity: int,
+        queue_high_water: int,
+        realtime_max_age: float = 300.0,
+        max_sensors: int = 100_000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            global_rate (float): Readings per second admitted in total, per lane. 0 disables the global buckets.
+            global_burst (float): Burst allowance of the global bucket.
+            sensor_rate (float): Readings per second admitted per sensor and lane. 0 disables the per sensor buckets.
+            sensor_burst (float): Burst allowance of a sensor bucket.
+            queue_capacity (int): Maximum number of admitted readings not yet written.
+            queue_high_water (int): Backlog readings are admitted only while the queue is below this depth.
+            realtime_max_age (float): Requests whose oldest reading is older than this (seconds) go to the backlog lane.
+            max_sensors (int): Number of sensor buckets kept per lane, the least recently used ones are dropped.
+            clock (Callable[[], float]): Monotonic clock in seconds.
+        """
+        self.global_rate = global_rate
+        self.sensor_rate = sensor_rate
+        self.sensor_burst = sensor_burst
+        self.queue_capacity = queue_capacity
+        self.queue_high_water = min(queue_high_water, queue_capacity)
+        self.realtime_max_age = realtime_max_age
+        self.max_sensors = max_sensors
+        self.clock = clock
+        self._global = {lane: TokenBucket(global_rate, global_burst, clock()) for lane in LANES if global_rate > 0}
+        self._sensors: Dict[str, "OrderedDict[str, TokenBucket]"] = {lane: OrderedDict() for lane in LANES}
+        self._depth = 0
+        self._drained: deque = deque()  # (time, readings) of the writes finished in the drain window.
+        self._drain_window = 10.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "AdmissionController":
+        """Create a controller with the limits defined in the application settings."""
+        settings = get_settings()
+        return cls(
+            global_rate=settings.ingest_global_rate,
+            global_burst=settings.ingest_global_burst,
+            sensor_rate=settings.ingest_sensor_rate,
+            sensor_burst=settings.ingest_sensor_burst,
+            queue_capacity=settings.ingest_queue_capacity,
+            queue_high_water=settings.ingest_queue_high_water,
+            realtime_max_age=settings.ingest_realtime_max_age_s,
+        )
+
+    @property
+    def depth(self) -> int:
+        """Number of admitted readings not yet written."""
+        return self._depth
+
+    def lane(self, timestamps: Iterable[Optional[datetime]], priority: Optional[str] = None) -> str:
+        """
+        Priority lane of a request: the explicit priority if given (e.g. by the X-Ingest-Priority header),
+        otherwise backlog when the oldest reading is older than realtime_max_age.
+        """
+        if priority in (REALTIME, BACKLOG):
+            return priority
+        now = datetime.now(timezone.utc)
+        for timestamp in timestamps:
+            if timestamp is None:
+                continue
+            if timestamp.tzinfo is None:
+                timestamp = timestamp.replace(tzinfo=timezone.utc)
+            if (now - timestamp).total_seconds() > self.realtime_max_age:
+                return BACKLOG
+        return REALTIME
+
+    def drain_rate(self, now: float) -> float:
+        """Readings written per second over the drain window."""
+        while self._drained and self._drained[0][0] < now - self._drain_window:
+            self._drained.popleft()
+        return sum(n for _, n in self._drained) / self._drain_window
+
+    def _queue_retry_after(self, excess: int, now: float) -> float:
+        rate = self.drain_rate(now) or self.global_rate or 1.0
+        return excess / rate
+
+    def _sensor_bucket(self, sensor_id: str, lane: str, now: float) -> TokenBucket:
+        buckets = self._sensors[lane]
+        bucket = buckets.get(sensor_id)
+        if bucket is None:
+            bucket = buckets[sensor_id] = TokenBucket(self.sensor_rate, self.sensor_burst, now)
+            if len(buckets) > self.max_sensors:
+                buckets.popitem(last=False)
+        else:
+            buckets.move_to_end(sensor_id)
+        return bucket
+
+    def try_admit(self, sensor_counts: Dict[str, int], lane: str) -> int:
+        """
+        Admit the readings of a request into the ingest queue, or raise.
+
+        Args:
+            sensor_counts (Dict[str, int]): Number of readings per sensor ID.
+            lane (str): REALTIME or BACKLOG.
+
+        Raises:
+            AdmissionRejected: The queue is full for the lane, or a token bucket is empty.
+
+        Returns:
+            int: Number of admitted readings, to be passed to release() once written.
+        """
+        n = sum(sensor_counts.values())
+        now = self.clock()
+        with self._lock:
+            limit = self.queue_capacity if lane == REALTIME else self.queue_high_water
+            if self._depth + n > limit and self._depth > 0:
+                retry_after = min(MAX_RETRY_AFTER, self._queue_retry_after(self._depth + n - limit, now))
+                self._reject("queue_full", lane, retry_after)
+
+            # The buckets of the request's lane only: backlog debt does not delay real-time readings.
+            global_bucket = self._global.get(lane)
+            waits = []
+            if global_bucket is not None:
+                waits.append(global_bucket.wait_time(n, now))
+            buckets = []
+            if self.sensor_rate > 0:
+                for sensor_id, count in sensor_counts.items():
+                    bucket = self._sensor_bucket(sensor_id, lane, now)
+                    waits.append(bucket.wait_time(count, now))
+                    buckets.append((bucket, count))
+            wait = max(waits, default=0.0)
+            if wait > 0:
+                self._reject("rate_limited", lane, wait)
+
+            # All checks passed, take the tokens.
+            if global_bucket is not None:
+                global_bucket.take(n)
+            for bucket, count in buckets:
+                bucket.take(count)
+            self._depth += n
+            INGEST_QUEUE_DEPTH.set(self._depth)
+        INGEST_ADMISSION.labels(lane, "admitted").inc()
+        return n
+
+    def _reject(self, reason: str, lane: str, retry_after: float) -> None:
+        INGEST_ADMISSION.labels(lane, reason).inc()
+        raise AdmissionRejected(reason, max(1, math.ceil(retry_after)))
+
+    def release(self, n: int) -> None:
+        """Remove written (or failed) readings from the ingest queue."""
+        now = self.clock()
+        with self._lock:
+            self._depth -= n
+            self._drained.append((now, n))
+            INGEST_QUEUE_DEPTH.set(self._depth)
+
+    @contextmanager
+    def admit(self, sensor_ids: Iterable[str], timestamps: Iterable[Optional[datetime]], priority: Optional[str] = None) -> Iterator[str]:
+        """
+        Admit an ingest request for the duration of the with block, or raise HTTP 429 with Retry-After.
+
+        Args:
+            sensor_ids (Iterable[str]): Sensor ID of every reading of the request.
+            timestamps (Iterable[Optional[datetime]]): Timestamp of every reading, used to choose the lane.
+            priority (Optional[str]): Explicit lane ("realtime" or "backlog"), e.g. from the X-Ingest-Priority header.
+
+        Yields:
+            str: The lane of the request.
+        """
+        lane = self.lane(timestamps, priority)
+        try:
+            n = self.try_admit(Counter(sensor_ids), lane)
+        except AdmissionRejected as e:
+            raise HTTPException(
+                status_code=429,
+                detail=f"Ingest is throttled ({e.reason}), retry later",
+                headers={"Retry-After": str(e.retry_after)},
+            ) from e
+        try:
+            yield lane
+        finally:
+            self.release(n)
+
+
+admission_controller = AdmissionController.from_settings()
+
+
+def get_admission_controller() -> AdmissionController:
+    """Get the application wide ingest admission controller for DI."""
+    return admission_controller
@@ -0,0 +1,79 @@
+"""
+Alignment of sensor series on a common time grid.
+
+The grid follows TimescaleDB time_bucket(): buckets of a fixed interval, aligned to 2000-01-03 00:00 UTC,
+so the NumPy fallback and the time_bucket_gapfill() query produce the same grid. A bucket holds the mean of
+the readings in it. Empty buckets are left empty (null), filled with the previous value (locf) or linearly
+interpolated between the neighbour buckets. Like Timescale's locf() and interpolate(), nothing is
+extrapolated before the first or after the last non-empty bucket of the range.
+"""
+
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+from typing import Tuple
+import numpy as np
+
+TIME_BUCKET_ORIGIN = datetime(2000, 1, 3)
+
+
+class FillMethod(str, Enum):
+    """How empty buckets of an aligned series are filled."""
+
+    NULL = "null"
+    PREVIOUS = "previous"
+    LINEAR = "linear"
+
+
+def to_naive_utc(timestamp: datetime) -> datetime:
+    """Naive UTC timestamp, as stored in the database. Naive timestamps are taken as UTC."""
+    if timestamp.tzinfo is not None:
+        return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def grid_start(timestamp: datetime, interval: timedelta) -> datetime:
+    """Start of the time_bucket() bucket containing the timestamp."""
+    return TIME_BUCKET_ORIGIN + ((timestamp - TIME_BUCKET_ORIGIN) // interval) * interval
+
+
+def bucket_sums(offsets: np.ndarray, values: np.ndarray, interval: float, length: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Sum and count of the readings per bucket. Readings outside the grid are ignored.
+
+    Args:
+        offsets (np.ndarray): Seconds of the readings since the grid start.
+        values (np.ndarray): Values of the readings.
+        interval (float): Bucket size in seconds.
+        length (int): Number of buckets.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Sums and counts, mergeable across chunks by addition.
+    """
+    index = np.floor_divide(offsets, interval).astype(np.int64)
+    inside = (index >= 0) & (index < length)
+    sums = np.bincount(index[inside], weights=values[inside], minlength=length)
+    counts = np.bincount(index[inside], minlength=length)
+    return sums, counts
+
+
+def bucket_means(sums: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Mean value per bucket, NaN for empty buckets."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+
+def fill_gaps(values: np.ndarray, method: FillMethod) -> np.ndarray:
+    """Fill the NaN buckets of a series, see the module docstring."""
+    if method == FillMethod.NULL:
+        return values
+    valid = ~np.isnan(values)
+    if not valid.any():
+        return values
+    positions = np.arange(len(values))
+    if method == FillMethod.PREVIOUS:
+        last_valid = np.maximum.accumulate(np.where(valid, positions, -1))
+        return np.where(last_valid >= 0, values[np.maximum(last_valid, 0)], np.nan)
+    filled = np.interp(positions, positions[valid], values[valid])
+    first, last = positions[valid][[0, -1]]
+    filled[(positions < first) | (positions > last)] = np.nan
+    return filled
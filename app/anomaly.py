@@ -0,0 +1,239 @@
+"""
+Streaming anomaly detection over sensor series.
+
+Rows are read in chunks (ordered by series and time) and evaluated with NumPy/pandas window operations:
+rolling z-score against the previous `window` values, deviation from an exponentially weighted moving
+average (EWMA) in units of the EW standard deviation, and rate of change per second.
+The per series state (window tail, EWMA mean and variance, last reading) is carried across chunks,
+so the result does not depend on the chunk size. Chunks are evaluated in a process pool, while the
+next chunk is fetched from the database.
+
+This module is imported by the worker processes, keep it free of database imports.
+"""
+
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from itertools import groupby
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from .config import get_settings
+
+SeriesKey = Tuple[str, str]
+
+
+@dataclass
+class AnomalyParams:
+    """Detector thresholds."""
+
+    window: int = 60  # Number of previous values of the rolling z-score. Also the warm-up of the EWMA check.
+    z_threshold: float = 3.0  # Rolling z-score limit.
+    ewma_alpha: float = 0.1  # EWMA smoothing factor.
+    ewma_threshold: float = 3.0  # EWMA deviation limit, in EW standard deviations.
+    max_rate: Optional[float] = None  # Rate of change limit in units per second. None disables the check.
+
+
+@dataclass
+class SeriesState:
+    """Detector state of a series carried from one chunk to the next."""
+
+    tail: np.ndarray = field(default_factory=lambda: np.empty(0))  # Last window values.
+    seen: int = 0
+    ewma: float = 0.0
+    ewvar: float = 0.0
+    last_time: Optional[float] = None
+    last_value: Optional[float] = None
+
+
+@dataclass
+class Anomaly:
+    """A flagged reading."""
+
+    sensor_id: str
+    metric: str
+    timestamp: datetime
+    value: float
+    checks: List[str]
+    zscore: Optional[float] = None
+    ewma_score: Optional[float] = None
+    rate: Optional[float] = None
+
+
+def _scan_series(
+    state: SeriesState, times: np.ndarray, values: np.ndarray, params: AnomalyParams
+) -> Tuple[SeriesState, List[Tuple[int, List[str], Optional[float], Optional[float], Optional[float]]]]:
+    """
+    Evaluate one chunk of a series.
+
+    Returns:
+        The new state and (position, failed checks, zscore, ewma score, rate) of the flagged values.
+    """
+    n = len(values)
+    window = params.window
+
+    # Rolling z-score: window of the previous values, including the tail of the previous chunk.
+    extended = np.concatenate([state.tail, values])
+    zscores = np.full(n, np.nan)
+    if len(extended) > window:
+        windows = sliding_window_view(extended[:-1], window)[-n:]
+        offset = n - len(windows)
+        mean = windows.mean(axis=1)
+        std = windows.std(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            zscores[offset:] = np.where(std > 0, (values[offset:] - mean) / std, 0.0)
+
+    # EWMA deviation, continuing from the previous EWMA mean and variance.
+    # ewma[i] is the mean before values[i], ewma[-1] the mean after the chunk.
+    start = values[0] if state.seen == 0 else state.ewma
+    ewma = pd.Series(np.concatenate([[start], values])).ewm(alpha=params.ewma_alpha, adjust=False).mean().to_numpy()
+    deviation = values - ewma[:-1]
+    ewvar = pd.Series(np.concatenate([[state.ewvar], deviation**2])).ewm(alpha=params.ewma_alpha, adjust=False).mean().to_numpy()
+    ewstd_prev = np.sqrt(ewvar[:-1])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ewma_scores = np.where(ewstd_prev > 0, deviation / ewstd_prev, 0.0)
+    warm = state.seen + np.arange(n) >= window
+    ewma_scores = np.where(warm, ewma_scores, np.nan)
+
+    # Rate of change per second against the previous reading.
+    rates = np.full(n, np.nan)
+    if params.max_rate is not None:
+        prev_times = np.concatenate([[state.last_time if state.last_time is not None else np.nan], times[:-1]])
+        prev_values = np.concatenate([[state.last_value if state.last_value is not None else np.nan], values[:-1]])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rates = np.where(times > prev_times, (values - prev_values) / (times - prev_times), np.nan)
+
+    z_flag = np.abs(zscores) > params.z_threshold
+    e_flag = np.abs(ewma_scores) > params.ewma_threshold
+    r_flag = np.abs(rates) > params.max_rate if params.max_rate is not None else np.zeros(n, dtype=bool)
+    flagged = []
+    for i in np.flatnonzero(z_flag | e_flag | r_flag):
+        checks = [name for name, hit in (("zscore", z_flag[i]), ("ewma", e_flag[i]), ("rate", r_flag[i])) if hit]
+        flagged.append((int(i), checks, _num(zscores[i]), _num(ewma_scores[i]), _num(rates[i])))
+
+    new_state = SeriesState(
+        tail=extended[-window:].copy(),
+        seen=state.seen + n,
+        ewma=float(ewma[-1]),
+        ewvar=float(ewvar[-1]),
+        last_time=float(times[-1]),
+        last_value=float(values[-1]),
+    )
+    return new_state, flagged
+
+
+def _num(value: float) -> Optional[float]:
+    return None if np.isnan(value) else float(value)
+
+
+def scan_chunk(
+    states: Dict[SeriesKey, SeriesState],
+    series: Dict[SeriesKey, Tuple[np.ndarray, np.ndarray]],
+    params: AnomalyParams,
+) -> Tuple[Dict[SeriesKey, SeriesState], Dict[SeriesKey, List[tuple]]]:
+    """
+    Evaluate the series slices of one chunk. Runs in a worker process.
+
+    Args:
+        states (Dict[SeriesKey, SeriesState]): State of the series continuing from the previous chunk.
+        series (Dict[SeriesKey, Tuple[np.ndarray, np.ndarray]]): Epoch seconds and values per series.
+        params (AnomalyParams): Detector thresholds.
+
+    Returns:
+        The new states and the flagged positions per series.
+    """
+    new_states, flagged = {}, {}
+    for key, (times, values) in series.items():
+        new_states[key], flagged[key] = _scan_series(states.get(key, SeriesState()), times, values, params)
+    return new_states, flagged
+
+
+def _split(chunk: List[Tuple[str, str, datetime, float]]):
+    """Group a chunk ordered by series into per series arrays."""
+    series, rows = {}, {}
+    for key, group in groupby(chunk, key=lambda r: (r[0], r[1])):
+        group = list(group)
+        times = np.array([r[2] for r in group], dtype="datetime64[us]").astype(np.int64) / 1e6
+        series[key] = (times, np.array([r[3] for r in group], dtype=float))
+        rows[key] = group
+    return series, rows
+
+
+def scan_anomalies(
+    chunks: Iterable[List[Tuple[str, str, datetime, float]]],
+    params: AnomalyParams,
+    executor: Optional[Executor] = None,
+    max_results: int = 10000,
+) -> Tuple[int, List[Anomaly], bool]:
+    """
+    Scan a stream of (sensor_id, metric, timestamp, value) chunks ordered by series and time.
+
+    Args:
+        chunks: Chunks of rows, e.g. SensorDataDAL.iter_sensor_values().
+        params (AnomalyParams): Detector thresholds.
+        executor (Optional[Executor]): Pool evaluating the chunks. Evaluated inline when None.
+        max_results (int): Maximum number of flagged readings returned.
+
+    Returns:
+        Tuple[int, List[Anomaly], bool]: Number of scanned readings, the flagged readings and whether
+            the flagged list was truncated.
+    """
+    states: Dict[SeriesKey, SeriesState] = {}
+    scanned, results, truncated = 0, [], False
+    pending = None
+
+    def collect(job):
+        nonlocal truncated
+        (new_states, flagged), rows = job[0].result() if executor else job[0], job[1]
+        states.update(new_states)
+        for key, hits in flagged.items():
+            for position, checks, zscore, ewma_score, rate in hits:
+                if len(results) >= max_results:
+                    truncated = True
+                    return
+                sensor_id, metric, timestamp, value = rows[key][position]
+                results.append(Anomaly(sensor_id, metric, timestamp, value, checks, zscore, ewma_score, rate))
+
+    for chunk in chunks:
+        if not chunk:
+            continue
+        scanned += len(chunk)
+        series, rows = _split(chunk)
+        # The state of a series spanning the chunk boundary comes from the previous job,
+        # the next chunk is fetched while this one is evaluated.
+        if pending is not None:
+            collect(pending)
+        carried = {key: states[key] for key in series if key in states}
+        states.clear()
+        if executor:
+            pending = (executor.submit(scan_chunk, carried, series, params), rows)
+        else:
+            pending = (scan_chunk(carried, series, params), rows)
+    if pending is not None:
+        collect(pending)
+    return scanned, results, truncated
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_anomaly_executor() -> Optional[Executor]:
+    """Process pool of the anomaly scans for DI. None (inline evaluation) when ANOMALY_WORKERS is 0."""
+    global _executor  # pylint: disable=global-statement
+    workers = get_settings().anomaly_workers
+    if workers <= 0:
+        return None
+    if _executor is None:
+        # Spawned workers do not inherit the server's threads, sockets and connection pools.
+        _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def shutdown_anomaly_executor() -> None:
+    """Stop the worker processes on application shutdown."""
+    global _executor  # pylint: disable=global-statement
+    if _executor is not None:
+        _executor.shutdown(cancel_futures=True)
+        _executor = None
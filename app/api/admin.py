@@ -0,0 +1,91 @@
+"""Administrative API endpoints for operating and tuning the service."""
+
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from app import schemas
+from app.edge import DailyPartitions, get_daily_partitions
+from app.slow_query import SlowQueryRecorder, get_slow_query_recorder
+from app.sql_templates import SqlTemplateCache, get_sql_template_cache
+
+router = APIRouter()
+
+
+@router.get("/admin/slow_queries", response_model=List[schemas.SlowQueryOut])
+def list_slow_queries(
+    limit: int = Query(default=50, ge=1, le=1000),
+    recorder: SlowQueryRecorder = Depends(get_slow_query_recorder),
+):
+    """
+    Lists the captured slow SQL statements, newest first.
+
+    Args:
+        limit (int): Maximum number of statements to return.
+        recorder (SlowQueryRecorder): The slow query recorder dependency.
+
+    Returns:
+        List[schemas.SlowQueryOut]: Captured statements with bound parameters and execution plans.
+    """
+    return recorder.entries(limit)
+
+
+@router.delete("/admin/slow_queries", status_code=204)
+def clear_slow_queries(recorder: SlowQueryRecorder = Depends(get_slow_query_recorder)):
+    """
+    Drops all captured slow SQL statements, e.g. after an index or chunk interval change.
+
+    Args:
+        recorder (SlowQueryRecorder): The slow query recorder dependency.
+    """
+    recorder.clear()
+
+
+@router.get("/admin/sql_templates", response_model=List[schemas.SqlTemplateOut])
+def list_sql_templates(
+    limit: int = Query(default=100, ge=1, le=10000),
+    templates: Optional[SqlTemplateCache] = Depends(get_sql_template_cache),
+):
+    """
+    Lists the reusable SQL templates of /sensors/ask questions with their replay statistics,
+    most recently used first.
+
+    Args:
+        limit (int): Maximum number of templates to return.
+        templates (Optional[SqlTemplateCache]): The SQL template cache dependency, None when disabled.
+
+    Returns:
+        List[schemas.SqlTemplateOut]: Question forms, parametrized SQL, success and latency statistics.
+    """
+    if templates is None:
+        return []
+    return [template.to_out() for template in templates.entries()[:limit]]
+
+
+@router.delete("/admin/sql_templates", status_code=204)
+def clear_sql_templates(templates: Optional[SqlTemplateCache] = Depends(get_sql_template_cache)):
+    """
+    Drops all SQL templates, e.g. after a schema change or a prompt update.
+
+    Args:
+        templates (Optional[SqlTemplateCache]): The SQL template cache dependency, None when disabled.
+    """
+    if templates is not None:
+        templates.clear()
+
+
+@router.get("/admin/edge/partitions", response_model=List[schemas.EdgePartitionOut])
+def list_edge_partitions(partitions: Optional[DailyPartitions] = Depends(get_daily_partitions)):
+    """
+    Lists the daily partitions of the embedded edge mode with their row counts and upstream sync state.
+
+    Args:
+        partitions (Optional[DailyPartitions]): The edge mode partitions dependency, None on PostgreSQL.
+
+    Returns:
+        List[schemas.EdgePartitionOut]: The partitions, oldest first.
+
+    Raises:
+        HTTPException: 404 when the service does not run in the edge mode.
+    """
+    if partitions is None:
+        raise HTTPException(status_code=404, detail="The edge mode is not enabled")
+    return partitions.states()
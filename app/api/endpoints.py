@@ -1,27 +1,63 @@
 """API endpoints for managing and querying sensor data."""
 
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+import asyncio
+import logging
+import math
+from concurrent.futures import Executor
+from datetime import datetime, timedelta, timezone
+from typing import Callable, ContextManager, Dict, List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from app import schemas, models
-from app.dal import SensorDataDAL, get_sensor_data_dal
-from app.llm_sql import get_prompt, parse_response, get_llm_agent
+from app.admission import AdmissionController, get_admission_controller
+from app.alignment import FillMethod, grid_start, to_naive_utc
+from app.anomaly import AnomalyParams, get_anomaly_executor, scan_anomalies
+from app.ask import answer_question, get_ask_batch_executor, validate_question
+from app.config import get_settings
+from app.dal import SensorDataDAL, get_sensor_data_dal, get_sensor_data_dal_factory, parse_iso_datetime
+from app.edge import ReadingOutOfRange
+from app.export import compress, negotiate_encoding, parquet_available, rows_to_parquet
+from app.http_cache import cache_headers, check_not_modified, validate_cache
+from app.live import SLOW_CONSUMER, HubFull, LiveHub, Subscriber, get_live_hub
+from app.llm_sql import get_llm_agent
+from app.result_cache import QueryKey, ResultCache, get_result_cache
+from app.sql_templates import SqlTemplateCache, get_sql_template_cache
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+MATRIX_MAX_LENGTH = 100_000
+MATRIX_MAX_CELLS = 2_000_000
+
 
 @router.post("/sensors/data", response_model=schemas.SensorDataOut)
 def create_sensor_data(
-    data: schemas.SensorDataIn, dal: SensorDataDAL = Depends(get_sensor_data_dal)
+    data: schemas.SensorDataIn,
+    response: Response,
+    priority: Optional[str] = Header(default=None, alias="X-Ingest-Priority"),
+    dal: SensorDataDAL = Depends(get_sensor_data_dal),
+    admission: AdmissionController = Depends(get_admission_controller),
 ):
     """
     Creates a new sensor data record in the database.
+    Idempotent: a reading with the sensor, metric and timestamp of a stored one is not stored again,
+    the stored record is returned with the "X-Duplicate: true" header.
+    Throttled by the ingest admission control: 429 with Retry-After when the sensor, or the ingest in total,
+    sends faster than the configured rates or the ingest queue is full.
 
     Args:
         data (schemas.SensorDataIn): The input data for the sensor, validated by the SensorDataIn schema.
+        response (Response): The response, used to set the duplicate header.
+        priority (Optional[str]): "realtime" or "backlog" lane. Header: "X-Ingest-Priority". Decided by the reading age if not set.
         dal (SensorDataDAL): The data access layer dependency.
+        admission (AdmissionController): The ingest admission control dependency.
 
     Returns:
-        The created sensor data record.
+        The created (or already stored) sensor data record.
+
+    Raises:
+        HTTPException: 422 in the edge mode for a reading outside the retention window.
     """
 
     sensor_data = models.SensorData(
@@ -30,35 +66,546 @@ def create_sensor_data(
         value=data.value,
         timestamp=data.timestamp,
     )
-    return schemas.SensorDataOut.from_model(dal.create_sensor_data(sensor_data))
+    with admission.admit([data.sensor_id], [data.timestamp], priority):
+        try:
+            stored = dal.create_sensor_data(sensor_data)
+        except ReadingOutOfRange as e:
+            raise HTTPException(status_code=422, detail=str(e)) from e
+    if stored is not sensor_data:
+        response.headers["X-Duplicate"] = "true"
+    return schemas.SensorDataOut.from_model(stored)
+
+
+@router.post("/sensors/data/bulk", response_model=schemas.BulkIngestResponse)
+def create_sensor_data_bulk(
+    request: schemas.BulkIngestRequest,
+    priority: Optional[str] = Header(default=None, alias="X-Ingest-Priority"),
+    dal: SensorDataDAL = Depends(get_sensor_data_dal),
+    admission: AdmissionController = Depends(get_admission_controller),
+):
+    """
+    Creates many sensor data records in one transaction. Preferred by gateways and replays.
+    Readings with the sensor, metric and timestamp of a stored (or an earlier in the request) reading are
+    dropped, so retried batches can be resent safely.
+    Throttled by the ingest admission control, see create_sensor_data. Batches with readings older than
+    INGEST_REALTIME_MAX_AGE_S are backlog and are rejected first when the ingest queue fills up.
+
+    Args:
+        request (schemas.BulkIngestRequest): The sensor readings, validated by the SensorDataIn schema.
+        priority (Optional[str]): "realtime" or "backlog" lane. Header: "X-Ingest-Priority". Decided by the reading age if not set.
+        dal (SensorDataDAL): The data access layer dependency.
+        admission (AdmissionController): The ingest admission control dependency.
+
+    Returns:
+        schemas.BulkIngestResponse: Number of received, written and dropped duplicate records.
+    """
+    rows = [
+        models.SensorData(
+            sensor_id=data.sensor_id,
+            metric=data.metric,
+            value=data.value,
+            timestamp=data.timestamp,
+        )
+        for data in request.readings
+    ]
+    with admission.admit(
+        [data.sensor_id for data in request.readings], [data.timestamp for data in request.readings], priority
+    ):
+        result = dal.create_sensor_data_bulk(rows)
+    return schemas.BulkIngestResponse(
+        received=result.received,
+        inserted=result.inserted,
+        duplicates=result.batch_duplicates + result.filtered + result.stored_duplicates,
+        batch_duplicates=result.batch_duplicates,
+        filtered=result.filtered,
+        stored_duplicates=result.stored_duplicates,
+        out_of_range=result.out_of_range,
+    )
+
+
+@router.get("/sensors/stats", response_model=List[schemas.SensorStatsOut], dependencies=[Depends(validate_cache)])
+def get_sensor_stats(
+    sensor_ids: Optional[List[str]] = Query(default=None, alias="sensor_id"),
+    metrics: Optional[List[schemas.MetricEnum]] = Query(default=None, alias="metric"),
+    date_from: Optional[str] = Query(default=None),
+    date_to: Optional[str] = Query(default=None),
+    dal: SensorDataDAL = Depends(get_sensor_data_dal),
+):
+    """
+    Returns count, mean, variance, standard deviation, min and max per sensor metric.
+    Served from statistics maintained at ingest, so the cost does not depend on the amount of history.
+
+    Args:
+        sensor_ids (Optional[List[str]]): List of sensor IDs to filter the data. Query parameter alias: "sensor_id".
+        metrics (Optional[List[schemas.MetricEnum]]): List of metric types to filter the data. Query parameter alias: "metric".
+        date_from (Optional[str]): Start date (inclusive) in ISO format. Applied with (UTC) day granularity.
+        date_to (Optional[str]): End date (inclusive) in ISO format. Applied with (UTC) day granularity.
+        dal (SensorDataDAL): The data access layer dependency.
+
+    Returns:
+        List[schemas.SensorStatsOut]: Statistics per sensor metric. All time statistics when no date range is given.
+    """
+    metric_strings = [metric.value for metric in metrics] if metrics else None
+    try:
+        results = dal.get_sensor_stats(sensor_ids, metric_strings, date_from, date_to)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail="Invalid date format, ISO 8601 expected") from e
+
+    return [schemas.SensorStatsOut.from_stats(sensor_id, metric, stats) for sensor_id, metric, stats in results]
+
+
+@router.get("/sensors/stale", response_model=List[schemas.SensorLivenessOut])
+def get_stale_sensors(
+    sensor_ids: Optional[List[str]] = Query(default=None, alias="sensor_id"),
+    metrics: Optional[List[schemas.MetricEnum]] = Query(default=None, alias="metric"),
+    dal: SensorDataDAL = Depends(get_sensor_data_dal),
+):
+    """
+    Returns the sensor metrics that stopped reporting: not seen for longer than the gap threshold of their
+    expected interval. Served from the liveness index maintained at ingest, one row per sensor metric.
+
+    Args:
+        sensor_ids (Optional[List[str]]): List of sensor IDs to filter the data. Query parameter alias: "sensor_id".
+        metrics (Optional[List[schemas.MetricEnum]]): List of metric types to filter the data. Query parameter alias: "metric".
+        dal (SensorDataDAL): The data access layer dependency.
+
+    Returns:
+        List[schemas.SensorLivenessOut]: The stale sensor metrics, longest silent first.
+    """
+    metric_strings = [metric.value for metric in metrics] if metrics else None
+    now = to_naive_utc(datetime.now(timezone.utc))
+    return [
+        schemas.SensorLivenessOut(
+            sensor_id=row.sensor_id,
+            metric=row.metric,
+            first_seen=row.first_seen,
+            last_seen=row.last_seen,
+            readings=row.readings,
+            expected_interval_s=row.interval_s,
+            stale_after=row.stale_after,
+            silent_s=(now - row.last_seen).total_seconds(),
+        )
+        for row in dal.get_stale_sensors(sensor_ids, metric_strings, now)
+    ]
+
+
+@router.get("/sensors/gaps", response_model=List[schemas.SensorGapOut])
+def get_sensor_gaps(
+    sensor_ids: Optional[List[str]] = Query(default=None, alias="sensor_id"),
+    metrics: Optional[List[schemas.MetricEnum]] = Query(default=None, alias="metric"),
+    date_from: Optional[str] = Query(default=None),
+    date_to: Optional[str] = Query(default=None),
+    min_duration_s: float = Query(default=0.0, ge=0),
+    dal: SensorDataDAL = Depends(get_sensor_data_dal),
+):
+    """
+    Returns the data gaps of sensor metrics overlapping a date range: spans between consecutive readings longer
+    than the gap threshold of the expected interval, and the ongoing gaps of stale sensor metrics.
+    Served from the gap index maintained at ingest, so the cost does not depend on the number of readings.
+
+    Args:
+        sensor_ids (Optional[List[str]]): List of sensor IDs to filter the data. Query parameter alias: "sensor_id".
+        metrics (Optional[List[schemas.MetricEnum]]): List of metric types to filter the data. Query parameter alias: "metric".
+        date_from (Optional[str]): Start date in ISO format.
+        date_to (Optional[str]): End date in ISO format.
+        min_duration_s (float): Shortest gap returned, in seconds.
+        dal (SensorDataDAL): The data access layer dependency.
+
+    Returns:
+        List[schemas.SensorGapOut]: The gaps sorted by sensor, metric and start.
+    """
+    metric_strings = [metric.value for metric in metrics] if metrics else None
+    now = to_naive_utc(datetime.now(timezone.utc))
+    try:
+        gaps = dal.get_data_gaps(sensor_ids, metric_strings, date_from, date_to, min_duration_s, now)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail="Invalid date format, ISO 8601 expected") from e
+
+    return [
+        schemas.SensorGapOut(
+            sensor_id=gap.sensor_id,
+            metric=gap.metric,
+            start=gap.start,
+            end=gap.end,
+            duration_s=((gap.end or now) - gap.start).total_seconds(),
+            expected_interval_s=gap.expected_interval_s,
+        )
+        for gap in gaps
+    ]
+
+
+@router.get("/sensors/percentiles", response_model=List[schemas.SensorPercentilesOut], dependencies=[Depends(validate_cache)])
+def get_sensor_percentiles(
+    sensor_ids: Optional[List[str]] = Query(default=None, alias="sensor_id"),
+    metrics: Optional[List[schemas.MetricEnum]] = Query(default=None, alias="metric"),
+    date_from: Optional[str] = Query(default=None),
+    date_to: Optional[str] = Query(default=None),
+    quantiles: List[float] = Query(default=[0.5, 0.95, 0.99], alias="q"),
+    bins: int = Query(default=20, ge=1, le=1000),
+    dal: SensorDataDAL = Depends(get_sensor_data_dal),
+):
+    """
+    Returns approximate percentiles and a value histogram per sensor metric, merged from hourly DDSketches.
+
+    Error bounds: every percentile estimate x' of the true percentile x satisfies |x' - x| <= alpha * |x|
+    (alpha = relative_accuracy in the response, 1% by default). Min and max are exact.
+    The date range is applied with (UTC) hour granularity, hours overlapping the range are included whole.
+
+    Args:
+        sensor_ids (Optional[List[str]]): List of sensor IDs to filter the data. Query parameter alias: "sensor_id".
+        metrics (Optional[List[schemas.MetricEnum]]): List of metric types to filter the data. Query parameter alias: "metric".
+        date_from (Optional[str]): Start date (inclusive) in ISO format.
+        date_to (Optional[str]): End date (inclusive) in ISO format.
+        quantiles (List[float]): Quantiles between 0 and 1 to estimate. Query parameter alias: "q".
+        bins (int): Number of equal width histogram bins.
+        dal (SensorDataDAL): The data access layer dependency.
+
+    Returns:
+        List[schemas.SensorPercentilesOut]: Percentiles and histogram per sensor metric.
+    """
+    if any(not 0 <= q <= 1 for q in quantiles):
+        raise HTTPException(status_code=400, detail="Quantiles must be between 0 and 1")
+
+    metric_strings = [metric.value for metric in metrics] if metrics else None
+    try:
+        results = dal.get_sensor_sketches(sensor_ids, metric_strings, date_from, date_to)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail="Invalid date format, ISO 8601 expected") from e
+
+    return [
+        schemas.SensorPercentilesOut(
+            sensor_id=sensor_id,
+            metric=metric,
+            count=sketch.count,
+            min=sketch.min,
+            max=sketch.max,
+            relative_accuracy=sketch.relative_accuracy,
+            percentiles={f"p{q * 100:g}": sketch.quantile(q) for q in quantiles},
+            histogram=[
+                schemas.HistogramBin(lower=lower, upper=upper, count=count)
+                for lower, upper, count in sketch.histogram(bins)
+            ],
+        )
+        for sensor_id, metric, sketch in results
+    ]
+
+
+@router.get("/sensors/anomalies", response_model=schemas.AnomalyScanResponse, dependencies=[Depends(validate_cache)])
+def scan_sensor_anomalies(
+    sensor_ids: Optional[List[str]] = Query(default=None, alias="sensor_id"),
+    metrics: Optional[List[schemas.MetricEnum]] = Query(default=None, alias="metric"),
+    date_from: Optional[str] = Query(default=None),
+    date_to: Optional[str] = Query(default=None),
+    window: int = Query(default=60, ge=2, le=10000),
+    z_threshold: float = Query(default=3.0, gt=0),
+    ewma_alpha: float = Query(default=0.1, gt=0, le=1),
+    ewma_threshold: float = Query(default=3.0, gt=0),
+    max_rate: Optional[float] = Query(default=None, gt=0),
+    limit: int = Query(default=1000, ge=1, le=10000),
+    dal: SensorDataDAL = Depends(get_sensor_data_dal),
+    executor=Depends(get_anomaly_executor),
+):
+    """
+    Scans sensor readings for anomalies and returns only the flagged readings.
+
+    The readings are streamed from the database in chunks and evaluated in worker processes with vectorized
+    rolling z-score, EWMA deviation and (optional) rate of change checks. Memory use is bounded by the chunk size.
+
+    Args:
+        sensor_ids (Optional[List[str]]): List of sensor IDs to filter the data. Query parameter alias: "sensor_id".
+        metrics (Optional[List[schemas.MetricEnum]]): List of metric types to filter the data. Query parameter alias: "metric".
+        date_from (Optional[str]): Start date (inclusive) in ISO format.
+        date_to (Optional[str]): End date (inclusive) in ISO format.
+        window (int): Number of previous readings of the rolling z-score, also the warm-up of the EWMA check.
+        z_threshold (float): Rolling z-score limit.
+        ewma_alpha (float): EWMA smoothing factor.
+        ewma_threshold (float): EWMA deviation limit in EW standard deviations.
+        max_rate (Optional[float]): Rate of change limit in units per second. Disabled when not set.
+        limit (int): Maximum number of anomalies returned.
+        dal (SensorDataDAL): The data access layer dependency.
+        executor: The anomaly scan process pool dependency.
+
+    Returns:
+        schemas.AnomalyScanResponse: Number of scanned readings and the flagged readings.
+    """
+    metric_strings = [metric.value for metric in metrics] if metrics else None
+    params = AnomalyParams(window, z_threshold, ewma_alpha, ewma_threshold, max_rate)
+    chunks = dal.iter_sensor_values(
+        sensor_ids, metric_strings, date_from, date_to, chunk_size=get_settings().anomaly_chunk_size
+    )
+    try:
+        scanned, anomalies, truncated = scan_anomalies(chunks, params, executor, max_results=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail="Invalid date format, ISO 8601 expected") from e
+
+    return schemas.AnomalyScanResponse(
+        scanned=scanned,
+        truncated=truncated,
+        anomalies=[schemas.AnomalyOut(**vars(anomaly)) for anomaly in anomalies],
+    )
+
+
+@router.get("/sensors/matrix", response_model=schemas.AlignedMatrixOut, dependencies=[Depends(validate_cache)])
+def get_aligned_matrix(
+    date_from: str,
+    date_to: str,
+    sensor_ids: Optional[List[str]] = Query(default=None, alias="sensor_id"),
+    metrics: Optional[List[schemas.MetricEnum]] = Query(default=None, alias="metric"),
+    interval_seconds: float = Query(default=60, gt=0),
+    fill: FillMethod = Query(default=FillMethod.NULL),
+    dal: SensorDataDAL = Depends(get_sensor_data_dal),
+):
+    """
+    Returns the sensor metric series of a range aligned on a common time grid, as a dense columnar matrix.
+    Every bucket holds the mean of its readings. Empty buckets are null, or filled with the previous value
+    ("previous") or by linear interpolation ("linear"); nothing is extrapolated beyond the first and last reading.
+
+    Args:
+        date_from (str): Start date in ISO format, rounded down to the bucket start.
+        date_to (str): End date (exclusive) in ISO format.
+        sensor_ids (Optional[List[str]]): List of sensor IDs to filter the data. Query parameter alias: "sensor_id".
+        metrics (Optional[List[schemas.MetricEnum]]): List of metric types to filter the data. Query parameter alias: "metric".
+        interval_seconds (float): Bucket size in seconds.
+        fill (FillMethod): Fill method of the empty buckets.
+        dal (SensorDataDAL): The data access layer dependency.
+
+    Returns:
+        schemas.AlignedMatrixOut: Start, interval and length of the time axis, and one values column per series.
+    """
+    metric_strings = [metric.value for metric in metrics] if metrics else None
+    interval = timedelta(seconds=interval_seconds)
+    try:
+        grid = grid_start(to_naive_utc(parse_iso_datetime(date_from)), interval)
+        length = max(0, -((grid - to_naive_utc(parse_iso_datetime(date_to))) // interval))  # ceil
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail="Invalid date format, ISO 8601 expected") from e
+    if length > MATRIX_MAX_LENGTH:
+        raise HTTPException(status_code=400, detail=f"The time axis cannot exceed {MATRIX_MAX_LENGTH} buckets")
+    # Reject oversized matrices before reading any data, the series are counted from the day statistics.
+    if length * dal.count_series(sensor_ids, metric_strings, date_from, date_to) > MATRIX_MAX_CELLS:
+        raise HTTPException(status_code=400, detail=f"The matrix cannot exceed {MATRIX_MAX_CELLS} values")
+
+    start, length, series = dal.get_aligned_series(date_from, date_to, interval, fill, sensor_ids, metric_strings)
+    return schemas.AlignedMatrixOut(
+        start=start.replace(tzinfo=timezone.utc),
+        interval_seconds=interval_seconds,
+        length=length,
+        fill=fill.value,
+        series=[
+            schemas.AlignedSeriesOut(
+                sensor_id=sensor_id,
+                metric=metric,
+                values=[None if math.isnan(v) else v for v in values.tolist()],
+            )
+            for sensor_id, metric, values in series
+        ],
+    )
 
 
 @router.get("/sensors/list", response_model=List[schemas.SensorDataOut])
 def list_sensor_data(
+    request: Request,
     sensor_ids: Optional[List[str]] = Query(default=None, alias="sensor_id"),
     metrics: Optional[List[schemas.MetricEnum]] = Query(default=None, alias="metric"),
     date_from: Optional[str] = Query(default=None),
     date_to: Optional[str] = Query(default=None),
     dal: SensorDataDAL = Depends(get_sensor_data_dal),
+    cache: Optional[ResultCache] = Depends(get_result_cache),
 ):
     """
     Retrieve sensor data filtered by sensor IDs, metrics, and date range.
+    Serialized results are cached until readings are ingested into the queried series and range,
+    so repeated dashboard queries are answered without the database.
 
     Args:
+        request (Request): The HTTP request, its If-None-Match header is validated against the ETag.
         sensor_ids (Optional[List[str]]): List of sensor IDs to filter the data. Query parameter alias: "sensor_id".
         metrics (Optional[List[schemas.MetricEnum]]): List of metric types to filter the data. Query parameter alias: "metric".
         date_from (Optional[str]): Start date (inclusive) for filtering data in ISO format.
         date_to (Optional[str]): End date (inclusive) for filtering data in ISO format.
         dal (SensorDataDAL): The data access layer dependency.
+        cache (Optional[ResultCache]): The query result cache dependency, None when disabled.
 
     Returns:
-        List: A list of sensor data records matching the provided filters.
+        Response: JSON list of sensor data records matching the provided filters.
     """
     # Convert metrics enum to string values if provided
     metric_strings = [metric.value for metric in metrics] if metrics else None
 
-    rows = dal.list_sensor_data(sensor_ids, metric_strings, date_from, date_to)
-    return schemas.SensorDataOut.from_models(rows)
+    try:
+        key = QueryKey.from_filters(sensor_ids, metric_strings, date_from, date_to) if cache is not None else None
+    except ValueError:
+        key = None  # Invalid dates, the query reports the error.
+    cached = cache.get(key) if key is not None else None
+    if cached is not None:
+        headers = cached.headers
+        if "ETag" not in headers and "if-none-match" in request.headers:
+            headers = cache_headers(request, dal) or headers  # Filled by an unconditional request.
+        check_not_modified(request, headers)
+        return Response(cached.body, media_type="application/json", headers=headers)
+
+    # The fill starts before the watermark lookup, so readings committed after it keep the result out of the cache.
+    token = cache.begin_fill(key) if key is not None else None
+    try:
+        headers = cache_headers(request, dal) or {}
+        if headers:
+            check_not_modified(request, headers)
+        rows = dal.list_sensor_data(sensor_ids, metric_strings, date_from, date_to)
+        body = schemas.SensorDataOutList.dump_json(schemas.SensorDataOut.from_models(rows))
+        if token is not None:
+            cache.put(token, body, headers)
+    finally:
+        if token is not None:
+            cache.abandon(token)  # No-op after put().
+    return Response(body, media_type="application/json", headers=headers)
+
+
+def _subscribe(hub: LiveHub, sensor_ids: Optional[List[str]], metrics: Optional[List[schemas.MetricEnum]]) -> Subscriber:
+    return hub.subscribe(sensor_ids, [metric.value for metric in metrics] if metrics else None)
+
+
+@router.get("/sensors/live")
+async def live_sensor_data(
+    request: Request,
+    sensor_ids: Optional[List[str]] = Query(default=None, alias="sensor_id"),
+    metrics: Optional[List[schemas.MetricEnum]] = Query(default=None, alias="metric"),
+    hub: LiveHub = Depends(get_live_hub),
+):
+    """
+    Server-Sent Events stream of newly ingested readings of the given sensors and/or metrics (all without filters).
+    Every event holds a JSON array of readings. A client that does not keep up gets a "slow_consumer" event
+    and the stream ends.
+
+    Args:
+        request (Request): The HTTP request, used to detect disconnected clients.
+        sensor_ids (Optional[List[str]]): Sensor IDs to subscribe to. Query parameter alias: "sensor_id".
+        metrics (Optional[List[schemas.MetricEnum]]): Metrics to subscribe to. Query parameter alias: "metric".
+        hub (LiveHub): The live pub/sub hub dependency.
+
+    Raises:
+        HTTPException: 503 when the subscriber limit is reached.
+
+    Returns:
+        StreamingResponse: The text/event-stream response.
+    """
+    try:
+        subscriber = _subscribe(hub, sensor_ids, metrics)
+    except HubFull as e:
+        raise HTTPException(status_code=503, detail="Too many live subscribers", headers={"Retry-After": "30"}) from e
+    heartbeat = get_settings().live_heartbeat_s
+
+    async def events():
+        try:
+            yield ": subscribed\n\n"
+            while True:
+                message = await subscriber.get(timeout=heartbeat)
+                if message is not None:
+                    yield f"data: {message}\n\n"
+                elif subscriber.closed is not None:
+                    yield f"event: {subscriber.closed}\ndata: {{}}\n\n"
+                    return
+                elif await request.is_disconnected():
+                    return
+                else:
+                    yield ": keep-alive\n\n"
+        finally:
+            hub.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.websocket("/sensors/live/ws")
+async def live_sensor_data_ws(
+    websocket: WebSocket,
+    sensor_ids: Optional[List[str]] = Query(default=None, alias="sensor_id"),
+    metrics: Optional[List[schemas.MetricEnum]] = Query(default=None, alias="metric"),
+    hub: LiveHub = Depends(get_live_hub),
+):
+    """
+    WebSocket stream of newly ingested readings, same subscriptions and messages as /sensors/live.
+    Closed with 1013 (try again later) when the subscriber limit is reached, with 1008 for slow consumers.
+
+    Args:
+        websocket (WebSocket): The WebSocket connection.
+        sensor_ids (Optional[List[str]]): Sensor IDs to subscribe to. Query parameter alias: "sensor_id".
+        metrics (Optional[List[schemas.MetricEnum]]): Metrics to subscribe to. Query parameter alias: "metric".
+        hub (LiveHub): The live pub/sub hub dependency.
+    """
+    try:
+        subscriber = _subscribe(hub, sensor_ids, metrics)
+    except HubFull:
+        await websocket.close(code=1013, reason="Too many live subscribers")
+        return
+    await websocket.accept()
+
+    async def watch_disconnect():
+        try:
+            while (await websocket.receive())["type"] != "websocket.disconnect":
+                pass
+        finally:
+            hub.unsubscribe(subscriber)
+
+    watcher = asyncio.create_task(watch_disconnect())
+    try:
+        while (message := await subscriber.get()) is not None:
+            await websocket.send_text(message)
+        if subscriber.closed == SLOW_CONSUMER:
+            await websocket.close(code=1008, reason=SLOW_CONSUMER)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        watcher.cancel()
+        hub.unsubscribe(subscriber)
+
+
+@router.get("/sensors/export")
+def export_sensor_data(
+    sensor_ids: Optional[List[str]] = Query(default=None, alias="sensor_id"),
+    metrics: Optional[List[schemas.MetricEnum]] = Query(default=None, alias="metric"),
+    date_from: Optional[str] = Query(default=None),
+    date_to: Optional[str] = Query(default=None),
+    export_format: schemas.ExportFormat = Query(default=schemas.ExportFormat.CSV, alias="format"),
+    accept_encoding: Optional[str] = Header(default=None),
+    dal: SensorDataDAL = Depends(get_sensor_data_dal),
+):
+    """
+    Streams all sensor data matching the filters of /sensors/list (without the 1000 rows limit) as a file,
+    ordered by time. Memory use is constant, independent of the export size.
+
+    CSV is produced by PostgreSQL COPY TO STDOUT and compressed with zstd or gzip when the client accepts it
+    (Accept-Encoding). Parquet is written row group by row group and compressed internally (zstd).
+
+    Args:
+        sensor_ids (Optional[List[str]]): List of sensor IDs to filter the data. Query parameter alias: "sensor_id".
+        metrics (Optional[List[schemas.MetricEnum]]): List of metric types to filter the data. Query parameter alias: "metric".
+        date_from (Optional[str]): Start date (inclusive) for filtering data in ISO format.
+        date_to (Optional[str]): End date (inclusive) for filtering data in ISO format.
+        export_format (schemas.ExportFormat): "csv" or "parquet". Query parameter alias: "format".
+        accept_encoding (Optional[str]): The Accept-Encoding request header.
+        dal (SensorDataDAL): The data access layer dependency.
+
+    Returns:
+        StreamingResponse: The exported file.
+    """
+    metric_strings = [metric.value for metric in metrics] if metrics else None
+    headers = {"Content-Disposition": f'attachment; filename="sensor_data.{export_format.value}"'}
+    try:
+        if export_format == schemas.ExportFormat.PARQUET:
+            if not parquet_available():
+                raise HTTPException(status_code=501, detail="Parquet export is not available, pyarrow is not installed")
+            body = rows_to_parquet(dal.export_rows(sensor_ids, metric_strings, date_from, date_to))
+            return StreamingResponse(body, media_type="application/vnd.apache.parquet", headers=headers)
+        body = dal.export_csv(sensor_ids, metric_strings, date_from, date_to)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail="Invalid date format, ISO 8601 expected") from e
+
+    encoding = negotiate_encoding(accept_encoding)
+    headers["Vary"] = "Accept-Encoding"
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return StreamingResponse(compress(body, encoding), media_type="text/csv", headers=headers)
 
 
 @router.post("/sensors/batch_get", response_model=List[schemas.SensorDataOut])
@@ -66,26 +613,26 @@ def batch_get_sensor_data(
     request: schemas.BatchGetRequest, dal: SensorDataDAL = Depends(get_sensor_data_dal)
 ):
     """
-    Retrieve sensor data for a batch of sensor IDs (strings).
+    Retrieve sensor data for a batch of record IDs (UUID strings).
+    The result is streamed as a JSON array in chunks, so large lookups (up to 100k IDs) run with bounded memory.
 
     Args:
-        request (schemas.BatchGetRequest): The request object containing a list of sensor IDs.
+        request (schemas.BatchGetRequest): The request object containing a list of record IDs.
         dal (SensorDataDAL): The data access layer dependency.
 
     Raises:
         HTTPException: If the sensor_ids list in the request is empty or contains invalid values.
 
     Returns:
-        List[schemas.SensorDataOut]: A list of sensor data objects corresponding to the provided sensor IDs.
+        StreamingResponse: JSON array of sensor data objects corresponding to the provided IDs.
     """
     # Input validation
     if not request.sensor_ids:
         raise HTTPException(status_code=400, detail="sensor_ids list must not be empty")
 
-    # Pagination not implemented so smtg protection needed.
-    if len(request.sensor_ids) > 1000:  # Reasonable limit to prevent server overload
+    if len(request.sensor_ids) > schemas.BATCH_GET_MAX_IDS:  # Reasonable limit to prevent server overload
         raise HTTPException(
-            status_code=400, detail="sensor_ids list cannot exceed 1000 items"
+            status_code=400, detail=f"sensor_ids list cannot exceed {schemas.BATCH_GET_MAX_IDS} items"
         )
 
     # Validate each sensor_id
@@ -95,8 +642,21 @@ def batch_get_sensor_data(
                 status_code=400, detail="All sensor_ids must be non-empty strings"
             )
 
-    rows = dal.get_sensor_rows_by_ids(request.sensor_ids)
-    return schemas.SensorDataOut.from_models(rows)
+    # IDs are parsed here, errors after the first chunk could not change the status code anymore.
+    try:
+        chunks = dal.iter_sensor_rows_by_ids(request.sensor_ids)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail="All sensor_ids must be valid UUIDs") from e
+
+    def stream_json_array():
+        separator = "["
+        for chunk in chunks:
+            if chunk:
+                yield separator + ",".join(schemas.SensorDataOut.from_model(row).model_dump_json() for row in chunk)
+                separator = ","
+        yield "[]" if separator == "[" else "]"
+
+    return StreamingResponse(stream_json_array(), media_type="application/json")
 
 
 @router.get("/sensors/ask", response_model=schemas.AskResponse)
@@ -104,17 +664,21 @@ def ask_sensor_data(
     q: str,
     dal: SensorDataDAL = Depends(get_sensor_data_dal),
     llm_agent=Depends(get_llm_agent),
+    templates: Optional[SqlTemplateCache] = Depends(get_sql_template_cache),
 ):
     """
     Handles natural language queries about sensor data using an LangChain.
 
     This endpoint receives a user question, generates a prompt for the LLM,
     processes the LLM's response, and returns structured sensor data or aggregation results.
+    Questions of the same form as an earlier answered one re-execute its SQL on the current data,
+    without the agent.
 
     Args:
         q (str): The user's natural language question about sensor data.
         dal (SensorDataDAL): The data access layer dependency.
         llm_agent: The LLM SQL agent dependency.
+        templates (Optional[SqlTemplateCache]): The SQL template cache dependency, None when disabled.
 
     Returns:
         schemas.AskResponse: Structured response containing highlights, sensor list, or aggregation results.
@@ -123,53 +687,71 @@ def ask_sensor_data(
         HTTPException: For LLM invocation errors, response parsing errors, or schema conversion errors.
     """
     # Input validation, since no input model is used here.
-    if not q or not q.strip():
-        raise HTTPException(
-            status_code=400,
-            detail="Query parameter 'q' is required and cannot be empty",
-        )
+    validate_question(q)
+    return answer_question(q, dal, llm_agent, templates)
 
-    if len(q.strip()) > 1000:  # Reasonable limit for query length
-        raise HTTPException(
-            status_code=400, detail="Query length cannot exceed 1000 characters"
-        )
 
-    try:
-        prompt_with_format = get_prompt().substitute(userquestion=q)
-        answer = llm_agent.invoke({"input": prompt_with_format})["output"]
-    except BaseException as e:
-        print(f"Error invoking LLM: {e}")
-        raise HTTPException(status_code=500, detail="LLM invocation error") from e
+@router.post("/sensors/ask/batch")
+def ask_sensor_data_batch(
+    batch: schemas.AskBatchRequest,
+    dal_factory: Callable[[], ContextManager[SensorDataDAL]] = Depends(get_sensor_data_dal_factory),
+    llm_agent=Depends(get_llm_agent),
+    templates: Optional[SqlTemplateCache] = Depends(get_sql_template_cache),
+    executor: Executor = Depends(get_ask_batch_executor),
+):
+    """
+    Answers many natural language questions concurrently, e.g. the questions of a nightly report.
 
-    try:
-        parsed = parse_response(answer)
-    except BaseException as e:
-        print(f"Error parsing LLM structured response: {e}")
-        raise HTTPException(
-            status_code=500, detail="Invalid JSON response from LLM"
-        ) from e
+    Up to ASK_BATCH_PARALLELISM questions run at a time, over all batches, the LLM requests of all agents are limited to
+    LLM_REQUESTS_PER_SECOND. Questions that differ in whitespace only resolve to the same prompt and share one run.
+    The answers are streamed as NDJSON in completion order, one schemas.AskBatchItem per question with its
+    position in the request; a failed question does not fail the batch.
 
-    try:
-        response = schemas.AskResponse(
-            llm_highlights=parsed.answer, followup_question=parsed.followup_question
-        )
-        if (
-            parsed.id_list
-        ):  # LLM returned a list of row IDs, so the reponsone more likely a select result w/o aggregation.
-            rows = dal.get_sensor_rows_by_ids(parsed.id_list)
-            # Convert DB result to Pydantic models using from_models method.
-            response.sensors = schemas.SensorDataOut.from_models(rows)
-        elif (
-            parsed.aggregation
-        ):  # LLM returned an aggregation result, so user intention more likely an aggregation query.
-            response.aggregation = parsed.aggregation
-        else:
-            raise HTTPException(
-                status_code=404,
-                detail="Unable to determine query result from LLM response",
-            )
-        return response
-    except BaseException as e:
-        raise HTTPException(
-            status_code=500, detail="LLM to API schema conversion error"
-        ) from e
+    Args:
+        batch (schemas.AskBatchRequest): The questions.
+        dal_factory (Callable[[], ContextManager[SensorDataDAL]]): Factory of DAL instances with their own sessions,
+            one per concurrently answered question.
+        llm_agent: The LLM SQL agent dependency.
+        templates (Optional[SqlTemplateCache]): The SQL template cache dependency, None when disabled.
+        executor (Executor): The shared thread pool of the batch questions.
+
+    Returns:
+        StreamingResponse: application/x-ndjson stream of schemas.AskBatchItem lines.
+    """
+    by_prompt: Dict[str, List[int]] = {}
+    for index, item in enumerate(batch.questions):
+        validate_question(item.question)
+        by_prompt.setdefault(" ".join(item.question.split()), []).append(index)
+
+    def answer(question: str) -> schemas.AskResponse:
+        with dal_factory() as dal:
+            return answer_question(question, dal, llm_agent, templates)
+
+    async def results():
+        loop = asyncio.get_running_loop()
+        futures = {loop.run_in_executor(executor, answer, question): indexes for question, indexes in by_prompt.items()}
+        try:
+            pending = set(futures)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    response, status, error = None, 200, None
+                    try:
+                        response = future.result()
+                    except HTTPException as e:
+                        status, error = e.status_code, str(e.detail)
+                    except Exception:  # pylint: disable=broad-except
+                        logger.exception("Error answering batch question")
+                        status, error = 500, "Batch question error"
+                    for index in futures[future]:
+                        item = schemas.AskBatchItem(
+                            index=index, question=batch.questions[index].question, status=status,
+                            response=response, error=error,
+                        )
+                        yield item.model_dump_json(exclude_none=True) + "\n"
+        finally:
+            # Client gone: questions not started yet are dropped, running ones finish in the background.
+            for future in futures:
+                future.cancel()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
@@ -0,0 +1,125 @@
+"""API endpoints of the asynchronous jobs: submission, polling and completion stream."""
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from app import schemas
+from app.ask import validate_question
+from app.dal import parse_iso_datetime
+from app.jobs import Job, JobManager, JobQueueFull, get_job_manager
+
+router = APIRouter()
+
+JOB_EVENTS_HEARTBEAT_S = 15.0
+JOB_MAX_WAIT_S = 60.0
+
+
+def _get_job(job_id: str, manager: JobManager) -> Job:
+    job = manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+
+@router.post("/jobs", response_model=schemas.JobOut, status_code=202)
+def submit_job(
+    job_request: schemas.JobRequest,
+    request: Request,
+    response: Response,
+    manager: JobManager = Depends(get_job_manager),
+):
+    """
+    Submits a list, aggregate or ask request for asynchronous execution and returns the job right away.
+    A request equal to a queued or running job joins that job ("X-Coalesced: true" header).
+
+    Args:
+        job_request (schemas.JobRequest): The job kind and its parameters.
+        request (Request): The HTTP request, used to build the job URL.
+        response (Response): The response, used to set the Location and coalescing headers.
+        manager (JobManager): The job manager dependency.
+
+    Raises:
+        HTTPException: 400 for invalid dates or questions, 429 when too many jobs are queued or running.
+
+    Returns:
+        schemas.JobOut: The queued (or joined) job. Poll its Location, or follow /jobs/{id}/events.
+    """
+    if job_request.kind == schemas.JobKind.ASK:
+        validate_question(job_request.question)
+    try:
+        for date in (job_request.date_from, job_request.date_to):
+            if date:
+                parse_iso_datetime(date)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail="Invalid date format, ISO 8601 expected") from e
+
+    try:
+        job, coalesced = manager.submit(job_request)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail="Too many pending jobs", headers={"Retry-After": "10"}) from e
+    response.headers["Location"] = str(request.url_for("get_job", job_id=job.id))
+    if coalesced:
+        response.headers["X-Coalesced"] = "true"
+    return job.to_out()
+
+
+@router.get("/jobs/{job_id}", response_model=schemas.JobOut)
+async def get_job(
+    job_id: str,
+    wait: float = Query(default=0.0, ge=0.0, le=JOB_MAX_WAIT_S),
+    manager: JobManager = Depends(get_job_manager),
+):
+    """
+    Returns the status of a job, and its result or error once finished.
+
+    Args:
+        job_id (str): The job ID returned on submission.
+        wait (float): Seconds to wait for the completion of an unfinished job before answering (long polling).
+        manager (JobManager): The job manager dependency.
+
+    Raises:
+        HTTPException: 404 for unknown and expired jobs.
+
+    Returns:
+        schemas.JobOut: The job.
+    """
+    job = _get_job(job_id, manager)
+    if wait and not job.finished:
+        await manager.wait(job, wait)
+    return job.to_out()
+
+
+@router.get("/jobs/{job_id}/events")
+async def job_events(
+    job_id: str,
+    request: Request,
+    manager: JobManager = Depends(get_job_manager),
+):
+    """
+    Server-Sent Events stream of a job: a "status" event with the current state, then a "done" event with
+    the finished job (result or error), after which the stream ends. Comments keep idle connections alive.
+
+    Args:
+        job_id (str): The job ID returned on submission.
+        request (Request): The HTTP request, used to detect disconnected clients.
+        manager (JobManager): The job manager dependency.
+
+    Raises:
+        HTTPException: 404 for unknown and expired jobs.
+
+    Returns:
+        StreamingResponse: The text/event-stream response.
+    """
+    job = _get_job(job_id, manager)
+
+    async def events():
+        if not job.finished:
+            yield f"event: status\ndata: {job.to_out().model_dump_json(exclude={'result'})}\n\n"
+            while not await manager.wait(job, JOB_EVENTS_HEARTBEAT_S):
+                if await request.is_disconnected():
+                    return
+                yield ": keep-alive\n\n"
+        yield f"event: done\ndata: {job.to_out().model_dump_json()}\n\n"
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,144 @@
+"""
+Natural language questions about the sensor data, answered by the LangChain SQL agent.
+Shared by the /sensors/ask endpoint and the asynchronous jobs.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Optional
+from fastapi import HTTPException
+from app import schemas
+from app.config import get_settings
+from app.dal import SensorDataDAL
+from app.llm_sql import capture_agent_queries, get_prompt, parse_response
+from app.sql_templates import SqlTemplateCache
+
+logger = logging.getLogger(__name__)
+
+MAX_QUESTION_LENGTH = 1000
+
+
+def validate_question(q: str) -> None:
+    """
+    Checks a user question before it is sent to the LLM.
+
+    Args:
+        q (str): The user's natural language question.
+
+    Raises:
+        HTTPException: 400 for empty or too long questions.
+    """
+    if not q or not q.strip():
+        raise HTTPException(
+            status_code=400,
+            detail="Query parameter 'q' is required and cannot be empty",
+        )
+
+    if len(q.strip()) > MAX_QUESTION_LENGTH:  # Reasonable limit for query length
+        raise HTTPException(
+            status_code=400, detail=f"Query length cannot exceed {MAX_QUESTION_LENGTH} characters"
+        )
+
+
+def answer_question(
+    q: str, dal: SensorDataDAL, llm_agent, templates: Optional[SqlTemplateCache] = None
+) -> schemas.AskResponse:
+    """
+    Generates a prompt for the LLM, runs the SQL agent and converts its structured answer
+    to sensor data or aggregation results. A question matching a reusable SQL template is answered
+    by replaying the template instead, the template of a successful agent run is captured.
+
+    Args:
+        q (str): The user's natural language question, validated by validate_question.
+        dal (SensorDataDAL): The data access layer, used to load the rows the agent selected.
+        llm_agent: The LLM SQL agent.
+        templates (Optional[SqlTemplateCache]): The SQL template cache, None when disabled.
+
+    Returns:
+        schemas.AskResponse: Structured response containing highlights, sensor list, or aggregation results.
+
+    Raises:
+        HTTPException: For LLM invocation errors, response parsing errors, or schema conversion errors.
+    """
+    if templates is not None:
+        replayed = templates.answer(q, dal)
+        if replayed is not None:
+            return replayed
+
+    started = time.perf_counter()
+    try:
+        prompt_with_format = get_prompt().substitute(userquestion=q)
+        with capture_agent_queries() as queries:
+            answer = llm_agent.invoke({"input": prompt_with_format})["output"]
+        agent_seconds = time.perf_counter() - started
+    except BaseException as e:
+        print(f"Error invoking LLM: {e}")
+        raise HTTPException(status_code=500, detail="LLM invocation error") from e
+
+    try:
+        parsed = parse_response(answer)
+    except BaseException as e:
+        print(f"Error parsing LLM structured response: {e}")
+        raise HTTPException(
+            status_code=500, detail="Invalid JSON response from LLM"
+        ) from e
+
+    try:
+        response = schemas.AskResponse(
+            llm_highlights=parsed.answer, followup_question=parsed.followup_question
+        )
+        if (
+            parsed.id_list
+        ):  # LLM returned a list of row IDs, so the reponsone more likely a select result w/o aggregation.
+            rows = dal.get_sensor_rows_by_ids(parsed.id_list)
+            # Convert DB result to Pydantic models using from_models method.
+            response.sensors = schemas.SensorDataOut.from_models(rows)
+        elif (
+            parsed.aggregation
+        ):  # LLM returned an aggregation result, so user intention more likely an aggregation query.
+            response.aggregation = parsed.aggregation
+        else:
+            raise HTTPException(
+                status_code=404,
+                detail="Unable to determine query result from LLM response",
+            )
+    except BaseException as e:
+        raise HTTPException(
+            status_code=500, detail="LLM to API schema conversion error"
+        ) from e
+
+    if templates is not None and queries:
+        try:
+            templates.capture(q, queries[-1], parsed, agent_seconds)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Capturing the SQL template of %r failed", q)
+    return response
+
+
+_batch_executor: Optional[ThreadPoolExecutor] = None
+_batch_executor_lock = threading.Lock()
+
+
+def get_ask_batch_executor() -> Executor:
+    """
+    The process wide thread pool of the /sensors/ask/batch questions for DI, ASK_BATCH_PARALLELISM workers
+    shared by all batches, so concurrent batches do not multiply the agent runs.
+    """
+    global _batch_executor  # pylint: disable=global-statement
+    with _batch_executor_lock:
+        if _batch_executor is None:
+            _batch_executor = ThreadPoolExecutor(
+                max_workers=max(1, get_settings().ask_batch_parallelism), thread_name_prefix="ask"
+            )
+        return _batch_executor
+
+
+def shutdown_ask_batch_executor() -> None:
+    """Stop the batch question workers on application shutdown, queued questions are dropped."""
+    global _batch_executor  # pylint: disable=global-statement
+    with _batch_executor_lock:
+        if _batch_executor is not None:
+            _batch_executor.shutdown(wait=False, cancel_futures=True)
+            _batch_executor = None
@@ -1,42 +1,725 @@
 """Data Access Layer (DAL) for sensor data operations"""
 
+import csv
+import io
 import uuid
-from typing import List, Optional
-from datetime import datetime
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, ContextManager, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+import numpy as np
+from sqlalchemy import any_, bindparam, func, select, text
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as PG_UUID
+from sqlalchemy.engine import Row
 from sqlalchemy.orm import Session
 from fastapi import Depends
 from app import models
-from app.database import get_db_session
+from app.database import ReadSessionLocal, SessionLocal, get_db_session, get_read_db_session, insert_ignore
+from app.alignment import FillMethod, bucket_means, bucket_sums, fill_gaps, grid_start, to_naive_utc
+from app.dedup import RecentKeyFilter, fingerprint, get_recent_key_filter
+from app.edge import DailyPartitions, ReadingOutOfRange, get_daily_partitions
+from app.export import copy_to_stdout, rows_to_csv
+from app.ingest_events import notify_ingested
+from app.liveness import update_liveness
+from app.metrics import INGEST_BATCH_SIZE, INGEST_DUPLICATES
+from app.sketches import DDSketch, hour_bucket, update_sketches
+from app.stats import RunningStats, day_bucket, update_running_stats
+
+
+def parse_iso_datetime(value: str) -> datetime:
+    """Parse an ISO 8601 date or datetime string, accepting the 'Z' UTC suffix."""
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def filter_sensor_data(q, sensor_ids=None, metrics=None, date_from=None, date_to=None):
+    """
+    Applies the sensor ID, metric and date range filters shared by the list, scan and export queries.
+
+    Args:
+        q: A Query or Select over models.SensorData.
+        sensor_ids (Optional[List[str]]): List of sensor IDs to filter by.
+        metrics (Optional[List[str]]): List of metric names to filter by.
+        date_from (Optional[str]): Start of the date range (ISO format string).
+        date_to (Optional[str]): End of the date range (ISO format string).
+
+    Returns:
+        The filtered Query or Select.
+    """
+    if sensor_ids:
+        q = q.filter(models.SensorData.sensor_id.in_(sensor_ids))
+    if metrics:
+        q = q.filter(models.SensorData.metric.in_(metrics))
+
+    # Convert string dates to datetime objects if provided
+    if date_from and date_to:
+        date_from_dt = parse_iso_datetime(date_from)
+        date_to_dt = parse_iso_datetime(date_to)
+        q = q.filter(models.SensorData.timestamp.between(date_from_dt, date_to_dt))
+    elif date_from:
+        date_from_dt = parse_iso_datetime(date_from)
+        q = q.filter(models.SensorData.timestamp >= date_from_dt)
+    elif date_to:
+        date_to_dt = parse_iso_datetime(date_to)
+        q = q.filter(models.SensorData.timestamp <= date_to_dt)
+    return q
+
+
+@dataclass
+class IngestResult:
+    """Outcome of a bulk ingest."""
+
+    received: int = 0
+    inserted: int = 0
+    batch_duplicates: int = 0  # Repeated natural keys within the batch.
+    filtered: int = 0  # Dropped by the recently written keys filter.
+    stored_duplicates: int = 0  # Already stored, skipped by ON CONFLICT DO NOTHING.
+    out_of_range: int = 0  # Outside the retention window of the edge partitions.
+
+
+class Reading(NamedTuple):
+    """A sensor reading of the streaming ingest, lighter than a models.SensorData object."""
+
+    id: uuid.UUID
+    timestamp: datetime
+    sensor_id: str
+    metric: models.MetricEnum
+    value: float
+
+
+class DataGap(NamedTuple):
+    """A span without readings of a sensor metric. Ongoing gaps (stale sensor metrics) have no end."""
+
+    sensor_id: str
+    metric: str
+    start: datetime  # Last reading before the gap (UTC).
+    end: Optional[datetime]  # First reading after the gap (UTC), None while the sensor metric is silent.
+    expected_interval_s: float
+
+
+def _copy_csv(rows: list) -> io.StringIO:
+    """CSV input of COPY ... FROM STDIN WITH (FORMAT csv) of the rows."""
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(
+        (row.id, row.timestamp.isoformat(), row.sensor_id, getattr(row.metric, "value", row.metric), repr(row.value))
+        for row in rows
+    )
+    buffer.seek(0)
+    return buffer
+
 
 class SensorDataDAL:
     """Data Access Layer for sensor data operations."""
 
-    def __init__(self, session: Session):
+    ARRAY_LOOKUP_MAX_IDS = 10000  # Above this many IDs the lookup joins against unnest(:ids) (PostgreSQL).
+    SQLITE_IN_CHUNK = 500  # IDs per IN list on databases without array parameters.
+    COPY_MIN_ROWS = 1000  # Inserts of at least this many rows are loaded with COPY (PostgreSQL).
+
+    def __init__(
+        self,
+        session: Session,
+        read_session: Optional[Session] = None,
+        recent_keys: Optional[RecentKeyFilter] = None,
+        partitions: Optional[DailyPartitions] = None,
+    ):
         """
         Initialize the DAL with a database session.
         
         Args:
-            session (Session): The SQLAlchemy session used for database operations.
+            session (Session): The SQLAlchemy session used for write operations, bound to the primary.
+            read_session (Optional[Session]): The session used for read queries, bound to the read replica.
+                Defaults to the write session.
+            recent_keys (Optional[RecentKeyFilter]): Filter of recently written readings, drops retried
+                readings before they reach the database. Duplicates are only detected by the database when None.
+            partitions (Optional[DailyPartitions]): Daily partition tables of the embedded edge mode, the readings
+                are written to them instead of the sensor_data view. None on PostgreSQL.
         """
         self.session = session
+        self.read_session = read_session or session
+        self.recent_keys = recent_keys
+        self.partitions = partitions
 
-    def create_sensor_data(self, data: models.SensorData):
+    def create_sensor_data(self, data: models.SensorData) -> models.SensorData:
         """
-        Creates a new SensorData record in the database.
+        Creates a new SensorData record in the database. Idempotent on the natural key
+        (sensor_id, metric, timestamp): a retried reading is not stored again. A reading found in the recently
+        written keys filter costs one natural key lookup instead of the write transaction; when the lookup
+        misses (a fingerprint collision) the reading is written like any other.
         
         Args:
             data (models.SensorData): The SensorData object to create.
             
         Returns:
-            models.SensorData: The newly created SensorData object. (MVP only, won't need in production)
+            models.SensorData: The newly created SensorData object, or the already stored record when the
+                reading is a duplicate. (MVP only, won't need in production)
+
+        Raises:
+            ReadingOutOfRange: Edge mode, the reading is outside the retention window of the partitions.
         """
-        self.session.add(data)
-        self.session.flush()  # Flush to get server-generated values before commit
+        data.id = data.id or uuid.uuid4()
+        data.timestamp = data.timestamp or datetime.now()
+        if self.partitions is not None and not self.partitions.accepts(data.timestamp):
+            raise ReadingOutOfRange(f"Readings of {data.timestamp.date()} are outside the edge retention window")
+        fp = fingerprint(data.sensor_id, data.metric, data.timestamp)
+        if self.recent_keys is not None and self.recent_keys.contains(fp):
+            stored = self._get_by_natural_key(data)
+            if stored is not None:
+                INGEST_DUPLICATES.labels("filter").inc()
+                return stored
+
+        if not self._insert_new([data]):
+            INGEST_DUPLICATES.labels("database").inc()
+            self._remember([fp])
+            return self._get_by_natural_key(data) or data
+        update_running_stats(self.session, [data])
+        update_sketches(self.session, [data])
+        update_liveness(self.session, [data])
         self.session.commit()
+        self._remember([fp])
+        notify_ingested([data])
+        INGEST_BATCH_SIZE.labels("single").observe(1)
         # Only for MVP. Should not return the object in production. See Command and query responsibility segregation (CQRS).
         return data
 
-    def get_sensor_rows_by_ids(self, row_ids: List[str]) -> List[models.SensorData]:
+    def create_sensor_data_bulk(self, rows: List[models.SensorData]) -> IngestResult:
+        """
+        Creates SensorData records with a single multi-row insert in one transaction.
+        Duplicates on the natural key (sensor_id, metric, timestamp) are dropped: within the batch,
+        by the recently written keys filter, and by the unique index (ON CONFLICT DO NOTHING).
+        Statistics and sketches are updated with the inserted rows only.
+        
+        Args:
+            rows (List[models.SensorData]): The SensorData objects to create.
+            
+        Returns:
+            IngestResult: Number of received, inserted and dropped duplicate records.
+        """
+        result = IngestResult(received=len(rows))
+        for row in rows:
+            row.id = row.id or uuid.uuid4()
+            row.timestamp = row.timestamp or datetime.now()
+        if rows:
+            self._write_batch(rows, result, "bulk")
+        return result
+
+    def write_readings(self, readings: List[Reading]) -> IngestResult:
+        """
+        Writes a batch of readings of the streaming ingest (line protocol listener). Same duplicate handling,
+        statistics and notifications as create_sensor_data_bulk(), without ORM objects; large batches
+        are loaded with COPY on PostgreSQL.
+
+        Args:
+            readings (List[Reading]): The readings to write, with IDs and timestamps set.
+
+        Returns:
+            IngestResult: Number of received, inserted and dropped duplicate records.
+        """
+        result = IngestResult(received=len(readings))
+        if readings:
+            self._write_batch(readings, result, "stream")
+        return result
+
+    def _write_batch(self, rows: list, result: IngestResult, source: str) -> None:
+        candidates, fps, seen = [], [], set()
+        for row in rows:
+            fp = fingerprint(row.sensor_id, row.metric, row.timestamp)
+            if fp in seen:
+                result.batch_duplicates += 1
+            elif self.recent_keys is not None and self.recent_keys.contains(fp):
+                result.filtered += 1
+            elif self.partitions is not None and not self.partitions.accepts(row.timestamp):
+                result.out_of_range += 1
+            else:
+                seen.add(fp)
+                candidates.append(row)
+                fps.append(fp)
+
+        inserted_ids = self._insert_new(candidates) if candidates else set()
+        inserted = [row for row in candidates if row.id in inserted_ids]
+        result.inserted = len(inserted)
+        result.stored_duplicates = len(candidates) - len(inserted)
+        update_running_stats(self.session, inserted)
+        update_sketches(self.session, inserted)
+        update_liveness(self.session, inserted)
+        self.session.commit()
+        # Remember the keys only once they are committed, including the ones that were stored before.
+        self._remember(fps)
+        notify_ingested(inserted)
+
+        INGEST_BATCH_SIZE.labels(source).observe(result.inserted)
+        INGEST_DUPLICATES.labels("batch").inc(result.batch_duplicates)
+        INGEST_DUPLICATES.labels("filter").inc(result.filtered)
+        INGEST_DUPLICATES.labels("database").inc(result.stored_duplicates)
+
+    def _insert_new(self, rows: list) -> Set[uuid.UUID]:
+        """
+        Insert the rows, skipping the ones whose natural key is already stored.
+
+        Returns:
+            Set[uuid.UUID]: IDs of the inserted rows.
+        """
+        if len(rows) >= self.COPY_MIN_ROWS and self.session.get_bind().dialect.name == "postgresql":
+            return self._copy_insert_new(rows)
+        values = [
+            {
+                "id": row.id,
+                "timestamp": row.timestamp,
+                "sensor_id": row.sensor_id,
+                "metric": row.metric,
+                "value": row.value,
+            }
+            for row in rows
+        ]
+        if self.partitions is not None:
+            return self.partitions.insert_new(self.session, values)
+        table = models.SensorData
+        return set(insert_ignore(self.session, table, values, ["sensor_id", "metric", "timestamp"], returning=table.id))
+
+    def _copy_insert_new(self, rows: list) -> Set[uuid.UUID]:
+        """
+        PostgreSQL: COPY the rows into a transaction scoped staging table, then move them into sensor_data
+        with one INSERT ... SELECT ... ON CONFLICT DO NOTHING.
+        """
+        cursor = self.session.connection().connection.dbapi_connection.cursor()
+        try:
+            cursor.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS sensor_data_staging "
+                "(LIKE sensor_data INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+            )
+            cursor.copy_expert(
+                "COPY sensor_data_staging (id, timestamp, sensor_id, metric, value) FROM STDIN WITH (FORMAT csv)",
+                _copy_csv(rows),
+            )
+        finally:
+            cursor.close()
+        result = self.session.execute(
+            text(
+                "INSERT INTO sensor_data (id, timestamp, sensor_id, metric, value) "
+                "SELECT id, timestamp, sensor_id, metric, value FROM sensor_data_staging "
+                "ON CONFLICT (sensor_id, metric, timestamp) DO NOTHING RETURNING id"
+            )
+        )
+        return {row_id if isinstance(row_id, uuid.UUID) else uuid.UUID(str(row_id)) for row_id in result.scalars()}
+
+    def _get_by_natural_key(self, data: models.SensorData) -> Optional[models.SensorData]:
+        """The stored record with the natural key of a reading."""
+        table = models.SensorData
+        return self.session.execute(
+            select(table).where(
+                table.sensor_id == data.sensor_id, table.metric == data.metric, table.timestamp == data.timestamp
+            )
+        ).scalar_one_or_none()
+
+    def _remember(self, fps: List[int]) -> None:
+        if self.recent_keys is not None:
+            self.recent_keys.add_many(fps)
+
+    def get_sensor_stats(
+        self,
+        sensor_ids: Optional[List[str]] = None,
+        metrics: Optional[List[str]] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+    ) -> List[Tuple[str, str, RunningStats]]:
+        """
+        Returns the running statistics of sensor metrics from the incrementally maintained stats tables.
+        Without a date range the all time statistics are read (one row per sensor metric), otherwise
+        the day buckets of the range are merged. The cost does not depend on the number of raw rows.
+        
+        Args:
+            sensor_ids (Optional[List[str]]): List of sensor IDs to filter by.
+            metrics (Optional[List[str]]): List of metric names to filter by.
+            date_from (Optional[str]): Start of the date range (ISO format string), applied with day granularity.
+            date_to (Optional[str]): End of the date range (ISO format string), applied with day granularity.
+            
+        Returns:
+            List[Tuple[str, str, RunningStats]]: (sensor_id, metric, statistics) sorted by sensor and metric.
+        """
+        model = models.SensorStats if date_from or date_to else models.SensorStatsTotal
+        q = self.read_session.query(model)
+        if sensor_ids:
+            q = q.filter(model.sensor_id.in_(sensor_ids))
+        if metrics:
+            q = q.filter(model.metric.in_(metrics))
+        if date_from:
+            q = q.filter(model.bucket >= day_bucket(parse_iso_datetime(date_from)))
+        if date_to:
+            q = q.filter(model.bucket <= day_bucket(parse_iso_datetime(date_to)))
+
+        merged: Dict[Tuple[str, str], RunningStats] = defaultdict(RunningStats)
+        for row in q:
+            merged[(row.sensor_id, getattr(row.metric, "value", row.metric))].merge(RunningStats.from_row(row))
+        return [(sensor_id, metric, stats) for (sensor_id, metric), stats in sorted(merged.items())]
+
+    def get_ingest_watermark(
+        self,
+        sensor_ids: Optional[List[str]] = None,
+        metrics: Optional[List[str]] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+    ) -> Tuple[int, int, float]:
+        """
+        Returns the ingest watermark of a range: number of sensor day buckets, number of readings and sum of
+        the values, from the per sensor, per day statistics. Readings are append-only, so the watermark
+        changes whenever a reading arrives in the range (applied with day granularity).
+
+        Args:
+            sensor_ids (Optional[List[str]]): List of sensor IDs to filter by.
+            metrics (Optional[List[str]]): List of metric names to filter by.
+            date_from (Optional[str]): Start of the date range (ISO format string).
+            date_to (Optional[str]): End of the date range (ISO format string).
+
+        Returns:
+            Tuple[int, int, float]: (day buckets, readings, value sum).
+        """
+        model = models.SensorStats
+        q = self.read_session.query(
+            func.count(), func.coalesce(func.sum(model.count), 0), func.coalesce(func.sum(model.mean * model.count), 0.0)
+        )
+        if sensor_ids:
+            q = q.filter(model.sensor_id.in_(sensor_ids))
+        if metrics:
+            q = q.filter(model.metric.in_(metrics))
+        if date_from:
+            q = q.filter(model.bucket >= day_bucket(parse_iso_datetime(date_from)))
+        if date_to:
+            q = q.filter(model.bucket <= day_bucket(parse_iso_datetime(date_to)))
+        buckets, count, total = q.one()
+        return int(buckets), int(count), round(float(total), 6)
+
+    def get_sensor_sketches(
+        self,
+        sensor_ids: Optional[List[str]] = None,
+        metrics: Optional[List[str]] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+    ) -> List[Tuple[str, str, DDSketch]]:
+        """
+        Returns the quantile sketch of each sensor metric over a range, merged from the hourly sketches.
+        
+        Args:
+            sensor_ids (Optional[List[str]]): List of sensor IDs to filter by.
+            metrics (Optional[List[str]]): List of metric names to filter by.
+            date_from (Optional[str]): Start of the date range (ISO format string), applied with hour granularity.
+            date_to (Optional[str]): End of the date range (ISO format string), applied with hour granularity.
+            
+        Returns:
+            List[Tuple[str, str, DDSketch]]: (sensor_id, metric, sketch) sorted by sensor and metric.
+        """
+        model = models.SensorSketch
+        q = self.read_session.query(model)
+        if sensor_ids:
+            q = q.filter(model.sensor_id.in_(sensor_ids))
+        if metrics:
+            q = q.filter(model.metric.in_(metrics))
+        if date_from:
+            q = q.filter(model.bucket_start >= hour_bucket(parse_iso_datetime(date_from)))
+        if date_to:
+            q = q.filter(model.bucket_start <= hour_bucket(parse_iso_datetime(date_to)))
+
+        merged: Dict[Tuple[str, str], DDSketch] = defaultdict(DDSketch)
+        for row in q:
+            merged[(row.sensor_id, getattr(row.metric, "value", row.metric))].merge(DDSketch.from_json(row.sketch))
+        return [(sensor_id, metric, sketch) for (sensor_id, metric), sketch in sorted(merged.items())]
+
+    def get_stale_sensors(
+        self,
+        sensor_ids: Optional[List[str]] = None,
+        metrics: Optional[List[str]] = None,
+        at: Optional[datetime] = None,
+    ) -> List[models.SensorLiveness]:
+        """
+        Returns the sensor metrics not seen for longer than their gap threshold, from the liveness index.
+        The cost grows with the number of sensor metrics, not with the number of readings.
+
+        Args:
+            sensor_ids (Optional[List[str]]): List of sensor IDs to filter by.
+            metrics (Optional[List[str]]): List of metric names to filter by.
+            at (Optional[datetime]): Point in time the staleness is evaluated at. Defaults to now (UTC).
+
+        Returns:
+            List[models.SensorLiveness]: The liveness of the stale sensor metrics, longest silent first.
+        """
+        model = models.SensorLiveness
+        q = self.read_session.query(model).filter(model.stale_after < to_naive_utc(at or datetime.now(timezone.utc)))
+        if sensor_ids:
+            q = q.filter(model.sensor_id.in_(sensor_ids))
+        if metrics:
+            q = q.filter(model.metric.in_(metrics))
+        return q.order_by(model.last_seen, model.sensor_id, model.metric).all()
+
+    def get_data_gaps(
+        self,
+        sensor_ids: Optional[List[str]] = None,
+        metrics: Optional[List[str]] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        min_duration_s: float = 0.0,
+        now: Optional[datetime] = None,
+    ) -> List[DataGap]:
+        """
+        Returns the data gaps overlapping a range from the gap index, including the ongoing gaps of stale sensor
+        metrics. The cost grows with the number of gaps and sensor metrics, not with the number of readings.
+
+        Args:
+            sensor_ids (Optional[List[str]]): List of sensor IDs to filter by.
+            metrics (Optional[List[str]]): List of metric names to filter by.
+            date_from (Optional[str]): Start of the date range (ISO format string).
+            date_to (Optional[str]): End of the date range (ISO format string).
+            min_duration_s (float): Shortest gap returned, in seconds. Ongoing gaps last until now.
+            now (Optional[datetime]): End of the ongoing gaps. Defaults to now (UTC).
+
+        Returns:
+            List[DataGap]: The gaps sorted by sensor, metric and start.
+        """
+        now = to_naive_utc(now or datetime.now(timezone.utc))
+        start = to_naive_utc(parse_iso_datetime(date_from)) if date_from else None
+        end = to_naive_utc(parse_iso_datetime(date_to)) if date_to else None
+
+        model = models.SensorGap
+        q = self.read_session.query(model)
+        if sensor_ids:
+            q = q.filter(model.sensor_id.in_(sensor_ids))
+        if metrics:
+            q = q.filter(model.metric.in_(metrics))
+        if start:
+            q = q.filter(model.gap_end > start)
+        if end:
+            q = q.filter(model.gap_start < end)
+        gaps = [
+            DataGap(row.sensor_id, getattr(row.metric, "value", row.metric), row.gap_start, row.gap_end,
+                    row.expected_interval_s)
+            for row in q
+        ]
+        # Silent sensor metrics: the gap after the last reading has not ended yet.
+        for row in self.get_stale_sensors(sensor_ids, metrics, now):
+            if end is None or row.last_seen < end:
+                gaps.append(DataGap(row.sensor_id, getattr(row.metric, "value", row.metric), row.last_seen, None,
+                                    row.interval_s))
+        return sorted(
+            (gap for gap in gaps if ((gap.end or now) - gap.start).total_seconds() >= min_duration_s),
+            key=lambda gap: (gap.sensor_id, gap.metric, gap.start),
+        )
+
+    def iter_sensor_values(
+        self,
+        sensor_ids: Optional[List[str]] = None,
+        metrics: Optional[List[str]] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        chunk_size: int = 10000,
+    ) -> Iterator[List[Tuple[str, str, datetime, float]]]:
+        """
+        Streams (sensor_id, metric, timestamp, value) tuples ordered by series and time, in chunks.
+        Uses a server-side cursor, so memory use is bounded by the chunk size. No ORM objects are built.
+        
+        Args:
+            sensor_ids (Optional[List[str]]): List of sensor IDs to filter by.
+            metrics (Optional[List[str]]): List of metric names to filter by.
+            date_from (Optional[str]): Start of the date range (ISO format string).
+            date_to (Optional[str]): End of the date range (ISO format string).
+            chunk_size (int): Number of rows fetched per round trip.
+            
+        Yields:
+            List[Tuple[str, str, datetime, float]]: The next chunk of rows.
+        """
+        table = models.SensorData
+        stmt = filter_sensor_data(
+            select(table.sensor_id, table.metric, table.timestamp, table.value),
+            sensor_ids, metrics, date_from, date_to,
+        ).order_by(table.sensor_id, table.metric, table.timestamp)
+        result = self.read_session.execute(stmt.execution_options(yield_per=chunk_size))
+        for partition in result.partitions():
+            yield [
+                (sensor_id, getattr(metric, "value", metric), timestamp, value)
+                for sensor_id, metric, timestamp, value in partition
+            ]
+
+    def export_rows(
+        self,
+        sensor_ids: Optional[List[str]] = None,
+        metrics: Optional[List[str]] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        chunk_size: int = 10000,
+    ) -> Iterator[List[Row]]:
+        """
+        Streams the (id, timestamp, sensor_id, metric, value) rows matching the filters, ordered by time,
+        in chunks from a server-side cursor. No ORM objects are built.
+
+        Args:
+            sensor_ids (Optional[List[str]]): List of sensor IDs to filter by.
+            metrics (Optional[List[str]]): List of metric names to filter by.
+            date_from (Optional[str]): Start of the date range (ISO format string).
+            date_to (Optional[str]): End of the date range (ISO format string).
+            chunk_size (int): Number of rows fetched per round trip.
+
+        Raises:
+            ValueError: Invalid date format. Raised on the call, before any row is fetched.
+
+        Returns:
+            Iterator[List[Row]]: Chunks of rows.
+        """
+        stmt = self._export_statement(sensor_ids, metrics, date_from, date_to)
+        return self._partitions(stmt, chunk_size)
+
+    def export_csv(
+        self,
+        sensor_ids: Optional[List[str]] = None,
+        metrics: Optional[List[str]] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+    ) -> Iterator[bytes]:
+        """
+        Streams the rows matching the filters as CSV with a header line, ordered by time.
+        On PostgreSQL the CSV is produced by COPY (SELECT ...) TO STDOUT, other databases get it
+        written from the server-side cursor partitions.
+
+        Args:
+            sensor_ids (Optional[List[str]]): List of sensor IDs to filter by.
+            metrics (Optional[List[str]]): List of metric names to filter by.
+            date_from (Optional[str]): Start of the date range (ISO format string).
+            date_to (Optional[str]): End of the date range (ISO format string).
+
+        Raises:
+            ValueError: Invalid date format. Raised on the call, before any row is fetched.
+
+        Returns:
+            Iterator[bytes]: CSV chunks.
+        """
+        stmt = self._export_statement(sensor_ids, metrics, date_from, date_to)
+        connection = self.read_session.connection()
+        if connection.dialect.name != "postgresql":
+            return rows_to_csv(self._partitions(stmt, 10000))
+        # Filter values are rendered as escaped literals, COPY does not take bound parameters.
+        select_sql = stmt.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True})
+        return copy_to_stdout(
+            connection.connection.dbapi_connection,
+            f"COPY ({select_sql}) TO STDOUT WITH (FORMAT csv, HEADER true)",
+        )
+
+    def _export_statement(self, sensor_ids, metrics, date_from, date_to):
+        table = models.SensorData
+        return filter_sensor_data(
+            select(table.id, table.timestamp, table.sensor_id, table.metric, table.value),
+            sensor_ids, metrics, date_from, date_to,
+        ).order_by(table.timestamp)
+
+    def _partitions(self, stmt, chunk_size: int) -> Iterator[List[Row]]:
+        result = self.read_session.execute(stmt.execution_options(yield_per=chunk_size))
+        for partition in result.partitions():
+            yield list(partition)
+
+    def count_series(
+        self,
+        sensor_ids: Optional[List[str]] = None,
+        metrics: Optional[List[str]] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+    ) -> int:
+        """
+        Returns the number of (sensor, metric) series with readings in a range, from the per day statistics
+        (applied with day granularity, so it is an upper bound). The cost does not depend on the number of readings.
+
+        Args:
+            sensor_ids (Optional[List[str]]): List of sensor IDs to filter by.
+            metrics (Optional[List[str]]): List of metric names to filter by.
+            date_from (Optional[str]): Start of the date range (ISO format string).
+            date_to (Optional[str]): End of the date range (ISO format string).
+
+        Returns:
+            int: The number of series.
+        """
+        model = models.SensorStats
+        q = self.read_session.query(model.sensor_id, model.metric).distinct()
+        if sensor_ids:
+            q = q.filter(model.sensor_id.in_(sensor_ids))
+        if metrics:
+            q = q.filter(model.metric.in_(metrics))
+        if date_from:
+            q = q.filter(model.bucket >= day_bucket(parse_iso_datetime(date_from)))
+        if date_to:
+            q = q.filter(model.bucket <= day_bucket(parse_iso_datetime(date_to)))
+        return q.count()
+
+    def get_aligned_series(
+        self,
+        date_from: str,
+        date_to: str,
+        interval: timedelta,
+        fill: FillMethod = FillMethod.NULL,
+        sensor_ids: Optional[List[str]] = None,
+        metrics: Optional[List[str]] = None,
+    ) -> Tuple[datetime, int, List[Tuple[str, str, np.ndarray]]]:
+        """
+        Aligns every (sensor, metric) series with readings in the range on a common time grid.
+        On TimescaleDB the grid is filled by time_bucket_gapfill() with locf() or interpolate(),
+        elsewhere by NumPy from the streamed readings (app.alignment).
+
+        Args:
+            date_from (str): Start of the range (ISO format string), rounded down to the bucket start.
+            date_to (str): End of the range (ISO format string, exclusive).
+            interval (timedelta): Bucket size.
+            fill (FillMethod): How empty buckets are filled.
+            sensor_ids (Optional[List[str]]): List of sensor IDs to filter by.
+            metrics (Optional[List[str]]): List of metric names to filter by.
+
+        Returns:
+            Tuple[datetime, int, List[Tuple[str, str, np.ndarray]]]: Start of the first bucket (naive UTC),
+                number of buckets, and the bucket values (NaN if empty) per (sensor_id, metric), sorted.
+        """
+        start = grid_start(to_naive_utc(parse_iso_datetime(date_from)), interval)
+        end = to_naive_utc(parse_iso_datetime(date_to))
+        length = max(0, -((start - end) // interval))  # ceil
+        if length == 0:
+            return start, 0, []
+
+        if self.read_session.get_bind().dialect.name != "postgresql":
+            # Bucket sums and counts per series, memory is bounded by the size of the matrix.
+            accumulated: Dict[Tuple[str, str], Tuple[np.ndarray, np.ndarray]] = {}
+            for chunk in self.iter_sensor_values(sensor_ids, metrics, start.isoformat(), end.isoformat()):
+                for key, rows in groupby(chunk, key=lambda r: (r[0], r[1])):
+                    rows = list(rows)
+                    sums, counts = bucket_sums(
+                        np.array([(r[2] - start).total_seconds() for r in rows]),
+                        np.array([r[3] for r in rows], dtype=float),
+                        interval.total_seconds(),
+                        length,
+                    )
+                    if key in accumulated:  # Series continued from the previous chunk.
+                        sums, counts = sums + accumulated[key][0], counts + accumulated[key][1]
+                    accumulated[key] = (sums, counts)
+            return start, length, [
+                (sensor_id, metric, fill_gaps(bucket_means(sums, counts), fill))
+                for (sensor_id, metric), (sums, counts) in accumulated.items()
+                if counts.any()
+            ]
+
+        table = models.SensorData
+        bucket = func.time_bucket_gapfill(interval, table.timestamp, start, end).label("bucket")
+        value = func.avg(table.value)
+        if fill == FillMethod.PREVIOUS:
+            value = func.locf(value)
+        elif fill == FillMethod.LINEAR:
+            value = func.interpolate(value)
+        stmt = (
+            filter_sensor_data(select(bucket, table.sensor_id, table.metric, value), sensor_ids, metrics)
+            .where(table.timestamp >= start, table.timestamp < end)
+            .group_by(bucket, table.sensor_id, table.metric)
+            .order_by(table.sensor_id, table.metric, bucket)
+        )
+        result = []
+        for (sensor_id, metric), rows in groupby(self.read_session.execute(stmt), key=lambda r: (r[1], r[2])):
+            values = np.full(length, np.nan)
+            for bucket_start, _, _, avg in rows:
+                index = (bucket_start - start) // interval
+                if 0 <= index < length and avg is not None:
+                    values[index] = avg
+            result.append((sensor_id, getattr(metric, "value", metric), values))
+        return start, length, result
+
+    def get_sensor_rows_by_ids(self, row_ids: List[str]) -> List[Row]:
         """
         Retrieves SensorData records from the database by their IDs.
         
@@ -44,14 +727,56 @@ class SensorDataDAL:
             row_ids (List[str]): List of SensorData record IDs to retrieve.
         
         Returns:
-            List[models.SensorData]: List of SensorData objects matching the provided IDs.
+            List[Row]: Rows (id, timestamp, sensor_id, metric, value) matching the provided IDs.
         """
-        ids = [uuid.UUID(rid) for rid in row_ids]
-        return (
-            self.session.query(models.SensorData)
-            .filter(models.SensorData.id.in_(ids))
-            .all()
-        )
+        return [row for chunk in self.iter_sensor_rows_by_ids(row_ids) for row in chunk]
+
+    def iter_sensor_rows_by_ids(self, row_ids: List[str], chunk_size: int = 5000) -> Iterator[List[Row]]:
+        """
+        Streams SensorData records by their IDs in chunks, with memory bounded by the chunk size.
+
+        On PostgreSQL the IDs are bound as a single uuid[] parameter, so the statement text and plan do not
+        depend on the number of IDs: `id = ANY(:ids)` for up to ARRAY_LOOKUP_MAX_IDS IDs, a join against
+        `unnest(:ids)` above (a hash join instead of probing the array per row; unlike a temporary table
+        it also works on a read only replica). Other databases (SQLite) get IN lists of SQLITE_IN_CHUNK IDs.
+
+        Args:
+            row_ids (List[str]): SensorData record IDs (UUID strings).
+            chunk_size (int): Number of rows per yielded chunk.
+
+        Raises:
+            ValueError: An ID is not a valid UUID. Raised on the call, before any row is fetched.
+
+        Returns:
+            Iterator[List[Row]]: Chunks of (id, timestamp, sensor_id, metric, value) rows.
+        """
+        ids = list(dict.fromkeys(uuid.UUID(rid) for rid in row_ids))
+        return self._iter_rows_by_ids(ids, chunk_size)
+
+    def _iter_rows_by_ids(self, ids: List[uuid.UUID], chunk_size: int) -> Iterator[List[Row]]:
+        table = models.SensorData
+        columns = (table.id, table.timestamp, table.sensor_id, table.metric, table.value)
+        if self.read_session.get_bind().dialect.name == "postgresql":
+            ids_param = bindparam("ids", value=ids, type_=ARRAY(PG_UUID(as_uuid=True)))
+            if len(ids) <= self.ARRAY_LOOKUP_MAX_IDS:
+                stmt = select(*columns).where(table.id == any_(ids_param))
+            else:
+                lookup = func.unnest(ids_param).table_valued("id").render_derived(name="lookup")
+                stmt = select(*columns).join(lookup, table.id == lookup.c.id)
+            result = self.read_session.execute(stmt.execution_options(yield_per=chunk_size))
+            yield from (list(partition) for partition in result.partitions())
+            return
+
+        buffer: List[Row] = []
+        for i in range(0, len(ids), self.SQLITE_IN_CHUNK):
+            buffer.extend(
+                self.read_session.execute(select(*columns).where(table.id.in_(ids[i : i + self.SQLITE_IN_CHUNK])))
+            )
+            while len(buffer) >= chunk_size:
+                yield buffer[:chunk_size]
+                buffer = buffer[chunk_size:]
+        if buffer:
+            yield buffer
 
     def list_sensor_data(
         self,
@@ -70,39 +795,52 @@ class SensorDataDAL:
             date_to (Optional[str]): End of the date range (ISO format string).
             
         Returns:
-            List[models.SensorData]: List of SensorData objects matching the filters or all if no filters provided.
+            List[models.SensorData]: List of SensorData objects matching the filters or all if no filters provided,
+                the first 1000 ordered by timestamp and ID.
         """
-        
-        q = self.session.query(models.SensorData)
-        if sensor_ids:
-            q = q.filter(models.SensorData.sensor_id.in_(sensor_ids))
-        if metrics:
-            q = q.filter(models.SensorData.metric.in_(metrics))
-        
-        # Convert string dates to datetime objects if provided
-        if date_from and date_to:
-            date_from_dt = datetime.fromisoformat(date_from.replace('Z', '+00:00'))
-            date_to_dt = datetime.fromisoformat(date_to.replace('Z', '+00:00'))
-            q = q.filter(models.SensorData.timestamp.between(date_from_dt, date_to_dt))
-        elif date_from:
-            date_from_dt = datetime.fromisoformat(date_from.replace('Z', '+00:00'))
-            q = q.filter(models.SensorData.timestamp >= date_from_dt)
-        elif date_to:
-            date_to_dt = datetime.fromisoformat(date_to.replace('Z', '+00:00'))
-            q = q.filter(models.SensorData.timestamp <= date_to_dt)
 
+        q = filter_sensor_data(self.read_session.query(models.SensorData), sensor_ids, metrics, date_from, date_to)
+        # A stable order, so the limited result (and its ETag and cache entry) is deterministic.
+        q = q.order_by(models.SensorData.timestamp, models.SensorData.id)
         q = q.limit(1000)  # Hard limit to 1000 results to protect server resources.
         return q.all()
 
 
-def get_sensor_data_dal(session: Session = Depends(get_db_session)) -> SensorDataDAL:
+def get_sensor_data_dal(
+    session: Session = Depends(get_db_session),
+    read_session: Session = Depends(get_read_db_session),
+    recent_keys: Optional[RecentKeyFilter] = Depends(get_recent_key_filter),
+    partitions: Optional[DailyPartitions] = Depends(get_daily_partitions),
+) -> SensorDataDAL:
     """
-    Creates and returns a SensorDataDAL instance with injected session.
+    Creates and returns a SensorDataDAL instance with injected sessions.
+    Sessions connect lazily, so an unused session does not take a pooled connection.
     
     Args:
-        session (Session): The database session dependency.
+        session (Session): The primary (write) database session dependency.
+        read_session (Session): The read replica database session dependency.
+        recent_keys (Optional[RecentKeyFilter]): The recently written keys filter dependency.
+        partitions (Optional[DailyPartitions]): The edge mode partitions dependency, None on PostgreSQL.
         
     Returns:
         SensorDataDAL: A DAL instance for sensor data operations.
     """
-    return SensorDataDAL(session)
+    return SensorDataDAL(session, read_session, recent_keys, partitions)
+
+
+@contextmanager
+def open_sensor_data_dal() -> Iterator[SensorDataDAL]:
+    """
+    Opens a SensorDataDAL with its own sessions, for work outside of a request (worker threads, jobs).
+    The sessions are closed when the block exits.
+
+    Yields:
+        SensorDataDAL: A DAL instance for sensor data operations.
+    """
+    with SessionLocal() as session, ReadSessionLocal() as read_session:
+        yield SensorDataDAL(session, read_session, get_recent_key_filter(), get_daily_partitions())
+
+
+def get_sensor_data_dal_factory() -> Callable[[], ContextManager[SensorDataDAL]]:
+    """Get the factory of DAL instances with their own sessions for DI, used by concurrent workers of a request."""
+    return open_sensor_data_dal
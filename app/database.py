@@ -1,24 +1,230 @@
 """
-Database connection and session management for PostgreSQL with TimescaleDB extension.
+Database connection and session management for PostgreSQL with TimescaleDB extension,
+or SQLite in WAL mode for the embedded edge mode (see app/edge.py).
 """
 
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, insert, make_url, select, text, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from .config import get_settings
+from .metrics import TimedQueuePool, instrument_engine
+from .slow_query import slow_query_recorder
 
-engine = create_engine(get_settings().timescale_db_connection, echo=True, pool_pre_ping=True)
+
+def create_db_engine(
+    url: str,
+    name: str,
+    pool_size: int,
+    max_overflow: int,
+    pool_timeout: float,
+    pool_recycle: int,
+    **kwargs,
+) -> Engine:
+    """
+    Creates an instrumented engine with its own connection pool.
+
+    Args:
+        url (str): SQLAlchemy database URL.
+        name (str): Engine label used in metrics, logs and slow query captures.
+        pool_size (int): Number of connections kept open in the pool.
+        max_overflow (int): Additional connections allowed above pool_size under load.
+        pool_timeout (float): Seconds to wait for a free connection before giving up.
+        pool_recycle (int): Connections older than this (seconds) are replaced.
+        **kwargs: Additional create_engine arguments, e.g. connect_args.
+
+    Returns:
+        Engine: The SQLAlchemy engine instance.
+    """
+    options = {"pool_pre_ping": True, "pool_logging_name": name, **kwargs}
+    # SQLite picks its own pool implementation, sizing does not apply to it.
+    sqlite_backend = make_url(url).get_backend_name() == "sqlite"
+    if not sqlite_backend:
+        options.update(
+            poolclass=TimedQueuePool,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=pool_timeout,
+            pool_recycle=pool_recycle,
+        )
+    new_engine = create_engine(url, **options)
+    if sqlite_backend:
+        configure_sqlite(new_engine)
+    instrument_engine(new_engine, name)
+    slow_query_recorder.attach(new_engine, name)
+    return new_engine
+
+
+def configure_sqlite(new_engine: Engine) -> None:
+    """
+    Applies the per connection pragmas of the embedded (gateway) profile: relaxed fsync, which is safe in
+    WAL mode (a power loss may lose the last transactions, never corrupt the file), a bounded page cache,
+    memory mapped reads, in-memory temporary tables, and waiting for the write lock instead of failing,
+    since SQLite has a single writer. WAL mode itself is persistent, it is enabled by init_edge().
+
+    Args:
+        new_engine (Engine): Engine of a SQLite database file.
+    """
+    settings = get_settings()
+    pragmas = (
+        "PRAGMA synchronous = NORMAL",
+        f"PRAGMA busy_timeout = {int(settings.sqlite_busy_timeout_ms)}",
+        f"PRAGMA cache_size = -{int(settings.sqlite_cache_size_kib)}",
+        f"PRAGMA mmap_size = {int(settings.sqlite_mmap_size_bytes)}",
+        "PRAGMA temp_store = MEMORY",
+    )
+
+    @event.listens_for(new_engine, "connect")
+    def _pragmas(dbapi_connection, connection_record):
+        for pragma in pragmas:
+            dbapi_connection.execute(pragma)
+
+
+_settings = get_settings()
+# Primary engine for writes (ingest) and schema management.
+engine = create_db_engine(
+    _settings.timescale_db_connection,
+    "primary",
+    pool_size=_settings.db_pool_size,
+    max_overflow=_settings.db_max_overflow,
+    pool_timeout=_settings.db_pool_timeout,
+    pool_recycle=_settings.db_pool_recycle,
+)
+# Read engine for list/lookup queries. Points to a replica when configured,
+# otherwise to the primary database through a separate pool, so reads do not starve ingest.
+read_engine = create_db_engine(
+    _settings.timescale_db_read_connection or _settings.timescale_db_connection,
+    "read",
+    pool_size=_settings.db_read_pool_size,
+    max_overflow=_settings.db_read_max_overflow,
+    pool_timeout=_settings.db_read_pool_timeout,
+    pool_recycle=_settings.db_read_pool_recycle,
+)
+
+def create_agent_engine(url: str, statement_timeout_ms: int, **pool_options) -> Engine:
+    """
+    Creates the isolated engine for LLM generated SQL. Every connection is read only and,
+    on PostgreSQL, limited by statement_timeout, so a runaway query cannot hold the database.
+
+    Args:
+        url (str): SQLAlchemy database URL.
+        statement_timeout_ms (int): PostgreSQL statement timeout in milliseconds.
+        **pool_options: Pool sizing arguments of create_db_engine.
+
+    Returns:
+        Engine: The SQLAlchemy engine instance.
+    """
+    if make_url(url).get_backend_name() == "postgresql":
+        options = f"-c statement_timeout={int(statement_timeout_ms)} -c default_transaction_read_only=on"
+        return create_db_engine(url, "agent", connect_args={"options": options}, **pool_options)
+
+    new_engine = create_db_engine(url, "agent", **pool_options)
+
+    @event.listens_for(new_engine, "connect")
+    def _read_only(dbapi_connection, connection_record):
+        dbapi_connection.execute("PRAGMA query_only = ON")
+
+    return new_engine
+
+
+agent_engine = create_agent_engine(
+    _settings.timescale_db_read_connection or _settings.timescale_db_connection,
+    _settings.agent_statement_timeout_ms,
+    pool_size=_settings.agent_pool_size,
+    max_overflow=_settings.agent_max_overflow,
+    pool_timeout=_settings.agent_pool_timeout,
+    pool_recycle=_settings.db_read_pool_recycle,
+)
 SessionLocal = sessionmaker(bind=engine)
+ReadSessionLocal = sessionmaker(bind=read_engine)
 Base = declarative_base()
 
 def get_engine():
     """
-    Returns the SQLAlchemy engine connected to the database.
+    Returns the SQLAlchemy engine connected to the primary database.
 
     Returns:
         Engine: The SQLAlchemy engine instance.
     """
     return engine
 
+def get_read_engine():
+    """
+    Returns the SQLAlchemy engine connected to the read replica (or the primary when no replica is configured).
+
+    Returns:
+        Engine: The SQLAlchemy engine instance.
+    """
+    return read_engine
+
+def get_agent_engine():
+    """
+    Returns the read only, statement time limited SQLAlchemy engine of the LLM SQL agent.
+
+    Returns:
+        Engine: The SQLAlchemy engine instance.
+    """
+    return agent_engine
+
+def dialect_insert(bind):
+    """
+    Returns the dialect specific insert() construct of a bind, which supports ON CONFLICT clauses.
+
+    Args:
+        bind: The engine or connection the statement will run on.
+
+    Returns:
+        The postgresql or sqlite insert() function, None on databases without ON CONFLICT.
+    """
+    if bind.dialect.name == "postgresql":
+        return postgresql.insert
+    if bind.dialect.name == "sqlite":
+        return sqlite.insert
+    return None
+
+def _key_value(value):
+    return getattr(value, "value", value)  # Enum members and their stored values compare equal.
+
+def insert_ignore(session, model, values, key, returning=None) -> list:
+    """
+    Inserts rows, skipping the ones whose key is already stored (INSERT ... ON CONFLICT DO NOTHING).
+    Databases without ON CONFLICT select the stored keys first and insert the missing rows; there a concurrent
+    insert of the same key fails on the unique index instead of being skipped.
+
+    Args:
+        session: The session of the caller's transaction.
+        model: The ORM model of the table.
+        values (List[dict]): The rows to insert.
+        key (List[str]): The columns of the unique key.
+        returning: Column returned of the inserted rows.
+
+    Returns:
+        list: The returning column values of the inserted rows, empty without returning.
+    """
+    if not values:
+        return []
+    dialect_specific = dialect_insert(session.get_bind())
+    if dialect_specific is not None:
+        stmt = dialect_specific(model).on_conflict_do_nothing(index_elements=key)
+        if returning is None:
+            session.execute(stmt, values)
+            return []
+        return list(session.execute(stmt.returning(returning), values).scalars())
+
+    columns = [getattr(model, name) for name in key]
+    stored, new = set(), {}
+    for start in range(0, len(values), 500):
+        keys = [tuple(value[name] for name in key) for value in values[start:start + 500]]
+        for row in session.execute(select(*columns).where(tuple_(*columns).in_(keys))):
+            stored.add(tuple(_key_value(v) for v in row))
+    for value in values:
+        row_key = tuple(_key_value(value[name]) for name in key)
+        if row_key not in stored:
+            new.setdefault(row_key, value)
+    if new:
+        session.execute(insert(model), list(new.values()))
+    return [value[returning.key] for value in new.values()] if returning is not None else []
+
 def get_db_session():
     """
     Yields a database session that is automatically closed after use.
@@ -36,6 +242,19 @@ def get_db_session():
     finally:
         db.close()
 
+def get_read_db_session():
+    """
+    Yields a read database session bound to the read engine that is automatically closed after use.
+
+    Yields:
+        Session: An active SQLAlchemy database session for read queries.
+    """
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
 async def init_postgres() -> None:
     """
     Initialize the PostgreSQL connection and create the hypertable.
@@ -50,6 +269,9 @@ async def init_postgres() -> None:
     -- Clean up any existing data for a fresh start
     TRUNCATE TABLE sensor_data;
 
+    -- Natural key of the idempotent ingest. Created by create_all on new databases, added here to existing ones.
+    CREATE UNIQUE INDEX IF NOT EXISTS ux_sensor_data_natural_key ON sensor_data (sensor_id, metric, timestamp);
+
     -- Set default UUID for ID field if not already set. SQL Alchemy standard solution
     -- does not use the Postgres side column default when inserting via ORM. 
     -- Defining server side default in the model is make SQLite inmemory testing approach too complicated.
@@ -195,6 +417,15 @@ async def init_postgres() -> None:
     ('2025-09-08T08:35:00+00:00', 'sensor_1', 'pressure', 1012.6),
     ('2025-09-08T08:45:00+00:00', 'sensor_4', 'humidity', 53.6),
     ('2025-09-08T08:55:00+00:00', 'sensor_4', 'pressure', 1013.8);
+
+    -- Rebuild the running statistics from the sample data. Maintained incrementally by the ingest path afterwards.
+    TRUNCATE TABLE sensor_stats, sensor_stats_total;
+    INSERT INTO sensor_stats (sensor_id, metric, bucket, count, mean, m2, min, max)
+    SELECT sensor_id, metric, timestamp::date, count(*), avg(value), var_pop(value) * count(*), min(value), max(value)
+    FROM sensor_data GROUP BY sensor_id, metric, timestamp::date;
+    INSERT INTO sensor_stats_total (sensor_id, metric, count, mean, m2, min, max)
+    SELECT sensor_id, metric, count(*), avg(value), var_pop(value) * count(*), min(value), max(value)
+    FROM sensor_data GROUP BY sensor_id, metric;
     """
     # Create tables
     Base.metadata.create_all(bind=engine)
@@ -204,6 +435,13 @@ async def init_postgres() -> None:
         with engine.connect() as conn:
             conn.execute(text(init_sql))
             conn.commit()
+        # Quantile sketches and liveness of the sample data. Maintained incrementally by the ingest path afterwards.
+        from .liveness import rebuild_liveness
+        from .sketches import rebuild_sketches
+        with SessionLocal() as session:
+            rebuild_sketches(session)
+            rebuild_liveness(session)
+            session.commit()
         print("PostgreSQL with timescales has been initialized.")
     except Exception as e:
         print(f"Error occured when running query : {e}")
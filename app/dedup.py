@@ -0,0 +1,74 @@
+"""
+In-memory filter of recently ingested sensor readings.
+
+Devices retry after outages and resend readings that are already stored. The natural key of a reading is
+(sensor_id, metric, timestamp), enforced by a unique index on sensor_data. The filter keeps a 64-bit
+fingerprint of the keys written recently, so most retried readings are dropped before they reach the database.
+
+The fingerprints are exact (no Bloom filter): the chance that a new reading is dropped because of a
+fingerprint collision is about n / 2^64 for n remembered keys, while a Bloom filter sized for the same memory
+would drop a fraction of the new readings. Memory is bounded by two generations of at most `capacity` keys:
+when the current generation is full, the older one is discarded. The filter is per process and only an
+optimization, the unique index remains the source of truth.
+"""
+
+import hashlib
+import threading
+from datetime import datetime, timezone
+from typing import Iterable, Tuple
+from .config import get_settings
+
+NaturalKey = Tuple[str, str, datetime]
+
+
+def fingerprint(sensor_id: str, metric: str, timestamp: datetime) -> int:
+    """64-bit fingerprint of a natural key. Aware timestamps are normalized to naive UTC."""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    metric = getattr(metric, "value", metric)
+    digest = hashlib.blake2b(f"{sensor_id}\x1f{metric}\x1f{timestamp.isoformat()}".encode(), digest_size=8)
+    return int.from_bytes(digest.digest(), "little")
+
+
+class RecentKeyFilter:
+    """Bounded, thread-safe set of recently written natural keys with generational expiry."""
+
+    def __init__(self, capacity: int):
+        """
+        Args:
+            capacity (int): Number of keys per generation. At most 2 * capacity keys are remembered.
+        """
+        self.capacity = capacity
+        self._current: set = set()
+        self._previous: set = set()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._current) + len(self._previous)
+
+    def contains(self, fp: int) -> bool:
+        """True when the fingerprint was added recently."""
+        return fp in self._current or fp in self._previous
+
+    def add_many(self, fps: Iterable[int]) -> None:
+        """Remember the fingerprints of written (or already stored) readings."""
+        with self._lock:
+            for fp in fps:
+                if fp in self._current:
+                    continue
+                if len(self._current) >= self.capacity:
+                    self._previous, self._current = self._current, set()
+                self._current.add(fp)
+
+    def clear(self) -> None:
+        """Forget all keys."""
+        with self._lock:
+            self._current, self._previous = set(), set()
+
+
+recent_key_filter = RecentKeyFilter(get_settings().dedup_filter_capacity)
+
+
+def get_recent_key_filter():
+    """Get the application wide filter for DI. None when DEDUP_FILTER_CAPACITY is 0."""
+    return recent_key_filter if recent_key_filter.capacity > 0 else None
@@ -0,0 +1,544 @@
+"""
+Embedded edge mode: the API on a small gateway with a SQLite database file instead of PostgreSQL/TimescaleDB.
+Selected by a sqlite:/// TIMESCALE_DB_CONNECTION.
+
+The database runs in WAL mode with the per connection pragmas of database.configure_sqlite(): readers do not
+block the single writer and the other way around. Readings are stored in daily partition tables
+(sensor_data_pYYYYMMDD), clustered by the natural key (sensor_id, metric, timestamp), so a sensor range read is
+a contiguous index range per day. sensor_data is a view, the UNION ALL of the partitions: the read queries of
+the DAL run unchanged, SQLite pushes their filters down into every partition. An ingest batch is one
+transaction with one multi-row INSERT ... ON CONFLICT DO NOTHING per day; partitions are created ahead of time.
+Readings are accepted from EDGE_RETENTION_DAYS ago up to tomorrow, so a device with a wrong clock cannot create
+partitions without bound; the ones outside the window are dropped and counted.
+
+A maintenance thread ships the closed partitions (a day ends, plus EDGE_PARTITION_CLOSE_AFTER_S for late
+readings) to the upstream Sensory API in bulk ingest batches, and drops the partitions older than
+EDGE_RETENTION_DAYS once they are shipped. The freed pages are handed back to the filesystem (incremental vacuum,
+WAL truncation). Every partition carries a version, bumped by each write: a late reading into an already shipped
+day makes it ship again. Upstream ingest is idempotent on the natural key, so resending a partition is safe.
+"""
+
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set
+from uuid import UUID
+import requests
+from sqlalchemy import Column, Date, DateTime, Integer, MetaData, Table, make_url, select, tuple_, update
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from app import models, schemas
+from app.config import get_settings
+from app.database import Base, engine
+from app.metrics import EDGE_OUT_OF_RANGE, EDGE_PARTITIONS, EDGE_SYNCED_ROWS
+
+logger = logging.getLogger(__name__)
+
+VIEW_NAME = models.SensorData.__tablename__
+PARTITION_PREFIX = f"{VIEW_NAME}_p"
+NATURAL_KEY = ["sensor_id", "metric", "timestamp"]
+COLUMNS = "id, timestamp, sensor_id, metric, value"
+
+# Write version and upstream sync state of every partition.
+partition_state = Table(
+    "edge_partitions",
+    MetaData(),
+    Column("day", Date, primary_key=True),
+    Column("version", Integer, nullable=False, default=0),
+    Column("synced_version", Integer),
+    Column("synced_at", DateTime),
+    Column("synced_rows", Integer),
+)
+
+
+class SyncThrottled(Exception):
+    """The upstream API rejected a batch with 429, retry after the given seconds."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Upstream throttled, retry after {retry_after} seconds")
+        self.retry_after = retry_after
+
+
+class ReadingOutOfRange(Exception):
+    """The timestamp of a reading is outside the days the edge partitions accept."""
+
+
+def is_edge_database(url: str) -> bool:
+    """Whether the connection URL selects the embedded edge mode."""
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def partition_ddl(name: str) -> List[str]:
+    """
+    DDL of a partition table. The row ID is TEXT (the 32 hex digits SQLAlchemy stores), the primary key is
+    the natural key, so the table is clustered for per sensor range reads. The row ID lookups and the time
+    ranges over all sensors have their own indexes.
+    """
+    return [
+        f"CREATE TABLE IF NOT EXISTS {name} (id CHAR(32) NOT NULL, timestamp DATETIME NOT NULL, "
+        "sensor_id VARCHAR NOT NULL, metric VARCHAR(11) NOT NULL, value FLOAT, "
+        "PRIMARY KEY (sensor_id, metric, timestamp)) WITHOUT ROWID",
+        f"CREATE INDEX IF NOT EXISTS ix_{name}_id ON {name} (id)",
+        f"CREATE INDEX IF NOT EXISTS ix_{name}_timestamp ON {name} (timestamp)",
+    ]
+
+
+class DailyPartitions:
+    """Daily partition tables of the sensor data and their sensor_data view, on a SQLite engine."""
+
+    def __init__(
+        self,
+        db_engine: Engine,
+        clock: Callable[[], datetime] = lambda: datetime.now(timezone.utc).replace(tzinfo=None),
+        retention_days: int = 30,
+    ):
+        """
+        Args:
+            db_engine (Engine): Engine of the SQLite database file, the primary engine.
+            clock (Callable[[], datetime]): Current naive UTC time, replaceable in tests.
+            retention_days (int): Days of readings kept, older readings are not accepted.
+        """
+        self.engine = db_engine
+        self.clock = clock
+        self.retention_days = retention_days
+        self._days: Optional[Set[date]] = None
+        self._tables: Dict[date, Table] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def table_name(day: date) -> str:
+        return f"{PARTITION_PREFIX}{day:%Y%m%d}"
+
+    def table(self, day: date) -> Table:
+        """The Table of a partition, for inserts and selects with the column types of the model."""
+        table = self._tables.get(day)
+        if table is None:
+            table = models.SensorData.__table__.to_metadata(MetaData(), name=self.table_name(day))
+            self._tables[day] = table
+        return table
+
+    def days(self) -> List[date]:
+        """The days with a partition, oldest first."""
+        with self._lock:
+            if self._days is None:
+                with self._immediate(transaction=False) as conn:
+                    self._days = self._stored_days(conn)
+            return sorted(self._days)
+
+    def table_names(self) -> List[str]:
+        return [self.table_name(day) for day in self.days()]
+
+    def accepts(self, timestamp: datetime) -> bool:
+        """Whether a reading is within the retention window, from retention_days ago up to tomorrow."""
+        today = self.clock().date()
+        return today - timedelta(days=max(self.retention_days, 1)) <= timestamp.date() <= today + timedelta(days=1)
+
+    def ensure(self, days: Iterable[date]) -> None:
+        """Create the missing partitions of the days, and the view over them, in an own transaction."""
+        days = set(days)
+        with self._lock:
+            if self._days is not None and days <= self._days:
+                return
+            with self._immediate() as conn:
+                stored = self._stored_days(conn)
+                missing = days - stored
+                for day in missing:
+                    self._create(conn, day)
+                if missing:
+                    self._replace_view(conn, stored | missing)
+            self._days = stored | missing
+        EDGE_PARTITIONS.labels("created").inc(len(missing))
+
+    def insert_new(self, session: Session, values: List[dict]) -> Set[UUID]:
+        """
+        Insert readings into their partitions in the session's transaction, skipping stored natural keys
+        and readings outside the retention window (see accepts()), and bump the version of the written partitions.
+
+        Args:
+            session (Session): The ingest session, committed by the caller.
+            values (List[dict]): Column values of the readings (id, timestamp, sensor_id, metric, value).
+
+        Returns:
+            Set[UUID]: IDs of the inserted rows.
+        """
+        by_day: Dict[date, List[dict]] = defaultdict(list)
+        out_of_range = 0
+        for row in values:
+            if self.accepts(row["timestamp"]):
+                by_day[row["timestamp"].date()].append(row)
+            else:
+                out_of_range += 1
+        if out_of_range:
+            logger.warning("%d readings outside the edge retention window are dropped", out_of_range)
+            EDGE_OUT_OF_RANGE.inc(out_of_range)
+        self.ensure(by_day)
+        inserted: Set[UUID] = set()
+        for day, rows in by_day.items():
+            table = self.table(day)
+            stmt = sqlite.insert(table).on_conflict_do_nothing(index_elements=NATURAL_KEY).returning(table.c.id)
+            ids = set(session.execute(stmt, rows).scalars())
+            if ids:
+                session.execute(
+                    update(partition_state)
+                    .where(partition_state.c.day == day)
+                    .values(version=partition_state.c.version + 1)
+                )
+                inserted |= ids
+        return inserted
+
+    def states(self) -> List[schemas.EdgePartitionOut]:
+        """The partitions with their row counts and sync state, oldest first."""
+        closed_before = self.closed_before()
+        with self.engine.connect() as conn:
+            state = {row.day: row for row in conn.execute(select(partition_state))}
+            out = []
+            for day in self.days():
+                row = state.get(day)
+                out.append(
+                    schemas.EdgePartitionOut(
+                        day=day,
+                        table=self.table_name(day),
+                        rows=conn.exec_driver_sql(f"SELECT count(*) FROM {self.table_name(day)}").scalar_one(),
+                        closed=day < closed_before,
+                        version=row.version if row else 0,
+                        synced_version=row.synced_version if row else None,
+                        synced_at=row.synced_at if row else None,
+                        synced_rows=row.synced_rows if row else None,
+                    )
+                )
+        return out
+
+    def closed_before(self) -> date:
+        """Partitions of days before the returned one are closed: no more readings are expected."""
+        close_after = timedelta(seconds=get_settings().edge_partition_close_after_s)
+        return (self.clock() - close_after).date()
+
+    def unsynced(self) -> List[date]:
+        """Closed partitions whose current version is not shipped yet, oldest first."""
+        closed_before = self.closed_before()
+        days = set(self.days())
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(partition_state.c.day).where(
+                    partition_state.c.day < closed_before,
+                    (partition_state.c.synced_version.is_(None))
+                    | (partition_state.c.synced_version != partition_state.c.version),
+                )
+            )
+            return sorted(day for (day,) in rows if day in days)
+
+    def iter_rows(self, day: date, batch_size: int, after: Optional[tuple] = None) -> Iterator[list]:
+        """
+        The rows of a partition in natural key order, in batches (keyset pagination on the primary key),
+        starting after the given (sensor_id, metric, timestamp) key.
+        """
+        table = self.table(day)
+        key = tuple_(table.c.sensor_id, table.c.metric, table.c.timestamp)
+        while True:
+            stmt = select(table.c.sensor_id, table.c.metric, table.c.value, table.c.timestamp)
+            if after is not None:
+                stmt = stmt.where(key > tuple_(*after))
+            with self.engine.connect() as conn:
+                rows = conn.execute(stmt.order_by(*key.clauses).limit(batch_size)).all()
+            if not rows:
+                return
+            yield rows
+            after = (rows[-1].sensor_id, rows[-1].metric, rows[-1].timestamp)
+
+    def mark_synced(self, day: date, version: int, rows: int) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(partition_state)
+                .where(partition_state.c.day == day)
+                .values(synced_version=version, synced_at=self.clock(), synced_rows=rows)
+            )
+
+    def version(self, day: date) -> int:
+        with self.engine.connect() as conn:
+            return conn.execute(select(partition_state.c.version).where(partition_state.c.day == day)).scalar() or 0
+
+    def prune(self, retention_days: int, synced_only: bool) -> List[date]:
+        """
+        Drop the partitions older than the retention, and hand the freed pages back to the filesystem.
+        The partitions of today and of the last retention_days days are kept in any case.
+
+        Args:
+            retention_days (int): Days of readings kept.
+            synced_only (bool): Keep the partitions whose current version is not shipped upstream yet.
+
+        Returns:
+            List[date]: The days dropped.
+        """
+        cutoff = self.clock().date() - timedelta(days=max(retention_days, 1))
+        unsynced = set(self.unsynced()) if synced_only else set()
+        candidates = [day for day in self.days() if day < cutoff]
+        expired = [day for day in candidates if day not in unsynced]
+        if len(expired) < len(candidates):
+            logger.warning("%d expired edge partitions are kept until they are synced", len(candidates) - len(expired))
+        if not expired:
+            return []
+        with self._lock:
+            with self._immediate() as conn:
+                stored = self._stored_days(conn)
+                for day in expired:
+                    conn.execute(f"DROP TABLE IF EXISTS {self.table_name(day)}")
+                    conn.execute("DELETE FROM edge_partitions WHERE day = ?", (day.isoformat(),))
+                    self._tables.pop(day, None)
+                remaining = stored - set(expired)
+                if not remaining:  # The view needs a partition.
+                    remaining.add(self.clock().date())
+                    self._create(conn, self.clock().date())
+                self._replace_view(conn, remaining)
+            self._days = remaining
+        with self._immediate(transaction=False) as conn:
+            conn.execute("PRAGMA incremental_vacuum")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        EDGE_PARTITIONS.labels("dropped").inc(len(expired))
+        return expired
+
+    @contextmanager
+    def _immediate(self, transaction: bool = True):
+        """
+        A raw sqlite3 connection of the engine in an explicit BEGIN IMMEDIATE transaction. The DB-API driver does
+        not wrap DDL in transactions, so the partition and view changes would not be atomic otherwise.
+        """
+        raw = self.engine.raw_connection()
+        try:
+            conn = raw.driver_connection
+            previous = conn.isolation_level
+            conn.isolation_level = None  # Autocommit, the transaction is explicit.
+            try:
+                if not transaction:
+                    yield conn
+                    return
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    yield conn
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+                conn.execute("COMMIT")
+            finally:
+                conn.isolation_level = previous
+        finally:
+            raw.close()
+
+    def _create(self, conn, day: date) -> None:
+        for statement in partition_ddl(self.table_name(day)):
+            conn.execute(statement)
+        conn.execute("INSERT OR IGNORE INTO edge_partitions (day, version) VALUES (?, 0)", (day.isoformat(),))
+
+    @staticmethod
+    def _stored_days(conn) -> Set[date]:
+        rows = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ?", (f"{PARTITION_PREFIX}[0-9]*",)
+        )
+        return {datetime.strptime(name[len(PARTITION_PREFIX):], "%Y%m%d").date() for (name,) in rows}
+
+    def _replace_view(self, conn, days: Set[date]) -> None:
+        # SQLite allows 500 terms in a compound SELECT, far above any practical retention.
+        union = " UNION ALL ".join(f"SELECT {COLUMNS} FROM {self.table_name(day)}" for day in sorted(days))
+        conn.execute(f"DROP VIEW IF EXISTS {VIEW_NAME}")
+        conn.execute(f"CREATE VIEW {VIEW_NAME} AS {union}")
+
+
+class EdgeSync:
+    """Ships the closed partitions to the upstream Sensory API through its bulk ingest endpoint."""
+
+    def __init__(
+        self,
+        partitions: DailyPartitions,
+        url: str,
+        batch_size: int,
+        timeout: float,
+        http=None,
+        sensor_batch_size: int = 3600,
+    ):
+        """
+        Args:
+            partitions (DailyPartitions): The local partitions.
+            url (str): Base URL of the upstream API.
+            batch_size (int): Readings per bulk request, at most the bulk ingest limit (10000).
+            timeout (float): Seconds per request.
+            http: requests.Session compatible client, replaceable in tests.
+            sensor_batch_size (int): Readings of one sensor per request, at most the upstream sensor burst.
+        """
+        self.partitions = partitions
+        self.endpoint = f"{url.rstrip('/')}/api/v1/sensors/data/bulk"
+        self.batch_size = min(batch_size, 10000)
+        self.sensor_batch_size = max(sensor_batch_size, 1)
+        self.timeout = timeout
+        self.http = http or requests.Session()
+        self._resume: Dict[date, tuple] = {}  # Day: (version, last shipped key, readings sent) of a throttled pass.
+
+    def run(self) -> Dict[date, int]:
+        """
+        Ship every closed, not yet shipped partition, oldest first. Stops at the first throttled or failed one.
+
+        Returns:
+            Dict[date, int]: Readings shipped per partition.
+        """
+        shipped = {}
+        for day in self.partitions.unsynced():
+            try:
+                shipped[day] = self.ship(day)
+            except SyncThrottled as e:
+                logger.info("Edge sync of %s paused: %s", day, e)
+                break
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Edge sync of %s failed", day)
+                EDGE_PARTITIONS.labels("sync_failed").inc()
+                break
+        return shipped
+
+    def ship(self, day: date) -> int:
+        """
+        Send all readings of a partition, then record the shipped version. Returns the readings sent.
+        A pass stopped by throttling resumes after the last accepted request, unless the partition was written since.
+        """
+        version = self.partitions.version(day)
+        resumed_version, after, sent = self._resume.pop(day, (None, None, 0))
+        if resumed_version != version:
+            after, sent = None, 0
+        for rows in self._requests(day, after):
+            readings = [
+                {
+                    "sensor_id": row.sensor_id,
+                    "metric": getattr(row.metric, "value", row.metric),
+                    "value": row.value,
+                    "timestamp": row.timestamp.isoformat(),
+                }
+                for row in rows
+            ]
+            response = self.http.post(
+                self.endpoint,
+                json={"readings": readings},
+                headers={"X-Ingest-Priority": "backlog"},
+                timeout=self.timeout,
+            )
+            if response.status_code == 429:
+                if after is not None:
+                    self._resume[day] = (version, after, sent)
+                raise SyncThrottled(float(response.headers.get("Retry-After", 1)))
+            response.raise_for_status()
+            sent += len(readings)
+            after = (rows[-1].sensor_id, rows[-1].metric, rows[-1].timestamp)
+            EDGE_SYNCED_ROWS.inc(len(readings))
+        self.partitions.mark_synced(day, version, sent)
+        EDGE_PARTITIONS.labels("synced").inc()
+        return sent
+
+    def _requests(self, day: date, after: Optional[tuple]) -> Iterator[list]:
+        """The rows of a partition after a key, in requests of batch_size readings, sensor_batch_size per sensor."""
+        batch: list = []
+        per_sensor: Counter = Counter()
+        for rows in self.partitions.iter_rows(day, self.batch_size, after):
+            for row in rows:
+                if len(batch) >= self.batch_size or per_sensor[row.sensor_id] >= self.sensor_batch_size:
+                    yield batch
+                    batch, per_sensor = [], Counter()
+                batch.append(row)
+                per_sensor[row.sensor_id] += 1
+        if batch:
+            yield batch
+
+
+class EdgeMaintenance:
+    """Background thread creating the next partitions, shipping the closed ones and pruning the expired ones."""
+
+    def __init__(self, partitions: DailyPartitions, sync: Optional[EdgeSync], retention_days: int, interval: float):
+        self.partitions = partitions
+        self.sync = sync
+        self.retention_days = retention_days
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> None:
+        today = self.partitions.clock().date()
+        self.partitions.ensure([today, today + timedelta(days=1)])
+        if self.sync is not None:
+            self.sync.run()
+        self.partitions.prune(self.retention_days, synced_only=self.sync is not None)
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._loop, name="edge-maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                self.run_once()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Edge maintenance failed")
+            self._stop.wait(max(self.interval - (time.monotonic() - started), 1.0))
+
+
+daily_partitions = (
+    DailyPartitions(engine, retention_days=get_settings().edge_retention_days)
+    if is_edge_database(get_settings().timescale_db_connection)
+    else None
+)
+_maintenance: Optional[EdgeMaintenance] = None
+
+
+def get_daily_partitions() -> Optional[DailyPartitions]:
+    """Get the application wide partitions for DI. None unless the edge mode is on."""
+    return daily_partitions
+
+
+def init_edge(partitions: Optional[DailyPartitions] = None) -> None:
+    """
+    Initialize the SQLite database of the edge mode: WAL journal, incremental vacuum (effective on new
+    database files), the regular tables, and the partitions of today and tomorrow with the sensor_data view.
+
+    Args:
+        partitions (Optional[DailyPartitions]): Partitions of the database. Defaults to the application's.
+    """
+    partitions = partitions or daily_partitions
+    db_engine = partitions.engine
+    with db_engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.exec_driver_sql("PRAGMA journal_mode = WAL")
+        kind = conn.exec_driver_sql("SELECT type FROM sqlite_master WHERE name = ?", (VIEW_NAME,)).scalar()
+    if kind == "table":
+        raise RuntimeError(f"{VIEW_NAME} is a table in {db_engine.url}, the edge mode needs a new database file")
+    Base.metadata.create_all(bind=db_engine, tables=[t for t in Base.metadata.sorted_tables if t.name != VIEW_NAME])
+    partition_state.create(bind=db_engine, checkfirst=True)
+    today = partitions.clock().date()
+    partitions.ensure([today, today + timedelta(days=1)])
+    print("SQLite edge database has been initialized.")
+
+
+def start_edge_maintenance() -> None:
+    """Start the maintenance thread. Called on application startup in the edge mode."""
+    global _maintenance  # pylint: disable=global-statement
+    settings = get_settings()
+    sync = None
+    if settings.edge_sync_url:
+        sync = EdgeSync(
+            daily_partitions, settings.edge_sync_url, settings.edge_sync_batch_size, settings.edge_sync_timeout_s,
+            sensor_batch_size=settings.edge_sync_sensor_batch_size,
+        )
+    _maintenance = EdgeMaintenance(
+        daily_partitions, sync, settings.edge_retention_days, settings.edge_maintenance_interval_s
+    )
+    _maintenance.start()
+
+
+def stop_edge_maintenance() -> None:
+    """Stop the maintenance thread on application shutdown."""
+    global _maintenance  # pylint: disable=global-statement
+    if _maintenance is not None:
+        _maintenance.stop()
+        _maintenance = None
@@ -0,0 +1,217 @@
+"""
+Streaming export of raw sensor readings.
+
+CSV is produced by PostgreSQL itself with COPY (SELECT ...) TO STDOUT, or written from server-side cursor
+partitions on other databases. Parquet row groups are built from the cursor partitions incrementally
+(requires the optional pyarrow package). The response body can be compressed with gzip or zstd
+(optional zstandard package), negotiated from the Accept-Encoding header.
+Memory use is bounded by the partition size and a few buffered chunks, independent of the export size.
+"""
+
+import csv
+import io
+import queue
+import threading
+import zlib
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pa = pq = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+EXPORT_COLUMNS = ("id", "timestamp", "sensor_id", "metric", "value")
+_DONE = object()
+
+
+class _QueueWriter:
+    """File-like target of COPY TO STDOUT, hands the written chunks to the consumer through a bounded queue."""
+
+    def __init__(self, chunks: queue.Queue, cancelled: threading.Event):
+        self.chunks = chunks
+        self.cancelled = cancelled
+
+    def write(self, data) -> None:
+        data = data.encode() if isinstance(data, str) else bytes(data)
+        while True:
+            if self.cancelled.is_set():
+                raise IOError("Export cancelled by the client")
+            try:
+                self.chunks.put(data, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+
+def copy_to_stdout(dbapi_connection, copy_sql: str, max_buffered_chunks: int = 64) -> Iterator[bytes]:
+    """
+    Run COPY ... TO STDOUT on a psycopg2 connection and yield the output while it is produced.
+
+    The COPY runs in a helper thread. A bounded queue gives backpressure: when the client reads slower
+    than the database writes, the COPY waits. Closing the generator (e.g. client disconnect) aborts the COPY.
+
+    Args:
+        dbapi_connection: The psycopg2 connection. Not used by anyone else until the generator is exhausted.
+        copy_sql (str): The complete COPY statement.
+        max_buffered_chunks (int): Number of output chunks buffered between the COPY and the client.
+
+    Yields:
+        bytes: COPY output chunks.
+    """
+    chunks: queue.Queue = queue.Queue(maxsize=max_buffered_chunks)
+    cancelled = threading.Event()
+    errors: List[BaseException] = []
+
+    def run_copy():
+        try:
+            with dbapi_connection.cursor() as cursor:
+                cursor.copy_expert(copy_sql, _QueueWriter(chunks, cancelled))
+        except BaseException as e:  # pylint: disable=broad-except
+            errors.append(e)
+        finally:
+            while not cancelled.is_set():
+                try:
+                    chunks.put(_DONE, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+
+    worker = threading.Thread(target=run_copy, name="export-copy", daemon=True)
+    worker.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is _DONE:
+                break
+            yield chunk
+        if errors:
+            raise errors[0]
+    finally:
+        cancelled.set()
+        worker.join()
+
+
+def rows_to_csv(partitions: Iterable[List[Tuple]]) -> Iterator[bytes]:
+    """CSV (with header, in the format of COPY ... WITH (FORMAT csv)) of row partitions, one chunk per partition."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in partitions:
+        writer.writerows(
+            (row_id, timestamp, sensor_id, getattr(metric, "value", metric), value)
+            for row_id, timestamp, sensor_id, metric, value in rows
+        )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file collecting the Parquet writer output until it is drained."""
+
+    def __init__(self):
+        super().__init__()
+        self.parts: List[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        data, self.parts = b"".join(self.parts), []
+        return data
+
+
+def parquet_available() -> bool:
+    """True when the optional pyarrow package is installed."""
+    return pq is not None
+
+
+def rows_to_parquet(partitions: Iterable[List[Tuple]]) -> Iterator[bytes]:
+    """
+    Parquet file of row partitions, one row group per partition, streamed as the row groups are written.
+
+    Raises:
+        RuntimeError: pyarrow is not installed.
+    """
+    if pq is None:
+        raise RuntimeError("Parquet export requires the pyarrow package")
+    schema = pa.schema(
+        [
+            ("id", pa.string()),
+            ("timestamp", pa.timestamp("us")),
+            ("sensor_id", pa.string()),
+            ("metric", pa.string()),
+            ("value", pa.float64()),
+        ]
+    )
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        for rows in partitions:
+            columns = list(zip(*rows)) if rows else [[] for _ in EXPORT_COLUMNS]
+            writer.write_table(
+                pa.table(
+                    [
+                        [str(row_id) for row_id in columns[0]],
+                        list(columns[1]),
+                        list(columns[2]),
+                        [getattr(metric, "value", metric) for metric in columns[3]],
+                        list(columns[4]),
+                    ],
+                    schema=schema,
+                )
+            )
+            yield sink.drain()
+    yield sink.drain()
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Pick the response compression from an Accept-Encoding header: zstd (when available) before gzip.
+
+    Returns:
+        Optional[str]: "zstd", "gzip" or None for an uncompressed response.
+    """
+    accepted = set()
+    for item in (accept_encoding or "").split(","):
+        name, _, params = item.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip().lower())
+    if "zstd" in accepted and zstandard is not None:
+        return "zstd"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(chunks: Iterable[bytes], encoding: Optional[str]) -> Iterator[bytes]:
+    """Compress a stream of chunks with the negotiated encoding, or pass it through."""
+    if encoding is None:
+        yield from chunks
+        return
+    if encoding == "zstd":
+        compressor = zstandard.ZstdCompressor(level=3).compressobj()
+    else:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
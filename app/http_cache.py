@@ -0,0 +1,109 @@
+"""
+HTTP cache validation of sensor data queries.
+
+Readings are append-only and idempotent, so the answer of a query only changes when readings arrive in its
+range. The per sensor, per day ingest watermarks (row count and value sum of the sensor_stats day buckets,
+maintained on ingest) of the queried range identify the data version. The ETag is a digest of the endpoint,
+its query parameters and those watermarks:
+
+* If-None-Match with a current ETag is answered with 304 before the endpoint runs its query.
+* Closed ranges (date_to older than HTTP_CACHE_CLOSED_AFTER_S) get a long public Cache-Control lifetime,
+  so browser and proxy caches serve polling dashboards. Open ranges get "no-cache": caches revalidate
+  every time, which costs one watermark lookup instead of the query.
+* Requests without If-None-Match on an open range have nothing to validate and nothing a cache may keep,
+  they skip the watermark lookup and get no ETag.
+"""
+
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+from fastapi import Depends, HTTPException, Request, Response
+from .alignment import to_naive_utc
+from .config import get_settings
+from .dal import SensorDataDAL, get_sensor_data_dal, parse_iso_datetime
+from .metrics import HTTP_CACHE_VALIDATION
+from .models import MetricEnum
+from .result_cache import QueryKey
+
+FILTER_PARAMS = ("sensor_id", "metric", "date_from", "date_to")
+
+
+def compute_etag(request: Request, filters: QueryKey, watermark: tuple) -> str:
+    """
+    Weak ETag of the endpoint, its normalized filters, its other query parameters and the data watermark.
+    Equivalent queries (filters in any order, any ISO 8601 notation of the same instant) get the same ETag.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(request.url.path.encode())
+    digest.update(repr(filters).encode())
+    for key, value in sorted(request.query_params.multi_items()):
+        if key not in FILTER_PARAMS:
+            digest.update(f"\x1f{key}={value}".encode())
+    digest.update(repr(watermark).encode())
+    return f'W/"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header with the current ETag."""
+    if not if_none_match:
+        return False
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip() == "*" or tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def cache_control(date_to: Optional[datetime]) -> str:
+    """Cache-Control of a range: long lived when it is closed, always revalidated otherwise."""
+    settings = get_settings()
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    if date_to is not None and date_to < now - timedelta(seconds=settings.http_cache_closed_after_s):
+        return f"public, max-age={settings.http_cache_max_age_s}"
+    return "no-cache"
+
+
+def cache_headers(request: Request, dal: SensorDataDAL) -> Optional[Dict[str, str]]:
+    """
+    ETag and Cache-Control of a sensor data query. Filters are taken from the sensor_id, metric,
+    date_from and date_to query parameters.
+
+    Returns:
+        Optional[Dict[str, str]]: The headers, None when the filters are invalid (the endpoint reports the error).
+            Without ETag when the request is not conditional and the range is open.
+    """
+    params = request.query_params
+    date_from, date_to = params.get("date_from"), params.get("date_to")
+    try:
+        metrics = [MetricEnum(metric).value for metric in params.getlist("metric")] or None
+        end = to_naive_utc(parse_iso_datetime(date_to)) if date_to else None
+        control = cache_control(end)
+        if "if-none-match" not in request.headers and control == "no-cache":
+            return {"Cache-Control": control}
+        filters = QueryKey.from_filters(params.getlist("sensor_id"), metrics, date_from, date_to)
+        watermark = dal.get_ingest_watermark(params.getlist("sensor_id") or None, metrics, date_from, date_to)
+    except ValueError:
+        return None
+    return {"ETag": compute_etag(request, filters, watermark), "Cache-Control": control}
+
+
+def check_not_modified(request: Request, headers: Dict[str, str]) -> None:
+    """
+    Raises:
+        HTTPException: 304 Not Modified when If-None-Match holds the ETag of the headers.
+    """
+    if "ETag" in headers and etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        HTTP_CACHE_VALIDATION.labels("not_modified").inc()
+        raise HTTPException(status_code=304, headers=headers)
+    HTTP_CACHE_VALIDATION.labels("modified").inc()
+
+
+def validate_cache(request: Request, response: Response, dal: SensorDataDAL = Depends(get_sensor_data_dal)) -> None:
+    """
+    Route dependency of the cacheable sensor data queries.
+
+    Raises:
+        HTTPException: 304 Not Modified when If-None-Match holds the current ETag.
+    """
+    headers = cache_headers(request, dal)
+    if headers is None:
+        return
+    check_not_modified(request, headers)
+    response.headers.update(headers)
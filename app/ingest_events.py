@@ -0,0 +1,87 @@
+"""
+Post-commit notifications of the ingest path.
+
+Components that derive state from the raw readings (result cache, live subscribers, ...) register a
+listener. After every committed ingest transaction the DAL calls notify_ingested() with the written
+rows; listeners get them as an IngestBatch, with the written series and their time spans. Listeners run
+synchronously in the ingest thread, so they must be fast and must not raise; exceptions are logged
+and swallowed.
+"""
+
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from functools import cached_property
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+SeriesKey = Tuple[str, str]
+
+
+@dataclass
+class SeriesSpan:
+    """Readings written to a series in one transaction."""
+
+    count: int
+    first: datetime  # Earliest timestamp of the written readings.
+    last: datetime  # Latest timestamp of the written readings.
+
+
+class IngestBatch:
+    """Rows committed by one ingest transaction."""
+
+    def __init__(self, rows: Sequence):
+        self.rows = rows  # Objects with id, sensor_id, metric, value and timestamp attributes.
+
+    @cached_property
+    def spans(self) -> Dict[SeriesKey, SeriesSpan]:
+        """The written series and their time spans."""
+        return series_spans(self.rows)
+
+
+IngestListener = Callable[[IngestBatch], None]
+_listeners: List[IngestListener] = []
+_lock = threading.Lock()
+
+
+def add_ingest_listener(listener: IngestListener) -> None:
+    """Register a listener called with the IngestBatch of each committed ingest."""
+    with _lock:
+        if listener not in _listeners:
+            _listeners.append(listener)
+
+
+def remove_ingest_listener(listener: IngestListener) -> None:
+    """Unregister a listener."""
+    with _lock:
+        if listener in _listeners:
+            _listeners.remove(listener)
+
+
+def series_spans(rows: Iterable) -> Dict[SeriesKey, SeriesSpan]:
+    """Group written rows (with sensor_id, metric and timestamp attributes) into series spans."""
+    spans: Dict[SeriesKey, SeriesSpan] = {}
+    for row in rows:
+        key = (row.sensor_id, getattr(row.metric, "value", row.metric))
+        span = spans.get(key)
+        if span is None:
+            spans[key] = SeriesSpan(1, row.timestamp, row.timestamp)
+        else:
+            span.count += 1
+            span.first = min(span.first, row.timestamp)
+            span.last = max(span.last, row.timestamp)
+    return spans
+
+
+def notify_ingested(rows: Sequence) -> None:
+    """Call the listeners with the committed rows. No-op without rows or listeners."""
+    if not _listeners or not rows:
+        return
+    batch = IngestBatch(rows)
+    for listener in list(_listeners):
+        try:
+            listener(batch)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Ingest listener %r failed", listener)
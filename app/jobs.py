@@ -0,0 +1,278 @@
+"""
+Asynchronous execution of long running list, aggregate and ask requests.
+
+POST /jobs returns a job ID right away; a bounded thread pool runs the job with its own database sessions,
+so the request latency does not depend on the query latency and a client or proxy timeout does not kill the
+work halfway. Clients poll the job (optionally long polling) or follow its completion event stream.
+
+A submission equal to a queued or running job (same kind and normalized parameters) is coalesced: it gets
+the ID of the job in flight instead of starting the work again. Finished jobs keep their result for a
+limited time, then they are dropped. The job store is in memory, per process.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from fastapi import HTTPException
+from app import schemas
+from app.ask import answer_question
+from app.config import get_settings
+from app.dal import open_sensor_data_dal
+from app.llm_sql import get_llm_agent
+from app.metrics import JOB_DURATION, JOBS, JOBS_PENDING
+from app.sql_templates import get_sql_template_cache
+
+logger = logging.getLogger(__name__)
+
+JobRunner = Callable[[schemas.JobRequest], Any]
+
+
+class JobQueueFull(Exception):
+    """The limit of queued and running jobs is reached."""
+
+
+@dataclass
+class Job:
+    """A submitted job and, once finished, its result."""
+
+    id: str
+    request: schemas.JobRequest
+    key: str
+    status: schemas.JobStatus = schemas.JobStatus.QUEUED
+    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    expires_at: Optional[datetime] = None
+    expires: float = 0.0  # Monotonic expiry, set on completion.
+    result: Any = None  # JSON compatible.
+    error: Optional[str] = None
+    error_status: Optional[int] = None
+    waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = field(default_factory=list)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (schemas.JobStatus.SUCCEEDED, schemas.JobStatus.FAILED)
+
+    def to_out(self) -> schemas.JobOut:
+        """ Convert the job to its JobOut schema instance """
+        return schemas.JobOut(
+            id=self.id,
+            kind=self.request.kind,
+            status=self.status,
+            created_at=self.created_at,
+            started_at=self.started_at,
+            finished_at=self.finished_at,
+            expires_at=self.expires_at,
+            result=self.result,
+            error=self.error,
+            error_status=self.error_status,
+        )
+
+
+class JobManager:
+    """Bounded worker pool and in-memory store of the asynchronous jobs."""
+
+    def __init__(
+        self,
+        run: JobRunner,
+        workers: int,
+        max_pending: int,
+        result_ttl: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            run (JobRunner): Executes a job request in a worker thread and returns its JSON compatible result.
+                HTTPExceptions become job errors with their status and detail.
+            workers (int): Jobs running concurrently.
+            max_pending (int): Limit of queued and running jobs, further submissions are rejected.
+            result_ttl (float): Seconds a finished job and its result are kept.
+            clock (Callable[[], float]): Monotonic clock, replaceable in tests.
+        """
+        self.run = run
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.clock = clock
+        self.pending = 0
+        self._jobs: Dict[str, Job] = {}
+        self._in_flight: Dict[str, Job] = {}  # By request key, for coalescing.
+        self._finished: "OrderedDict[str, Job]" = OrderedDict()  # In completion (and so expiry) order.
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+
+    def submit(self, request: schemas.JobRequest) -> Tuple[Job, bool]:
+        """
+        Queue a job, or join the queued or running job of an equal request.
+
+        Returns:
+            Tuple[Job, bool]: The job and whether the submission was coalesced into an existing one.
+
+        Raises:
+            JobQueueFull: The limit of queued and running jobs is reached.
+        """
+        key = request.key()
+        kind = request.kind.value
+        with self._lock:
+            self._purge()
+            job = self._in_flight.get(key)
+            if job is not None:
+                JOBS.labels(kind, "coalesced").inc()
+                return job, True
+            if self.pending >= self.max_pending:
+                JOBS.labels(kind, "rejected").inc()
+                raise JobQueueFull()
+            job = Job(id=str(uuid.uuid4()), request=request, key=key)
+            self._jobs[job.id] = job
+            self._in_flight[key] = job
+            self.pending += 1
+            JOBS_PENDING.set(self.pending)
+        JOBS.labels(kind, "submitted").inc()
+        self._executor.submit(self._execute, job)
+        return job, False
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """A job by ID, None when unknown or expired."""
+        with self._lock:
+            self._purge()
+            return self._jobs.get(job_id)
+
+    async def wait(self, job: Job, timeout: Optional[float]) -> bool:
+        """Wait on the running event loop until the job is finished. Returns False when the timeout passed."""
+        loop = asyncio.get_running_loop()
+        waiter = (loop, loop.create_future())
+        with self._lock:
+            if job.finished:
+                return True
+            job.waiters.append(waiter)
+        try:
+            async with asyncio.timeout(timeout):
+                await waiter[1]
+            return True
+        except TimeoutError:
+            return False
+        finally:
+            with self._lock:
+                if waiter in job.waiters:
+                    job.waiters.remove(waiter)
+
+    def shutdown(self) -> None:
+        """Stop the workers. Queued jobs fail with 503 and their waiters are released, running jobs finish."""
+        with self._lock:
+            queued = [job for job in self._in_flight.values() if job.status == schemas.JobStatus.QUEUED]
+            for job in queued:
+                JOBS.labels(job.request.kind.value, "cancelled").inc()
+                self._finish(job, None, schemas.JobStatus.FAILED, "Job cancelled on shutdown", 503)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _execute(self, job: Job) -> None:
+        """Run a job in a worker thread and store its outcome."""
+        with self._lock:
+            if job.status != schemas.JobStatus.QUEUED:
+                return  # Cancelled on shutdown.
+            job.started_at = datetime.now(timezone.utc)
+            job.status = schemas.JobStatus.RUNNING
+        start = time.perf_counter()
+        try:
+            result, status, error, error_status = self.run(job.request), schemas.JobStatus.SUCCEEDED, None, None
+        except HTTPException as e:
+            result, status, error, error_status = None, schemas.JobStatus.FAILED, str(e.detail), e.status_code
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Job %s failed", job.id)
+            result, status, error, error_status = None, schemas.JobStatus.FAILED, "Job execution error", 500
+        JOB_DURATION.labels(job.request.kind.value).observe(time.perf_counter() - start)
+        JOBS.labels(job.request.kind.value, status.value).inc()
+
+        with self._lock:
+            self._finish(job, result, status, error, error_status)
+
+    def _finish(
+        self, job: Job, result: Any, status: schemas.JobStatus, error: Optional[str], error_status: Optional[int]
+    ) -> None:
+        """Store the outcome of a job and wake its waiters. Called with the lock held."""
+        job.result, job.error, job.error_status = result, error, error_status
+        job.finished_at = datetime.now(timezone.utc)
+        job.expires_at = job.finished_at + timedelta(seconds=self.result_ttl)
+        job.expires = self.clock() + self.result_ttl
+        job.status = status
+        if self._in_flight.get(job.key) is job:
+            del self._in_flight[job.key]
+        self._finished[job.id] = job
+        self.pending -= 1
+        JOBS_PENDING.set(self.pending)
+        waiters, job.waiters = job.waiters, []
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, future)
+            except RuntimeError:
+                pass  # The loop is closed, its waiter is gone.
+
+    def _purge(self) -> None:
+        """Drop the expired finished jobs. Called with the lock held."""
+        now = self.clock()
+        while self._finished:
+            job_id, job = next(iter(self._finished.items()))
+            if job.expires > now:
+                break
+            del self._finished[job_id]
+            del self._jobs[job_id]
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+def run_job(request: schemas.JobRequest) -> Any:
+    """
+    Executes a job request with its own database sessions, the way the corresponding endpoint would.
+
+    Args:
+        request (schemas.JobRequest): The validated job request.
+
+    Returns:
+        Any: JSON compatible result: sensor data records (list), statistics (aggregate) or the ask response.
+    """
+    with open_sensor_data_dal() as dal:
+        if request.kind == schemas.JobKind.ASK:
+            response = answer_question(request.question, dal, get_llm_agent(), get_sql_template_cache())
+            return response.model_dump(mode="json")
+
+        metric_strings = [metric.value for metric in request.metrics] if request.metrics else None
+        if request.kind == schemas.JobKind.LIST:
+            rows = dal.list_sensor_data(request.sensor_ids, metric_strings, request.date_from, request.date_to)
+            return [item.model_dump(mode="json") for item in schemas.SensorDataOut.from_models(rows)]
+        results = dal.get_sensor_stats(request.sensor_ids, metric_strings, request.date_from, request.date_to)
+        return [
+            schemas.SensorStatsOut.from_stats(sensor_id, metric, stats).model_dump(mode="json")
+            for sensor_id, metric, stats in results
+        ]
+
+
+_manager: Optional[JobManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    """Get the application wide job manager for DI."""
+    global _manager  # pylint: disable=global-statement
+    with _manager_lock:
+        if _manager is None:
+            settings = get_settings()
+            _manager = JobManager(run_job, settings.job_workers, settings.job_max_pending, settings.job_result_ttl_s)
+        return _manager
+
+
+def shutdown_job_manager() -> None:
+    """Stop the workers on application shutdown."""
+    global _manager  # pylint: disable=global-statement
+    with _manager_lock:
+        if _manager is not None:
+            _manager.shutdown()
+            _manager = None
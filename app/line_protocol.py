@@ -0,0 +1,392 @@
+"""
+Line protocol ingest listener.
+
+A compact alternative to the JSON API for constrained devices and edge gateways, similar to the
+Influx line protocol. Every line is one reading:
+
+    sensor_id,metric value [timestamp]
+
+The timestamp is an integer Unix epoch in LINE_PROTOCOL_PRECISION units (nanoseconds by default);
+the receive time is used when it is missing. Empty lines and lines starting with # are ignored,
+invalid lines are counted and skipped.
+
+The listener runs on the application's event loop over TCP (newline delimited stream) and UDP (one
+or more lines per datagram). Parsed readings are collected into batches, which are written by a small
+thread pool through SensorDataDAL.write_readings() (COPY on PostgreSQL). When the writers fall behind,
+TCP connections are not read anymore (the kernel buffers and the client's send blocks), UDP readings
+over the buffer capacity are dropped. Readings of a batch whose write fails are lost and counted.
+
+Readings are admitted by the same ingest admission control as the HTTP endpoints (token buckets and
+bounded ingest queue): throttled TCP connections are not read until the Retry-After delay has passed,
+throttled UDP readings are dropped. The listener binds LINE_PROTOCOL_HOST, the loopback address by
+default, as the protocol has no authentication.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from typing import Callable, List, Optional, Set, Tuple
+from .admission import AdmissionController, AdmissionRejected, get_admission_controller
+from .config import get_settings
+from .dal import IngestResult, Reading, SensorDataDAL
+from .database import SessionLocal
+from .dedup import get_recent_key_filter
+from .edge import get_daily_partitions
+from .metrics import LINE_PROTOCOL_READINGS
+from .models import MetricEnum
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1)
+MAX_LINE_LENGTH = 4096
+SENSOR_ID_MAX_LENGTH = 300  # Same limit as schemas.SensorDataIn.
+_METRICS = {metric.value.encode(): metric for metric in MetricEnum}
+# Version 4 and RFC 4122 variant bits of random UUIDs, as set by uuid.uuid4().
+_UUID4_CLEAR = ~(0xC000 << 48 | 0xF000 << 64)
+_UUID4_SET = 0x8000 << 48 | 0x4000 << 64
+# Timestamp unit to microseconds: (multiplier, divisor).
+PRECISIONS = {"s": (1_000_000, 1), "ms": (1000, 1), "us": (1, 1), "ns": (1, 1000)}
+
+
+def parse_line(
+    line: bytes, precision: str = "ns", received: Optional[datetime] = None, row_id: Optional[uuid.UUID] = None
+) -> Reading:
+    """
+    Parse one line.
+
+    Args:
+        line (bytes): The line without the line terminator.
+        precision (str): Unit of the timestamp.
+        received (Optional[datetime]): Timestamp of readings without one (naive UTC). Defaults to now.
+        row_id (Optional[uuid.UUID]): ID of the reading. Defaults to a new random UUID.
+
+    Raises:
+        ValueError: The line is not a valid reading.
+
+    Returns:
+        Reading: The reading with a new ID.
+    """
+    key, _, rest = line.strip().partition(b" ")
+    sensor_id, _, metric = key.rpartition(b",")
+    value, _, timestamp = rest.strip().partition(b" ")
+    if not sensor_id or len(sensor_id) > SENSOR_ID_MAX_LENGTH:
+        raise ValueError("Invalid sensor ID")
+    try:
+        metric = _METRICS[metric]
+    except KeyError:
+        raise ValueError(f"Unknown metric {metric!r}") from None
+    value = float(value)
+    if not math.isfinite(value):
+        raise ValueError("Value must be finite")
+    if timestamp:
+        multiplier, divisor = PRECISIONS[precision]
+        timestamp = EPOCH + timedelta(microseconds=int(timestamp) * multiplier // divisor)
+    else:
+        timestamp = received or datetime.now(timezone.utc).replace(tzinfo=None)
+    return Reading(row_id or uuid.uuid4(), timestamp, sensor_id.decode(), metric, value)
+
+
+def parse_lines(data: bytes, precision: str = "ns") -> Tuple[List[Reading], int]:
+    """
+    Parse newline separated lines.
+
+    Returns:
+        Tuple[List[Reading], int]: The valid readings and the number of invalid lines.
+    """
+    readings: List[Reading] = []
+    append = readings.append
+    invalid = 0
+    received = datetime.now(timezone.utc).replace(tzinfo=None)
+    lines = data.split(b"\n")
+    # Random bits of all IDs in one call, uuid4() per line would be half of the parse time.
+    entropy = os.urandom(16 * len(lines))
+    for i, line in enumerate(lines):
+        if not line or line[0] == 35 or line.isspace():  # 35: "#"
+            continue
+        row_id = uuid.UUID(int=(int.from_bytes(entropy[16 * i:16 * i + 16]) & _UUID4_CLEAR) | _UUID4_SET)
+        try:
+            append(parse_line(line, precision, received, row_id))
+        except (ValueError, OverflowError):
+            invalid += 1
+    return readings, invalid
+
+
+def write_with_session(readings: List[Reading]) -> IngestResult:
+    """Write a batch in its own session. Runs in a writer thread."""
+    with SessionLocal() as session:
+        return SensorDataDAL(
+            session, recent_keys=get_recent_key_filter(), partitions=get_daily_partitions()
+        ).write_readings(readings)
+
+
+class ReadingBatcher:
+    """Collects readings into batches and writes them with a bounded number of concurrent writes."""
+
+    def __init__(
+        self,
+        write: Callable[[List[Reading]], IngestResult],
+        batch_size: int,
+        flush_interval: float,
+        writers: int,
+        admission: Optional[AdmissionController] = None,
+    ):
+        """
+        Args:
+            write (Callable[[List[Reading]], IngestResult]): Writes a batch, called in a writer thread.
+            batch_size (int): Readings per batch.
+            flush_interval (float): Longest time (seconds) a partial batch waits for more readings.
+            writers (int): Concurrent batch writes. Up to writers * batch_size readings are buffered.
+            admission (Optional[AdmissionController]): Ingest admission control, None admits everything.
+        """
+        self.write = write
+        self.admission = admission
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.writers = writers
+        self.capacity = writers * batch_size
+        self._buffer: List[Reading] = []
+        self._in_flight: Set[asyncio.Future] = set()
+        self._slot_free = asyncio.Event()
+        self._executor = ThreadPoolExecutor(max_workers=writers, thread_name_prefix="line-protocol-writer")
+        self._flusher: Optional[asyncio.Task] = None
+        self._retry_after = 1
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def start(self) -> None:
+        """Start flushing partial batches periodically."""
+        self._flusher = asyncio.get_running_loop().create_task(self._flush_periodically())
+
+    async def add(self, readings: List[Reading]) -> None:
+        """Add readings, waiting while ingest is throttled or the buffer is full (backpressure of stream transports)."""
+        while not self._admit(readings):
+            await asyncio.sleep(self._retry_after)
+        self._buffer.extend(readings)
+        self._dispatch(full_only=True)
+        while len(self._buffer) >= self.capacity:
+            self._slot_free.clear()
+            await self._slot_free.wait()
+            self._dispatch(full_only=True)
+
+    def offer(self, readings: List[Reading]) -> int:
+        """
+        Add readings without waiting, dropping all of them when ingest is throttled and the ones over the
+        buffer capacity.
+
+        Returns:
+            int: Number of dropped readings.
+        """
+        if not self._admit(readings):
+            return len(readings)
+        room = max(self.capacity - len(self._buffer), 0)
+        self._buffer.extend(readings[:room])
+        self._dispatch(full_only=True)
+        dropped = max(len(readings) - room, 0)
+        self._release(dropped)
+        return dropped
+
+    def _admit(self, readings: List[Reading]) -> bool:
+        """Admit readings into the ingest queue, False (and the delay in _retry_after) when throttled."""
+        if self.admission is None or not readings:
+            return True
+        lane = self.admission.lane(reading.timestamp for reading in readings)
+        try:
+            self.admission.try_admit(Counter(reading.sensor_id for reading in readings), lane)
+        except AdmissionRejected as e:
+            self._retry_after = e.retry_after
+            return False
+        return True
+
+    def _release(self, size: int) -> None:
+        if self.admission is not None and size:
+            self.admission.release(size)
+
+    async def close(self) -> None:
+        """Write the buffered readings and wait for the running writes."""
+        if self._flusher is not None:
+            self._flusher.cancel()
+        while self._buffer:
+            self._dispatch(full_only=False)
+            if self._buffer:
+                self._slot_free.clear()
+                await self._slot_free.wait()
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+        self._executor.shutdown(wait=True)
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self._dispatch(full_only=False)
+
+    def _dispatch(self, full_only: bool) -> None:
+        """Start writes of the buffered readings while writers are free."""
+        while self._buffer and len(self._in_flight) < self.writers:
+            if full_only and len(self._buffer) < self.batch_size:
+                return
+            batch = self._buffer[: self.batch_size]
+            del self._buffer[: self.batch_size]
+            future = asyncio.get_running_loop().run_in_executor(self._executor, self.write, batch)
+            self._in_flight.add(future)
+            future.add_done_callback(partial(self._written, len(batch)))
+
+    def _written(self, size: int, future: asyncio.Future) -> None:
+        self._in_flight.discard(future)
+        self._release(size)
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("Line protocol batch of %d readings failed", size, exc_info=future.exception())
+            LINE_PROTOCOL_READINGS.labels("any", "failed").inc(size)
+        self._slot_free.set()
+        if len(self._buffer) >= self.batch_size:
+            self._dispatch(full_only=True)
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server: "LineProtocolServer"):
+        self.server = server
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        readings, invalid = parse_lines(data, self.server.precision)
+        dropped = self.server.batcher.offer(readings)
+        _count("udp", len(readings) - dropped, invalid, dropped)
+
+
+def _count(transport: str, accepted: int, invalid: int, dropped: int = 0) -> None:
+    if accepted:
+        LINE_PROTOCOL_READINGS.labels(transport, "accepted").inc(accepted)
+    if invalid:
+        LINE_PROTOCOL_READINGS.labels(transport, "invalid").inc(invalid)
+    if dropped:
+        LINE_PROTOCOL_READINGS.labels(transport, "dropped").inc(dropped)
+
+
+class LineProtocolServer:
+    """TCP and UDP line protocol listeners sharing one batcher."""
+
+    READ_SIZE = 256 * 1024
+
+    def __init__(
+        self,
+        batcher: ReadingBatcher,
+        host: str = "127.0.0.1",
+        tcp_port: Optional[int] = None,
+        udp_port: Optional[int] = None,
+        precision: str = "ns",
+    ):
+        """
+        Args:
+            batcher (ReadingBatcher): Collects and writes the readings.
+            host (str): Listen address.
+            tcp_port (Optional[int]): TCP port, None disables TCP. 0 binds an ephemeral port.
+            udp_port (Optional[int]): UDP port, None disables UDP. 0 binds an ephemeral port.
+            precision (str): Unit of the timestamps: s, ms, us or ns.
+        """
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown timestamp precision {precision!r}")
+        self.batcher = batcher
+        self.host = host
+        self.tcp_port = tcp_port
+        self.udp_port = udp_port
+        self.precision = precision
+        self._tcp_server: Optional[asyncio.AbstractServer] = None
+        self._udp_transport: Optional[asyncio.DatagramTransport] = None
+
+    @classmethod
+    def from_settings(cls) -> Optional["LineProtocolServer"]:
+        """Server configured by the LINE_PROTOCOL_* settings, None when no port is set."""
+        settings = get_settings()
+        if not settings.line_protocol_tcp_port and not settings.line_protocol_udp_port:
+            return None
+        batcher = ReadingBatcher(
+            write_with_session,
+            settings.line_protocol_batch_size,
+            settings.line_protocol_flush_interval_s,
+            settings.line_protocol_writers,
+            get_admission_controller(),
+        )
+        return cls(
+            batcher,
+            settings.line_protocol_host,
+            settings.line_protocol_tcp_port or None,
+            settings.line_protocol_udp_port or None,
+            settings.line_protocol_precision,
+        )
+
+    async def start(self) -> None:
+        """Bind the listeners. Bound ephemeral ports are stored in tcp_port and udp_port."""
+        loop = asyncio.get_running_loop()
+        self.batcher.start()
+        if self.tcp_port is not None:
+            self._tcp_server = await asyncio.start_server(self._handle_connection, self.host, self.tcp_port)
+            self.tcp_port = self._tcp_server.sockets[0].getsockname()[1]
+        if self.udp_port is not None:
+            self._udp_transport, _ = await loop.create_datagram_endpoint(
+                lambda: _DatagramProtocol(self), local_addr=(self.host, self.udp_port)
+            )
+            self.udp_port = self._udp_transport.get_extra_info("sockname")[1]
+        logger.info("Line protocol listener on %s, tcp %s, udp %s", self.host, self.tcp_port, self.udp_port)
+
+    async def stop(self) -> None:
+        """Stop listening, then write the buffered readings."""
+        if self._udp_transport is not None:
+            self._udp_transport.close()
+        if self._tcp_server is not None:
+            self._tcp_server.close()
+            await self._tcp_server.wait_closed()
+        await self.batcher.close()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        pending = b""
+        try:
+            while True:
+                data = await reader.read(self.READ_SIZE)
+                if not data:
+                    break
+                if pending:
+                    data = pending + data
+                cut = data.rfind(b"\n")
+                if cut < 0:
+                    if len(data) > MAX_LINE_LENGTH:
+                        _count("tcp", 0, 1)
+                        break  # Not line protocol, drop the connection.
+                    pending = data
+                    continue
+                pending = data[cut + 1:]
+                await self._accept(data[:cut])
+            if pending:
+                await self._accept(pending)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _accept(self, data: bytes) -> None:
+        readings, invalid = parse_lines(data, self.precision)
+        _count("tcp", len(readings), invalid)
+        await self.batcher.add(readings)
+
+
+line_protocol_server: Optional[LineProtocolServer] = None
+
+
+async def start_line_protocol_listener() -> None:
+    """Start the listener configured by the settings, if any. Called on application startup."""
+    global line_protocol_server  # pylint: disable=global-statement
+    line_protocol_server = LineProtocolServer.from_settings()
+    if line_protocol_server is not None:
+        await line_protocol_server.start()
+
+
+async def stop_line_protocol_listener() -> None:
+    """Stop the listener and write the buffered readings. Called on application shutdown."""
+    global line_protocol_server  # pylint: disable=global-statement
+    if line_protocol_server is not None:
+        await line_protocol_server.stop()
+        line_protocol_server = None
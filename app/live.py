@@ -0,0 +1,224 @@
+"""
+In-process publish/subscribe of newly ingested readings.
+
+Clients subscribe to sensor IDs and/or metrics (none: everything) through the WebSocket or SSE endpoints.
+After every committed ingest the hub gets the written rows (see app.ingest_events): each reading is
+encoded to JSON once in the ingest thread, then one callback per event loop fans the batch out to the
+matching subscribers. A subscriber receives one message per ingest batch, a JSON array of its readings.
+
+Every subscriber has a bounded queue. A consumer that does not keep up (queue full) is disconnected
+instead of slowing down ingest or the other subscribers; it can reconnect and catch up with /sensors/list.
+"""
+
+import asyncio
+import json
+import threading
+from collections import defaultdict, deque
+from typing import Deque, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+from .config import get_settings
+from .ingest_events import IngestBatch, add_ingest_listener
+from .metrics import LIVE_DELIVERED, LIVE_DISCONNECTS, LIVE_SUBSCRIBERS
+
+SLOW_CONSUMER = "slow_consumer"
+Encoded = Tuple[str, str, str]  # (sensor_id, metric, JSON object of the reading)
+
+
+class HubFull(Exception):
+    """The subscriber limit is reached."""
+
+
+class Subscriber:
+    """A live subscription, consumed by one connection on one event loop."""
+
+    def __init__(
+        self,
+        sensor_ids: Optional[Iterable[str]],
+        metrics: Optional[Iterable[str]],
+        queue_size: int,
+        loop: asyncio.AbstractEventLoop,
+    ):
+        self.sensor_ids: Optional[FrozenSet[str]] = frozenset(sensor_ids) if sensor_ids else None
+        self.metrics: Optional[FrozenSet[str]] = frozenset(metrics) if metrics else None
+        self.queue_size = queue_size
+        self.loop = loop
+        self.closed: Optional[str] = None  # Reason once the subscription ended.
+        self._messages: Deque[str] = deque()
+        self._ready = asyncio.Event()
+
+    def push(self, message: str) -> bool:
+        """Queue a message. Returns False when the queue is full. Runs on the subscriber's loop."""
+        if len(self._messages) >= self.queue_size:
+            return False
+        self._messages.append(message)
+        self._ready.set()
+        return True
+
+    def close(self, reason: str) -> None:
+        """End the subscription, get() returns None once the queued messages are consumed."""
+        if self.closed is None:
+            self.closed = reason
+            self._ready.set()
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[str]:
+        """
+        Next message. Returns None when the subscription was closed by the hub, or the timeout passed.
+        A slow consumer gets None right away, its queued messages are discarded.
+        """
+        while not self._messages:
+            if self.closed is not None:
+                return None
+            self._ready.clear()
+            try:
+                async with asyncio.timeout(timeout):
+                    await self._ready.wait()
+            except TimeoutError:
+                return None
+        if self.closed == SLOW_CONSUMER:
+            self._messages.clear()
+            return None
+        return self._messages.popleft()
+
+
+class LiveHub:
+    """Routes ingested readings to the matching subscribers."""
+
+    def __init__(self, queue_size: int, max_subscribers: int):
+        """
+        Args:
+            queue_size (int): Messages (ingest batches) queued per subscriber before it is disconnected.
+            max_subscribers (int): Limit of concurrent subscriptions.
+        """
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._by_sensor: Dict[str, Set[Subscriber]] = {}
+        self._by_metric: Dict[str, Set[Subscriber]] = {}
+        self._everything: Dict[str, Set[Subscriber]] = {}  # Single key "*".
+        self._loops: Dict[asyncio.AbstractEventLoop, int] = defaultdict(int)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def subscribe(self, sensor_ids: Optional[Iterable[str]] = None, metrics: Optional[Iterable[str]] = None) -> Subscriber:
+        """
+        Subscribe on the running event loop.
+
+        Raises:
+            HubFull: The subscriber limit is reached.
+        """
+        subscriber = Subscriber(sensor_ids, metrics, self.queue_size, asyncio.get_running_loop())
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                raise HubFull()
+            index, keys = self._registration(subscriber)
+            for key in keys:
+                index.setdefault(key, set()).add(subscriber)
+            self._loops[subscriber.loop] += 1
+            self._count += 1
+        LIVE_SUBSCRIBERS.set(self._count)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber, reason: str = "closed") -> None:
+        """Remove a subscription. Repeated calls are ignored."""
+        with self._lock:
+            index, keys = self._registration(subscriber)
+            if subscriber not in index.get(keys[0], ()):
+                return
+            for key in keys:
+                index[key].discard(subscriber)
+                if not index[key]:
+                    del index[key]
+            self._loops[subscriber.loop] -= 1
+            if not self._loops[subscriber.loop]:
+                del self._loops[subscriber.loop]
+            self._count -= 1
+        subscriber.close(reason)
+        LIVE_SUBSCRIBERS.set(self._count)
+        LIVE_DISCONNECTS.labels(reason).inc()
+
+    def publish(self, rows: Iterable) -> None:
+        """Hand written rows to the subscribers. Thread safe, returns without waiting for the delivery."""
+        if not self._count:
+            return
+        encoded = [
+            (row.sensor_id, metric, json.dumps(
+                {
+                    "id": str(row.id),
+                    "sensor_id": row.sensor_id,
+                    "metric": metric,
+                    "value": row.value,
+                    "timestamp": row.timestamp.isoformat(),
+                }
+            ))
+            for row in rows
+            for metric in (getattr(row.metric, "value", row.metric),)
+        ]
+        with self._lock:
+            loops = list(self._loops)
+        for loop in loops:
+            try:
+                loop.call_soon_threadsafe(self._fan_out, loop, encoded)
+            except RuntimeError:
+                pass  # The loop is closed, its subscribers are gone.
+
+    def _fan_out(self, loop: asyncio.AbstractEventLoop, encoded: List[Encoded]) -> None:
+        """Deliver encoded readings to the matching subscribers of a loop. Runs on that loop."""
+        by_sensor: Dict[Subscriber, List[str]] = defaultdict(list)
+        shared: Dict[Optional[FrozenSet[str]], Set[Subscriber]] = defaultdict(set)
+        with self._lock:
+            for sensor_id, metric, reading in encoded:
+                for subscriber in self._by_sensor.get(sensor_id, ()):
+                    if subscriber.metrics is None or metric in subscriber.metrics:
+                        by_sensor[subscriber].append(reading)
+            # Subscribers without sensor filter get the same message per metric filter.
+            for metric in {metric for _, metric, _ in encoded}:
+                for subscriber in self._by_metric.get(metric, ()):
+                    shared[subscriber.metrics].add(subscriber)
+            if self._everything:
+                shared[None].update(self._everything["*"])
+
+        messages: Dict[Tuple[str, ...], str] = {}  # Subscribers of the same sensors share the message, too.
+        deliveries = [(subscriber, tuple(readings)) for subscriber, readings in by_sensor.items()]
+        for metrics, subscribers in shared.items():
+            readings = tuple(reading for _, metric, reading in encoded if metrics is None or metric in metrics)
+            deliveries.extend((subscriber, readings) for subscriber in subscribers)
+
+        slow, delivered = [], 0
+        for subscriber, readings in deliveries:
+            if subscriber.loop is not loop:
+                continue
+            message = messages.get(readings)
+            if message is None:
+                message = messages[readings] = f"[{','.join(readings)}]"
+            if subscriber.push(message):
+                delivered += len(readings)
+            else:
+                slow.append(subscriber)
+        for subscriber in slow:
+            self.unsubscribe(subscriber, SLOW_CONSUMER)
+        LIVE_DELIVERED.inc(delivered)
+
+    def _registration(self, subscriber: Subscriber) -> Tuple[Dict[str, Set[Subscriber]], List[str]]:
+        """The index and keys a subscriber is registered under: by sensor ID, else by metric, else everything."""
+        if subscriber.sensor_ids:
+            return self._by_sensor, sorted(subscriber.sensor_ids)
+        if subscriber.metrics:
+            return self._by_metric, sorted(subscriber.metrics)
+        return self._everything, ["*"]
+
+
+_settings = get_settings()
+live_hub = LiveHub(_settings.live_queue_size, _settings.live_max_subscribers)
+
+
+def _on_ingest(batch: IngestBatch) -> None:
+    live_hub.publish(batch.rows)
+
+
+add_ingest_listener(_on_ingest)
+
+
+def get_live_hub() -> LiveHub:
+    """Get the application wide hub for DI."""
+    return live_hub
@@ -0,0 +1,187 @@
+"""
+Incremental liveness and data gap index of sensor metrics.
+
+Per sensor metric the ingest keeps when it was first and last seen, and its expected reporting interval: the
+median of the latest regular inter-arrival times (gaps are left out), so an outage does not shift it while a
+changed reporting rate is picked up after a few readings. A span between consecutive readings longer than the gap
+threshold, LIVENESS_GAP_FACTOR times the expected interval and at least LIVENESS_MIN_GAP_S, is stored as a gap
+(sensor_gaps). Late readings (backfills, replayed backlogs) falling into a stored gap split it, the parts still
+above the threshold remain gaps.
+
+A sensor metric is stale once it is not seen for a gap threshold (stale_after, indexed). Stale sensors and the
+gaps of a range are read from one row per sensor metric or per gap, independent of the number of readings.
+Neither gaps nor staleness are reported before the interval is learned (MIN_INTERVALS intervals).
+"""
+
+import json
+import statistics
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import Session
+from app import models
+from app.alignment import to_naive_utc
+from app.config import get_settings
+from app.database import dialect_insert, insert_ignore
+
+RECENT_INTERVALS = 16  # Inter-arrival times the expected interval is the median of.
+MIN_INTERVALS = 3  # Intervals needed before gaps are detected.
+
+
+def gap_threshold(interval_s: float) -> float:
+    """Seconds without a reading after which a sensor metric with the expected interval has a gap."""
+    settings = get_settings()
+    return max(interval_s * settings.liveness_gap_factor, settings.liveness_min_gap_s)
+
+
+def expected_interval(recent: List[float]) -> Optional[float]:
+    """The expected interval of the recent inter-arrival times, None while still learning."""
+    return statistics.median(recent) if len(recent) >= MIN_INTERVALS else None
+
+
+def _gaps(points: List[datetime], interval_s: float) -> List[Tuple[datetime, datetime]]:
+    """The spans between consecutive points above the gap threshold of the interval."""
+    threshold = gap_threshold(interval_s)
+    return [(a, b) for a, b in zip(points, points[1:]) if (b - a).total_seconds() > threshold]
+
+
+def _split_gaps(session: Session, sensor_id: str, metric: str, late: List[datetime]) -> None:
+    """Split the stored gaps of a sensor metric at late readings falling into them."""
+    table = models.SensorGap
+    stored = session.execute(
+        select(table)
+        .where(table.sensor_id == sensor_id, table.metric == metric)
+        .where(table.gap_start < late[-1], table.gap_end > late[0])
+        .order_by(table.gap_start)
+        .with_for_update()
+    ).scalars().all()
+    for gap in stored:
+        inside = [t for t in late if gap.gap_start < t < gap.gap_end]
+        if not inside:
+            continue
+        start, end, interval_s = gap.gap_start, gap.gap_end, gap.expected_interval_s
+        session.delete(gap)
+        session.flush()
+        for a, b in _gaps([start] + inside + [end], interval_s):
+            session.add(models.SensorGap(
+                sensor_id=sensor_id, metric=metric, gap_start=a, gap_end=b, expected_interval_s=interval_s
+            ))
+
+
+def _lock_states(session: Session, values: List[dict]) -> List[models.SensorLiveness]:
+    """
+    The liveness rows of the sensor metrics, created from the values when missing and locked for the transaction.
+    One INSERT ... ON CONFLICT DO UPDATE ... RETURNING (a no-op update, which locks the stored rows) where
+    available, like the statistics merge; otherwise the stored rows are locked and the missing ones inserted.
+    """
+    table = models.SensorLiveness
+    insert = dialect_insert(session.get_bind())
+    if insert is not None:
+        stmt = insert(table).values(values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["sensor_id", "metric"], set_={"readings": table.__table__.c.readings}
+        )
+        return list(session.scalars(stmt.returning(table), execution_options={"populate_existing": True}))
+
+    def locked(keys):
+        return session.execute(
+            select(table)
+            .where(tuple_(table.sensor_id, table.metric).in_(keys))
+            .order_by(table.sensor_id, table.metric)
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        ).scalars().all()
+
+    stored = locked([(value["sensor_id"], value["metric"]) for value in values])
+    found = {(state.sensor_id, getattr(state.metric, "value", state.metric)) for state in stored}
+    missing = [value for value in values if (value["sensor_id"], value["metric"]) not in found]
+    if not missing:
+        return list(stored)
+    insert_ignore(session, table, missing, ["sensor_id", "metric"])
+    return list(stored) + list(locked([(value["sensor_id"], value["metric"]) for value in missing]))
+
+
+def update_liveness(session: Session, rows: Iterable[models.SensorData]) -> None:
+    """
+    Advance the liveness and gap index of the sensor metrics with newly written rows, in the caller's transaction.
+
+    Args:
+        session (Session): The write session of the ingest transaction.
+        rows (Iterable[models.SensorData]): The written sensor readings.
+    """
+    batch: Dict[Tuple[str, str], List[datetime]] = defaultdict(list)
+    for row in rows:
+        batch[(row.sensor_id, getattr(row.metric, "value", row.metric))].append(to_naive_utc(row.timestamp))
+    if not batch:
+        return
+
+    # Every liveness row, anchored at the first reading when new, locked in a stable (sorted) order.
+    stored = _lock_states(
+        session,
+        [
+            {"sensor_id": s, "metric": m, "first_seen": min(batch[(s, m)]), "last_seen": min(batch[(s, m)]),
+             "readings": 0, "recent_intervals": "[]"}
+            for s, m in sorted(batch)
+        ],
+    )
+    for state in stored:
+        sensor_id, metric = state.sensor_id, getattr(state.metric, "value", state.metric)
+        timestamps = sorted(set(batch[(sensor_id, metric)]))
+        recent: List[float] = json.loads(state.recent_intervals)
+
+        # Readings after the last one seen: a gap when above the threshold, otherwise a regular interval.
+        previous = state.last_seen
+        for timestamp in (t for t in timestamps if t > state.last_seen):
+            delta = (timestamp - previous).total_seconds()
+            interval_s = expected_interval(recent)
+            if interval_s is not None and delta > gap_threshold(interval_s):
+                session.add(models.SensorGap(
+                    sensor_id=sensor_id, metric=metric, gap_start=previous, gap_end=timestamp,
+                    expected_interval_s=interval_s,
+                ))
+            else:
+                recent = (recent + [round(delta, 3)])[-RECENT_INTERVALS:]
+            previous = timestamp
+
+        # Late readings: before the first one seen they extend the series backwards, otherwise they may split a gap.
+        interval_s = expected_interval(recent)
+        before = [t for t in timestamps if t < state.first_seen]
+        if before and interval_s is not None:
+            for a, b in _gaps(before + [state.first_seen], interval_s):
+                session.add(models.SensorGap(
+                    sensor_id=sensor_id, metric=metric, gap_start=a, gap_end=b, expected_interval_s=interval_s
+                ))
+        late = [t for t in timestamps if state.first_seen < t < state.last_seen]
+        if late:
+            _split_gaps(session, sensor_id, metric, late)
+
+        state.first_seen = min(state.first_seen, timestamps[0])
+        state.last_seen = max(state.last_seen, timestamps[-1])
+        state.readings += len(timestamps)
+        state.recent_intervals = json.dumps(recent)
+        state.interval_s = interval_s
+        state.stale_after = (
+            state.last_seen + timedelta(seconds=gap_threshold(interval_s)) if interval_s is not None else None
+        )
+    session.flush()
+
+
+def rebuild_liveness(session: Session) -> None:
+    """
+    Rebuild the liveness and gap index from the raw rows. Used to backfill data that was not written through
+    the ingest path.
+
+    Args:
+        session (Session): A write session. The caller commits.
+    """
+    session.query(models.SensorGap).delete()
+    session.query(models.SensorLiveness).delete()
+    data = models.SensorData
+    rows = session.execute(
+        select(data.sensor_id, data.metric, data.timestamp)
+        .order_by(data.sensor_id, data.metric, data.timestamp)
+        .execution_options(yield_per=10000)
+    )
+    for partition in rows.partitions():
+        update_liveness(session, partition)
@@ -0,0 +1,174 @@
+"""
+Offline stand-in of the OpenAI chat model: records and replays tool-calling transcripts of the SQL agent.
+
+A transcript is the sequence of AI messages of one agent run (tool calls, then the final answer), stored as a
+JSON line: {"question": "...", "messages": [{"tool_calls": [{"name": "sql_db_query", "args": {...}}]}, ...,
+{"content": "..."}]}. With LLM_PROVIDER=replay the agent runs against the ReplayChatModel, which answers the
+n-th LLM call of a question with the n-th recorded message after an artificial latency. Everything else runs
+for real: agent construction, schema reflection, the guarded tool SQL, parsing and row hydration. So the
+non-LLM overhead of /sensors/ask can be measured and regression tested without OpenAI calls.
+
+The SQL of a tool call can be given per dialect ({"postgresql": "...", "sqlite": "..."}). The final answer may
+refer to the result of the last tool call: "$tool_ids" becomes the JSON array of the row IDs in it and
+"$tool_value" the single value, so recorded answers stay consistent with a freshly seeded database.
+With LLM_RECORD_TRANSCRIPTS set, live agent runs are appended to that file by the TranscriptRecorder.
+"""
+
+import json
+import re
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult, LLMResult
+
+QUESTION_MARKER = "Question: "
+_ROW_ID = re.compile(r"\b[0-9a-f]{8}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{12}\b", re.IGNORECASE)
+_SINGLE_VALUE = re.compile(r"^\[\((?P<value>[^,()]*),\)\]$")
+
+
+def normalize_question(question: str) -> str:
+    """Lower case question with collapsed whitespace, the transcript lookup key."""
+    return " ".join(question.lower().split())
+
+
+def prompt_question(messages: List[BaseMessage]) -> Optional[str]:
+    """The user question of an agent conversation: the text after the last "Question: " of the first human message."""
+    for message in messages:
+        if isinstance(message, HumanMessage) and isinstance(message.content, str):
+            content = message.content
+            return content[content.rindex(QUESTION_MARKER) + len(QUESTION_MARKER):] if QUESTION_MARKER in content else content
+    return None
+
+
+def load_transcripts(path: str) -> Dict[str, List[Dict[str, Any]]]:
+    """Read a JSON lines transcript file. Later transcripts of the same question win."""
+    transcripts = {}
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                record = json.loads(line)
+                transcripts[normalize_question(record["question"])] = record["messages"]
+    return transcripts
+
+
+class ReplayChatModel(BaseChatModel):
+    """Chat model answering from recorded transcripts, with an artificial latency per call."""
+
+    transcripts: Dict[str, List[Dict[str, Any]]]
+    latency: float = 0.0  # Seconds per LLM call.
+    dialect: str = "postgresql"  # Picks the tool call SQL of transcripts recorded for several databases.
+
+    @classmethod
+    def from_file(cls, path: str, latency: float = 0.0, dialect: str = "postgresql") -> "ReplayChatModel":
+        """Create the model from a JSON lines transcript file."""
+        return cls(transcripts=load_transcripts(path), latency=latency, dialect=dialect)
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    def bind_tools(self, tools, **kwargs):
+        return self  # The transcripts hold the tool calls.
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        question = prompt_question(messages)
+        transcript = self.transcripts.get(normalize_question(question or ""))
+        if transcript is None:
+            raise ValueError(f"No recorded transcript for the question {question!r}")
+        # The answered tool calls, the agent prompt itself contains an AI message without.
+        step = sum(1 for message in messages if isinstance(message, AIMessage) and message.tool_calls)
+        if step >= len(transcript):
+            raise ValueError(f"The transcript of {question!r} has {len(transcript)} messages, call {step + 1} requested")
+        if self.latency > 0:
+            time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._message(transcript[step], step, messages))])
+
+    def _message(self, recorded: Dict[str, Any], step: int, messages: List[BaseMessage]) -> AIMessage:
+        tool_calls = []
+        for i, call in enumerate(recorded.get("tool_calls") or []):
+            args = dict(call.get("args") or {})
+            if isinstance(args.get("query"), dict):
+                args["query"] = args["query"][self.dialect]
+            tool_calls.append({"name": call["name"], "args": args, "id": f"call_{step}_{i}"})
+        content = recorded.get("content") or ""
+        if "$tool_" in content:
+            result = next((m.content for m in reversed(messages) if isinstance(m, ToolMessage)), "")
+            ids = [str(uuid.UUID(match)) for match in _ROW_ID.findall(str(result))]
+            single = _SINGLE_VALUE.match(str(result).strip())
+            content = content.replace("$tool_ids", json.dumps(ids))
+            content = content.replace("$tool_value", single.group("value").strip("'") if single else "")
+        return AIMessage(content=content, tool_calls=tool_calls)
+
+
+class TranscriptRecorder(BaseCallbackHandler):
+    """
+    LangChain callback handler appending the AI messages of every agent run, as a transcript, to a JSON lines file.
+    Nested runs are attributed to their root agent run. Thread safe.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._roots: Dict[UUID, UUID] = {}
+        self._questions: Dict[UUID, str] = {}
+        self._messages: Dict[UUID, List[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, run_id: UUID, parent_run_id: Optional[UUID]) -> UUID:
+        with self._lock:
+            root = self._roots.get(parent_run_id, parent_run_id) if parent_run_id else run_id
+            self._roots[run_id] = root
+            return root
+
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any):
+        self._register(run_id, parent_run_id)
+        if parent_run_id is None:
+            with self._lock:
+                self._messages[run_id] = []
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any):
+        root = self._register(run_id, parent_run_id)
+        question = prompt_question(messages[0]) if messages else None
+        if question is not None:
+            with self._lock:
+                self._questions.setdefault(root, question)
+
+    def on_tool_start(self, serialized, input_str, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any):
+        self._register(run_id, parent_run_id)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any):
+        message = response.generations[0][0].message if response.generations and response.generations[0] else None
+        if not isinstance(message, AIMessage):
+            return
+        recorded: Dict[str, Any] = {}
+        if message.tool_calls:
+            recorded["tool_calls"] = [{"name": call["name"], "args": call["args"]} for call in message.tool_calls]
+        if message.content:
+            recorded["content"] = message.content
+        with self._lock:
+            messages = self._messages.get(self._roots.get(run_id))
+            if messages is not None:
+                messages.append(recorded)
+
+    def on_chain_end(self, outputs, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any):
+        if parent_run_id is not None:
+            return
+        with self._lock:
+            messages = self._messages.pop(run_id, None)
+            question = self._questions.pop(run_id, None)
+            self._roots = {k: v for k, v in self._roots.items() if v != run_id}
+            if messages and question is not None:
+                with self.path.open("a", encoding="utf-8") as file:
+                    file.write(json.dumps({"question": question, "messages": messages}) + "\n")
+
+    def on_chain_error(self, error, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any):
+        if parent_run_id is None:
+            with self._lock:
+                self._messages.pop(run_id, None)
+                self._questions.pop(run_id, None)
+                self._roots = {k: v for k, v in self._roots.items() if v != run_id}
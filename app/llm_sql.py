@@ -1,15 +1,28 @@
 """Module to manage Langchain SQL Agent for querying the sensor data database."""
 
 import os
-from typing import List, Optional
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
 from string import Template
-from langchain.agents import AgentExecutor
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.rate_limiters import InMemoryRateLimiter
 from langchain.output_parsers import PydanticOutputParser
 from langchain_openai import ChatOpenAI
 from langchain_community.utilities import SQLDatabase
 from langchain_community.agent_toolkits import create_sql_agent,  SQLDatabaseToolkit
+from langchain_core.language_models import BaseChatModel
+from langchain_core.runnables import Runnable
 from pydantic import SecretStr, BaseModel, Field
-from app.database import get_engine
+from app.database import get_agent_engine
+from app.edge import get_daily_partitions, partition_state
+from app.llm_replay import ReplayChatModel, TranscriptRecorder
+from app.sql_guard import QueryGuard, QueryRejected
+from app.metrics import LLM_AGENT_DURATION, LLM_AGENT_ITERATIONS, LLM_TOKENS
 from .config import get_settings
 
 def get_llm_agent():
@@ -52,36 +65,240 @@ def get_prompt() -> Template:
     f'{format_instructions}'
     'Question: ${userquestion}')
 
+class AgentQuery(NamedTuple):
+    """A query the agent executed successfully, and the result text it got back."""
+
+    sql: str
+    output: str
+
+
+_captured_queries: ContextVar[Optional[List[AgentQuery]]] = ContextVar("captured_queries", default=None)
+
+
+@contextmanager
+def capture_agent_queries() -> Iterator[List[AgentQuery]]:
+    """Collect the successful queries of the agent runs in the block, in execution order."""
+    queries: List[AgentQuery] = []
+    token = _captured_queries.set(queries)
+    try:
+        yield queries
+    finally:
+        _captured_queries.reset(token)
+
+
+def execute_agent_query(sql: str) -> List[tuple]:
+    """
+    Run a query outside of an agent run, with the same guard and the isolated, read only agent engine.
+
+    Raises:
+        QueryRejected: The guard refused the query.
+    """
+    with get_agent_engine().connect() as conn:
+        statement = QueryGuard.from_settings().review(conn, sql)
+        return [tuple(row) for row in conn.exec_driver_sql(statement)]
+
+
+class GuardedSQLDatabase(SQLDatabase):
+    """
+    SQLDatabase that passes every agent query through the QueryGuard before execution.
+    Rejections are returned to the agent as tool errors, so it can reformulate the query.
+    """
+
+    def __init__(self, engine, guard: QueryGuard, **kwargs):
+        super().__init__(engine=engine, **kwargs)
+        self.guard = guard
+
+    def run(self, command, fetch="all", include_columns=False, *, parameters=None, execution_options=None):
+        original = command
+        if isinstance(command, str):
+            with self._engine.connect() as conn:
+                command = self.guard.review(conn, command)
+        result = super().run(
+            command, fetch, include_columns, parameters=parameters, execution_options=execution_options
+        )
+        captured = _captured_queries.get()
+        if captured is not None and isinstance(original, str):
+            captured.append(AgentQuery(original, str(result)))
+        return result
+
+    def run_no_throw(self, command, fetch="all", include_columns=False, *, parameters=None, execution_options=None):
+        try:
+            return super().run_no_throw(
+                command, fetch, include_columns, parameters=parameters, execution_options=execution_options
+            )
+        except QueryRejected as e:
+            return f"Error: {e}"
+
+
 def load_sql_database() -> SQLDatabase:
     """
-    Load the SQL tables to LLM context.
+    Load the SQL tables to LLM context. The agent queries run on the isolated, read only agent engine
+    and are checked by the QueryGuard. In the edge mode the agent sees the sensor_data view, not its partitions.
+    """
+    engine = get_agent_engine()
+    partitions = get_daily_partitions()
+    if partitions is not None:
+        return GuardedSQLDatabase(
+            engine=engine,
+            guard=QueryGuard.from_settings(),
+            view_support=True,
+            ignore_tables=[*partitions.table_names(), partition_state.name],
+        )
+    return GuardedSQLDatabase(engine=engine, guard=QueryGuard.from_settings())
+
+
+_rate_limiter: Optional[InMemoryRateLimiter] = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_llm_rate_limiter() -> Optional[InMemoryRateLimiter]:
+    """
+    The process wide limiter of the LLM requests, shared by all agents, since the provider limits
+    apply to the API key. None when LLM_REQUESTS_PER_SECOND is 0.
     """
-    engine = get_engine()
-    return SQLDatabase(engine=engine)
+    global _rate_limiter  # pylint: disable=global-statement
+    settings = get_settings()
+    if settings.llm_requests_per_second <= 0:
+        return None
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = InMemoryRateLimiter(
+                requests_per_second=settings.llm_requests_per_second,
+                check_every_n_seconds=0.05,
+                max_bucket_size=max(settings.llm_request_burst, 1),
+            )
+        return _rate_limiter
 
 
-def load_llm() -> ChatOpenAI:
-    """ Load the OpenAI model using the key and model_id specified in config."""
+_replay_llm: Optional[ReplayChatModel] = None
+_recorder: Optional[TranscriptRecorder] = None
+
+
+def load_replay_llm() -> ReplayChatModel:
+    """The recorded transcript stand-in of the OpenAI model (LLM_PROVIDER=replay), loaded once per process."""
+    global _replay_llm  # pylint: disable=global-statement
+    if _replay_llm is None:
+        settings = get_settings()
+        _replay_llm = ReplayChatModel.from_file(
+            settings.llm_replay_transcripts,
+            latency=settings.llm_replay_latency_s,
+            dialect=get_agent_engine().dialect.name,
+        )
+    return _replay_llm
+
+
+def get_transcript_recorder() -> Optional[TranscriptRecorder]:
+    """The process wide recorder of the agent transcripts, None when LLM_RECORD_TRANSCRIPTS is not set."""
+    global _recorder  # pylint: disable=global-statement
+    path = get_settings().llm_record_transcripts
+    if not path:
+        return None
+    if _recorder is None:
+        _recorder = TranscriptRecorder(path)
+    return _recorder
+
+
+def load_llm() -> BaseChatModel:
+    """
+    Load the OpenAI model using the key and model_id specified in config,
+    or the transcript replaying stand-in when LLM_PROVIDER is "replay".
+    """
+    if get_settings().llm_provider == "replay":
+        return load_replay_llm()
 
     openai_api_key : SecretStr = SecretStr(get_settings().openai_api_key)
     if openai_api_key.get_secret_value() == "Invalid":
         raise ValueError("OPENAI_API_KEY environment variable not set")
 
     # load OpenAI model
-    return ChatOpenAI(model="gpt-4o-mini", temperature=0.1, api_key=openai_api_key)
+    return ChatOpenAI(model="gpt-4o-mini", temperature=0.1, api_key=openai_api_key, rate_limiter=get_llm_rate_limiter())
 
-def load_sql_agent() -> AgentExecutor:
+class AgentMetricsHandler(BaseCallbackHandler):
+    """
+    LangChain callback handler recording the agent wall time, the number of LLM calls (iterations)
+    and the token usage of every agent run. Nested runs are attributed to their root agent run.
+    Thread safe, an agent can serve concurrent runs (batch questions).
+    """
+
+    def __init__(self):
+        self._roots: Dict[UUID, UUID] = {}
+        self._started: Dict[UUID, float] = {}
+        self._iterations: Dict[UUID, int] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, run_id: UUID, parent_run_id: Optional[UUID]) -> None:
+        with self._lock:
+            root = self._roots.get(parent_run_id, parent_run_id) if parent_run_id else run_id
+            self._roots[run_id] = root
+
+    def _finish(self, run_id: UUID, outcome: str) -> None:
+        with self._lock:
+            started = self._started.pop(run_id, None)
+            if started is None:
+                return
+            iterations = self._iterations.pop(run_id, 0)
+            self._roots = {k: v for k, v in self._roots.items() if v != run_id}
+        LLM_AGENT_DURATION.labels(outcome).observe(time.perf_counter() - started)
+        LLM_AGENT_ITERATIONS.observe(iterations)
+
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any):
+        self._register(run_id, parent_run_id)
+        if parent_run_id is None:
+            with self._lock:
+                self._started[run_id] = time.perf_counter()
+                self._iterations[run_id] = 0
+
+    def on_chain_end(self, outputs, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any):
+        if parent_run_id is None:
+            self._finish(run_id, "ok")
+
+    def on_chain_error(self, error, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any):
+        if parent_run_id is None:
+            self._finish(run_id, "error")
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any):
+        self._register(run_id, parent_run_id)
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any):
+        self._register(run_id, parent_run_id)
+
+    def on_tool_start(self, serialized, input_str, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any):
+        self._register(run_id, parent_run_id)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any):
+        with self._lock:
+            root = self._roots.get(run_id)
+            if root in self._iterations:
+                self._iterations[root] += 1
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        LLM_TOKENS.labels("prompt").inc(usage.get("prompt_tokens") or 0)
+        LLM_TOKENS.labels("completion").inc(usage.get("completion_tokens") or 0)
+
+
+def load_sql_agent(llm: Optional[BaseChatModel] = None, db: Optional[SQLDatabase] = None) -> Runnable:
     """
     Create the Langchain SQL AgentExecutor Hands over the optional tool functions to
-    the AgentExecutor.
+    the AgentExecutor. The executor is bound to the metrics callback handler (and the transcript recorder,
+    when enabled), which is inherited by the nested LLM and tool runs.
+
+    Args:
+        llm (Optional[BaseChatModel]): Chat model of the agent. Defaults to the configured OpenAI model.
+        db (Optional[SQLDatabase]): Database of the agent tools. Defaults to the guarded agent database.
+
+    Returns:
+        Runnable: The AgentExecutor bound to the callbacks with with_config(), invoked like the executor.
     """
 
-    llm = load_llm()
-    db = load_sql_database()
+    llm = llm or load_llm()
+    db = db or load_sql_database()
     toolkit = SQLDatabaseToolkit(db=db, llm=llm)
     # set extra tool functions the agent can use
     #    [output_plot, output_table]
     extra_tools = []
+    callbacks: List[BaseCallbackHandler] = [AgentMetricsHandler()]
+    recorder = get_transcript_recorder()
+    if recorder is not None:
+        callbacks.append(recorder)
     return create_sql_agent(
         llm=llm,
         toolkit=toolkit,
@@ -90,4 +307,4 @@ def load_sql_agent() -> AgentExecutor:
         max_execution_time=45,
         extra_tools=extra_tools,
         verbose=True,
-    )
+    ).with_config(callbacks=callbacks)
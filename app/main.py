@@ -3,11 +3,22 @@
 Main entry point for the Sensor Data API application.
 Initializes FastAPI, sets up database tables, and includes API endpoints.
 """
+import logging
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from fastapi import FastAPI
-from app.api import endpoints
+from fastapi import FastAPI, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from app.anomaly import shutdown_anomaly_executor
+from app.ask import shutdown_ask_batch_executor
+from app.api import admin, endpoints, jobs
+from app.config import get_settings
 from app.database import init_postgres
+from app.edge import get_daily_partitions, init_edge, start_edge_maintenance, stop_edge_maintenance
+from app.jobs import shutdown_job_manager
+from app.line_protocol import start_line_protocol_listener, stop_line_protocol_listener
+from app.sketches import start_sketch_compaction, stop_sketch_compaction
+from app.metrics import RequestLatencyMiddleware
+from app.slow_query import slow_query_recorder
 
 @asynccontextmanager
 async def lifespan(fapp: FastAPI):
@@ -20,10 +31,35 @@ async def lifespan(fapp: FastAPI):
 
     """
     print("Initializing ", fapp.title)
-    await init_postgres()
+    edge = get_daily_partitions() is not None
+    if edge:
+        init_edge()
+        start_edge_maintenance()
+    else:
+        await init_postgres()
+    start_sketch_compaction()
+    await start_line_protocol_listener()
     yield
     print("Shutting down app ...")
+    await stop_line_protocol_listener()
+    if edge:
+        stop_edge_maintenance()
+    stop_sketch_compaction()
+    slow_query_recorder.close()
+    shutdown_anomaly_executor()
+    shutdown_job_manager()
+    shutdown_ask_batch_executor()
 
 load_dotenv(override=True)
+logging.basicConfig(level=get_settings().log_level, format="%(asctime)s %(levelname)s %(name)s %(message)s")
 app = FastAPI(lifespan=lifespan, title="Sensory API", version="0.0.9")
 app.include_router(endpoints.router, prefix="/api/v1")
+app.include_router(admin.router, prefix="/api/v1")
+app.include_router(jobs.router, prefix="/api/v1")
+app.add_middleware(RequestLatencyMiddleware)
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus scrape endpoint."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,266 @@
+"""
+Prometheus instrumentation for the Sensor Data API.
+
+Collects HTTP request, SQL statement, connection pool, ingest and LLM agent metrics.
+The collected values are exposed in Prometheus text format on the /metrics endpoint.
+Replaces the SQLAlchemy echo output with sampled, structured (JSON) statement logging.
+"""
+
+import json
+import logging
+import random
+import time
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import PoolProxiedConnection, QueuePool
+from .config import get_settings
+
+sql_logger = logging.getLogger("app.sql")
+
+REQUEST_LATENCY = Histogram(
+    "sensory_http_request_duration_seconds",
+    "HTTP request latency per route.",
+    ["method", "route", "status"],
+)
+SQL_STATEMENT_DURATION = Histogram(
+    "sensory_db_statement_duration_seconds",
+    "SQL statement execution time.",
+    ["engine", "statement"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+SQL_STATEMENT_ROWS = Histogram(
+    "sensory_db_statement_rows",
+    "Number of rows affected or returned by a SQL statement, when reported by the driver.",
+    ["engine", "statement"],
+    buckets=(0, 1, 10, 100, 1000, 10000, 100000),
+)
+POOL_CHECKOUT_WAIT = Histogram(
+    "sensory_db_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection from the pool.",
+    ["engine"],
+    buckets=(0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+POOL_CHECKED_OUT = Gauge(
+    "sensory_db_pool_checked_out",
+    "Number of connections currently checked out from the pool.",
+    ["engine"],
+)
+POOL_SATURATION = Gauge(
+    "sensory_db_pool_saturation_ratio",
+    "Checked out connections relative to the pool size. Above 1.0 overflow connections are in use.",
+    ["engine"],
+)
+INGEST_BATCH_SIZE = Histogram(
+    "sensory_ingest_batch_size",
+    "Number of sensor readings written to the database in one ingest call.",
+    ["path"],  # single, bulk or stream (line protocol)
+    buckets=(1, 10, 100, 1000, 10000, 100000),
+)
+INGEST_DUPLICATES = Counter(
+    "sensory_ingest_duplicates_total",
+    "Duplicate sensor readings dropped on ingest, by the stage that detected them.",
+    ["stage"],  # batch, filter or database
+)
+INGEST_ADMISSION = Counter(
+    "sensory_ingest_admission_total",
+    "Ingest requests by priority lane and admission decision.",
+    ["lane", "decision"],  # decision: admitted, queue_full or rate_limited
+)
+INGEST_QUEUE_DEPTH = Gauge(
+    "sensory_ingest_queue_depth",
+    "Admitted sensor readings not yet written to the database.",
+)
+SLOW_QUERY_EXPLAINS = Counter(
+    "sensory_slow_query_explains_total",
+    "Captured slow statements by EXPLAIN scheduling outcome.",
+    ["outcome"],  # queued, queue_full, cooldown or closed
+)
+LINE_PROTOCOL_READINGS = Counter(
+    "sensory_line_protocol_readings_total",
+    "Readings received by the line protocol listener.",
+    ["transport", "result"],  # result: accepted, invalid, dropped (UDP over capacity) or failed (write error)
+)
+LIVE_SUBSCRIBERS = Gauge("sensory_live_subscribers", "Connected live stream subscribers.")
+LIVE_DELIVERED = Counter("sensory_live_delivered_readings_total", "Readings queued to live stream subscribers.")
+LIVE_DISCONNECTS = Counter(
+    "sensory_live_disconnects_total",
+    "Ended live stream subscriptions.",
+    ["reason"],  # closed or slow_consumer
+)
+HTTP_CACHE_VALIDATION = Counter(
+    "sensory_http_cache_validation_total",
+    "Cache validations of sensor data queries: not_modified (304 without query) or modified.",
+    ["result"],
+)
+RESULT_CACHE_REQUESTS = Counter(
+    "sensory_result_cache_requests_total",
+    "Query result cache lookups.",
+    ["result"],  # hit or miss
+)
+RESULT_CACHE_EVICTIONS = Counter(
+    "sensory_result_cache_evictions_total",
+    "Query result cache entries removed.",
+    ["reason"],  # ingest, lru or expired
+)
+RESULT_CACHE_BYTES = Gauge("sensory_result_cache_bytes", "Memory accounted to the query result cache entries.")
+JOBS = Counter(
+    "sensory_jobs_total",
+    "Asynchronous job submissions and outcomes.",
+    ["kind", "event"],  # event: submitted, coalesced, rejected, succeeded or failed
+)
+JOBS_PENDING = Gauge("sensory_jobs_pending", "Queued and running asynchronous jobs.")
+JOB_DURATION = Histogram(
+    "sensory_job_duration_seconds",
+    "Execution time of asynchronous jobs.",
+    ["kind"],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+LLM_AGENT_DURATION = Histogram(
+    "sensory_llm_agent_duration_seconds",
+    "Wall time of a LLM SQL agent run.",
+    ["outcome"],
+    buckets=(1, 2, 5, 10, 20, 30, 45, 60, 120),
+)
+LLM_AGENT_ITERATIONS = Histogram(
+    "sensory_llm_agent_iterations",
+    "Number of LLM calls made by a single LLM SQL agent run.",
+    buckets=(1, 2, 3, 4, 5, 6, 8, 10, 15),
+)
+LLM_SQL_GUARD = Counter(
+    "sensory_llm_sql_guard_total",
+    "Decisions of the pre-execution guard on LLM generated SQL.",
+    ["decision"],
+)
+ASK_TEMPLATES = Counter(
+    "sensory_ask_templates_total",
+    "Reusable SQL template lookups of /sensors/ask questions.",
+    ["result"],  # hit, miss, fallback (replay failed or found nothing, the agent answers) or stored
+)
+EDGE_PARTITIONS = Counter(
+    "sensory_edge_partitions_total",
+    "Daily partition events of the embedded edge mode.",
+    ["event"],  # event: created, synced, sync_failed or dropped
+)
+EDGE_OUT_OF_RANGE = Counter(
+    "sensory_edge_out_of_range_readings_total", "Readings dropped by the edge mode, outside its retention window."
+)
+EDGE_SYNCED_ROWS = Counter("sensory_edge_synced_rows_total", "Readings shipped upstream by the edge sync.")
+LLM_TOKENS = Counter(
+    "sensory_llm_tokens_total",
+    "LLM tokens used by the SQL agent.",
+    ["kind"],
+)
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool that records how long callers wait for a connection.
+    The pool's logging_name is used as the engine label of the metric.
+    """
+
+    def connect(self) -> PoolProxiedConnection:
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            POOL_CHECKOUT_WAIT.labels(self.logging_name or "default").observe(
+                time.perf_counter() - start
+            )
+
+
+class RequestLatencyMiddleware:
+    """
+    ASGI middleware recording the request latency per route template,
+    so path parameters do not explode the label cardinality.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(
+                scope["method"], getattr(route, "path", "unmatched"), str(status[0])
+            ).observe(time.perf_counter() - start)
+
+
+def _statement_kind(statement: str) -> str:
+    """Return the leading SQL keyword (SELECT, INSERT, ...) used as a low cardinality metric label."""
+    head = statement.lstrip().split(None, 1)
+    return head[0].upper() if head else "UNKNOWN"
+
+
+def instrument_engine(engine: Engine, name: str) -> None:
+    """
+    Register statement timing, row count, pool and sampled logging event handlers on an engine.
+
+    Args:
+        engine (Engine): The SQLAlchemy engine to instrument.
+        name (str): Engine label used in the metrics and log records, e.g. "primary".
+    """
+    sample_rate = get_settings().sql_log_sample_rate
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+        kind = _statement_kind(statement)
+        SQL_STATEMENT_DURATION.labels(name, kind).observe(elapsed)
+        rowcount = getattr(cursor, "rowcount", -1)
+        if rowcount is not None and rowcount >= 0:
+            SQL_STATEMENT_ROWS.labels(name, kind).observe(rowcount)
+        if sample_rate > 0 and random.random() < sample_rate:
+            sql_logger.info(
+                json.dumps(
+                    {
+                        "event": "sql",
+                        "engine": name,
+                        "statement": kind,
+                        "duration_ms": round(elapsed * 1000, 3),
+                        "rows": rowcount,
+                        "executemany": executemany,
+                        "sql": statement[:500],
+                    }
+                )
+            )
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(context):
+        # Failed statements never reach after_cursor_execute, drop their start time.
+        if context.connection is not None and context.connection.info.get("query_start_time"):
+            context.connection.info["query_start_time"].pop()
+
+    def _update_pool_gauges(returning: int = 0):
+        pool = engine.pool
+        if isinstance(pool, QueuePool):
+            # The checkin event fires before the connection is handed back to the pool.
+            checked_out = pool.checkedout() - returning
+            POOL_CHECKED_OUT.labels(name).set(checked_out)
+            POOL_SATURATION.labels(name).set(checked_out / max(pool.size(), 1))
+
+    @event.listens_for(engine, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        _update_pool_gauges()
+
+    @event.listens_for(engine, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        _update_pool_gauges(returning=1)
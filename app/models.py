@@ -4,7 +4,7 @@ Database models for sensor data.
 
 from datetime import datetime
 from enum import Enum
-from sqlalchemy import Column, Enum as SAEnum, DateTime, String, Float
+from sqlalchemy import BigInteger, Column, Enum as SAEnum, Date, DateTime, String, Float, Index, Integer, Text
 from sqlalchemy.dialects.postgresql import UUID
 from app.database import Base
 
@@ -25,14 +25,22 @@ class MetricEnum(str, Enum):
     BINARY = "binary"  #: Sensor measures binary state, e.g. open/closed, on/off represented as 1.0/0.0.
 
 
+# Shared column type, so the database enum type is created once for all tables.
+MetricType = SAEnum(MetricEnum, name="metricenum", values_callable=lambda obj: [e.value for e in obj])
+
+
 class SensorData(Base):
     """
     SQLAlchemy ORM model for sensor data records.
     Each record represents a single measurement from a sensor at a specific time.
     Same sensor can have multiple metrics at the same time(stamp).
+    (sensor_id, metric, timestamp) is the natural key: a reading is stored once, retries are ignored.
     """
 
     __tablename__ = "sensor_data"
+    __table_args__ = (
+        Index("ux_sensor_data_natural_key", "sensor_id", "metric", "timestamp", unique=True),
+    )
     id = Column(
         UUID(as_uuid=True),
         primary_key=True,
@@ -44,7 +52,88 @@ class SensorData(Base):
     sensor_id = Column(
         String, index=True
     )  # Sensor unique ID, sensor name or serial number.
-    metric = Column(SAEnum(MetricEnum, values_callable=lambda obj: [e.value for e in obj]), index=True)  # Type of metric being recorded.
+    metric = Column(MetricType, index=True)  # Type of metric being recorded.
     value = Column(
         Float
     )  # The recorded value. The interpretation depends on the metric type.
+
+
+class RunningStatsMixin:
+    """
+    Mergeable running statistics columns (Welford / Chan et al. accumulators).
+    Variance is m2 / count (population) or m2 / (count - 1) (sample).
+    """
+
+    sensor_id = Column(String, primary_key=True)
+    metric = Column(MetricType, primary_key=True)
+    count = Column(BigInteger, nullable=False)  # Number of values, a lifetime total for the all time row.
+    mean = Column(Float, nullable=False)  # Mean of the values.
+    m2 = Column(Float, nullable=False)  # Sum of squared deviations from the mean.
+    min = Column(Float, nullable=False)
+    max = Column(Float, nullable=False)
+
+
+class SensorStats(RunningStatsMixin, Base):
+    """
+    Running statistics of a sensor metric per (UTC) day. Maintained incrementally on ingest,
+    range statistics are answered by merging the day buckets.
+    """
+
+    __tablename__ = "sensor_stats"
+    bucket = Column(Date, primary_key=True)  # Day of the measurements.
+
+
+class SensorStatsTotal(RunningStatsMixin, Base):
+    """
+    All time running statistics of a sensor metric. Maintained incrementally on ingest,
+    so all time statistics cost one row read per sensor metric.
+    """
+
+    __tablename__ = "sensor_stats_total"
+
+
+class SensorSketch(Base):
+    """
+    DDSketch quantile sketch of a sensor metric per hour, maintained incrementally on ingest.
+    Ingest appends a delta row per batch and hour, the compaction merges the deltas of an hour into one row.
+    Percentiles and histograms over a range are answered by merging the sketches of the range.
+    """
+
+    __tablename__ = "sensor_sketches"
+    sensor_id = Column(String, primary_key=True)
+    metric = Column(MetricType, primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)  # Start of the (UTC) hour.
+    part = Column(String, primary_key=True, default="")  # "" for the compacted sketch, a random ID for a delta.
+    sketch = Column(Text, nullable=False)  # Serialized app.sketches.DDSketch.
+
+
+class SensorLiveness(Base):
+    """
+    Liveness of a sensor metric, maintained incrementally on ingest: when it was last seen and its expected
+    reporting interval, learned from the recent inter-arrival times. Stale sensor metrics are found through the
+    stale_after index, without scanning readings.
+    """
+
+    __tablename__ = "sensor_liveness"
+    sensor_id = Column(String, primary_key=True)
+    metric = Column(MetricType, primary_key=True)
+    first_seen = Column(DateTime, nullable=False)  # Earliest reading (UTC).
+    last_seen = Column(DateTime, nullable=False)  # Latest reading (UTC).
+    readings = Column(BigInteger, nullable=False)  # Number of readings.
+    interval_s = Column(Float)  # Expected interval: median of the recent intervals. None while learning.
+    recent_intervals = Column(Text, nullable=False)  # JSON list of the latest regular intervals (seconds).
+    stale_after = Column(DateTime, index=True)  # last_seen plus the gap threshold. None while learning.
+
+
+class SensorGap(Base):
+    """
+    Interval index of the detected data gaps of a sensor metric: spans between consecutive readings longer than
+    the gap threshold of the expected interval. Maintained incrementally on ingest, late readings split the gaps.
+    """
+
+    __tablename__ = "sensor_gaps"
+    sensor_id = Column(String, primary_key=True)
+    metric = Column(MetricType, primary_key=True)
+    gap_start = Column(DateTime, primary_key=True)  # Last reading before the gap (UTC).
+    gap_end = Column(DateTime, nullable=False, index=True)  # First reading after the gap (UTC).
+    expected_interval_s = Column(Float, nullable=False)  # Expected interval when the gap was detected.
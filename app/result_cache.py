@@ -0,0 +1,215 @@
+"""
+In-memory cache of serialized /sensors/list results.
+
+Entries hold the JSON response body and its validation headers, so a hit skips the database, the
+ORM and Pydantic. An entry is tagged with the series it covers: its (sensor_id, metric) filter pairs,
+None standing for "any" when a filter is absent, and its date range. Every committed ingest reports the
+written series and time spans (see app.ingest_events); exactly the entries whose series and range
+overlap the written readings are dropped. Unrelated and historical entries stay cached.
+
+The cache is bounded by the accounted memory of the entries (LRU eviction) and by a lifetime, which
+limits staleness from writes the process does not see: ingest through other API processes, and a
+read replica lagging behind the primary when the entry was filled.
+"""
+
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from itertools import product
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from .alignment import to_naive_utc
+from .config import get_settings
+from .dal import parse_iso_datetime
+from .ingest_events import IngestBatch, SeriesKey, SeriesSpan, add_ingest_listener
+from .metrics import RESULT_CACHE_BYTES, RESULT_CACHE_EVICTIONS, RESULT_CACHE_REQUESTS
+
+ENTRY_OVERHEAD = 512  # Bytes accounted per entry in addition to the body (key, headers, tags, bookkeeping).
+SeriesTag = Tuple[Optional[str], Optional[str]]
+
+
+@dataclass(frozen=True)
+class QueryKey:
+    """Normalized filters of a list query. Equal filters in any order or notation give equal keys."""
+
+    sensor_ids: Optional[Tuple[str, ...]]
+    metrics: Optional[Tuple[str, ...]]
+    date_from: Optional[datetime]
+    date_to: Optional[datetime]
+
+    @classmethod
+    def from_filters(
+        cls,
+        sensor_ids: Optional[List[str]],
+        metrics: Optional[List[str]],
+        date_from: Optional[str],
+        date_to: Optional[str],
+    ) -> "QueryKey":
+        """
+        Raises:
+            ValueError: A date is not ISO 8601.
+        """
+        return cls(
+            tuple(sorted(set(sensor_ids))) if sensor_ids else None,
+            tuple(sorted(set(metrics))) if metrics else None,
+            to_naive_utc(parse_iso_datetime(date_from)) if date_from else None,
+            to_naive_utc(parse_iso_datetime(date_to)) if date_to else None,
+        )
+
+    def tags(self) -> Set[SeriesTag]:
+        """The (sensor_id, metric) patterns covered by the query."""
+        return set(product(self.sensor_ids or (None,), self.metrics or (None,)))
+
+    def overlaps(self, span: SeriesSpan) -> bool:
+        """True when readings written in the span can be part of the result."""
+        first, last = to_naive_utc(span.first), to_naive_utc(span.last)
+        return (self.date_from is None or last >= self.date_from) and (self.date_to is None or first <= self.date_to)
+
+
+@dataclass
+class CachedResult:
+    """A cached response."""
+
+    body: bytes
+    headers: Dict[str, str]
+    expires: float = 0.0
+    size: int = 0
+
+
+@dataclass
+class _Fill:
+    """A miss being computed. Ingest overlapping it while the query runs makes its result stale."""
+
+    key: QueryKey
+    stale: bool = False
+
+
+class ResultCache:
+    """Thread safe LRU of serialized query results, invalidated by ingest."""
+
+    def __init__(self, max_bytes: int, ttl: float, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            max_bytes (int): Memory budget of the entries. Results larger than a quarter of it are not cached.
+            ttl (float): Lifetime of an entry in seconds.
+            clock (Callable[[], float]): Monotonic clock, replaceable in tests.
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self.size = 0
+        self._entries: "OrderedDict[QueryKey, CachedResult]" = OrderedDict()
+        self._by_tag: Dict[SeriesTag, Set[QueryKey]] = defaultdict(set)
+        self._fills: Dict[int, _Fill] = {}
+        self._next_fill = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: QueryKey) -> Optional[CachedResult]:
+        """The cached result of a query, or None. A hit becomes the most recently used entry."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires <= self.clock():
+                self._remove(key, "expired")
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        RESULT_CACHE_REQUESTS.labels("miss" if entry is None else "hit").inc()
+        return entry
+
+    def begin_fill(self, key: QueryKey) -> int:
+        """Start computing a missed result. Call before the query runs, and put() with the returned token."""
+        with self._lock:
+            self._next_fill += 1
+            self._fills[self._next_fill] = _Fill(key)
+            return self._next_fill
+
+    def put(self, token: int, body: bytes, headers: Dict[str, str]) -> None:
+        """
+        Cache a result computed after begin_fill(). Dropped when an overlapping ingest was committed in the
+        meantime, since the query may have missed the new readings.
+        """
+        size = len(body) + ENTRY_OVERHEAD
+        with self._lock:
+            fill = self._fills.pop(token, None)
+            if fill is None or fill.stale or size > self.max_bytes // 4:
+                return
+            key = fill.key
+            if key in self._entries:
+                self._remove(key, None)
+            self._entries[key] = CachedResult(body, dict(headers), self.clock() + self.ttl, size)
+            for tag in key.tags():
+                self._by_tag[tag].add(key)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)), "lru")
+            RESULT_CACHE_BYTES.set(self.size)
+
+    def abandon(self, token: int) -> None:
+        """Forget a fill that did not produce a cacheable result."""
+        with self._lock:
+            self._fills.pop(token, None)
+
+    def invalidate(self, spans: Dict[SeriesKey, SeriesSpan]) -> int:
+        """
+        Drop the entries (and mark the running fills) covering readings written to the series.
+
+        Returns:
+            int: Number of dropped entries.
+        """
+        dropped = 0
+        with self._lock:
+            for (sensor_id, metric), span in spans.items():
+                for tag in ((sensor_id, metric), (sensor_id, None), (None, metric), (None, None)):
+                    for key in list(self._by_tag.get(tag, ())):
+                        if key.overlaps(span):
+                            self._remove(key, "ingest")
+                            dropped += 1
+                for fill in self._fills.values():
+                    if not fill.stale and _covers(fill.key, sensor_id, metric) and fill.key.overlaps(span):
+                        fill.stale = True
+            RESULT_CACHE_BYTES.set(self.size)
+        return dropped
+
+    def clear(self) -> None:
+        """Drop all entries."""
+        with self._lock:
+            self._entries.clear()
+            self._by_tag.clear()
+            self.size = 0
+            RESULT_CACHE_BYTES.set(0)
+
+    def _remove(self, key: QueryKey, reason: Optional[str]) -> None:
+        entry = self._entries.pop(key)
+        self.size -= entry.size
+        for tag in key.tags():
+            keys = self._by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_tag[tag]
+        if reason:
+            RESULT_CACHE_EVICTIONS.labels(reason).inc()
+
+
+def _covers(key: QueryKey, sensor_id: str, metric: str) -> bool:
+    return (key.sensor_ids is None or sensor_id in key.sensor_ids) and (key.metrics is None or metric in key.metrics)
+
+
+_settings = get_settings()
+result_cache = ResultCache(_settings.result_cache_max_bytes, _settings.result_cache_ttl_s)
+
+
+def _on_ingest(batch: IngestBatch) -> None:
+    result_cache.invalidate(batch.spans)
+
+
+add_ingest_listener(_on_ingest)
+
+
+def get_result_cache() -> Optional[ResultCache]:
+    """Get the application wide result cache for DI. None when RESULT_CACHE_MAX_BYTES is 0."""
+    return result_cache if result_cache.max_bytes > 0 else None
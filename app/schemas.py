@@ -1,9 +1,11 @@
 """API schemas using Pydantic models"""
 
-from typing import List, Optional
-from datetime import datetime
+import json
+import math
+from typing import Any, List, Optional
+from datetime import date, datetime
 from enum import Enum
-from pydantic import BaseModel, ConfigDict, Field
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, model_validator
 
 
 class MetricEnum(str, Enum):
@@ -56,10 +58,161 @@ class SensorDataOut(BaseModel):
         return [cls.from_model(sensor_data) for sensor_data in sensor_data_list]
 
 
+SensorDataOutList = TypeAdapter(List[SensorDataOut])  # Serializes list responses to JSON bytes.
+
+
+class BulkIngestRequest(BaseModel):
+    """Request schema for writing many sensor data records in one call."""
+
+    readings: List[SensorDataIn] = Field(title="Sensor data records to create", min_length=1, max_length=10000)
+
+
+class BulkIngestResponse(BaseModel):
+    """Response schema of the bulk ingest endpoint."""
+
+    received: int = Field(title="Number of records received")
+    inserted: int = Field(title="Number of records written to the database")
+    duplicates: int = Field(default=0, title="Number of duplicate records dropped (same sensor, metric and timestamp)")
+    batch_duplicates: int = Field(default=0, title="Duplicates repeated within the request")
+    filtered: int = Field(default=0, title="Duplicates dropped by the recently written readings filter")
+    stored_duplicates: int = Field(default=0, title="Duplicates already stored in the database")
+    out_of_range: int = Field(default=0, title="Records dropped by the edge mode, outside its retention window")
+
+
+class SensorStatsOut(BaseModel):
+    """Output schema of the running statistics of a sensor metric."""
+
+    sensor_id: str = Field(title="Sensor ID")
+    metric: MetricEnum = Field(title="Metric category")
+    count: int = Field(title="Number of measurements")
+    mean: Optional[float] = Field(default=None, title="Mean value")
+    variance: Optional[float] = Field(default=None, title="Population variance")
+    stddev: Optional[float] = Field(default=None, title="Population standard deviation")
+    min: Optional[float] = Field(default=None, title="Minimum value")
+    max: Optional[float] = Field(default=None, title="Maximum value")
+
+    @classmethod
+    def from_stats(cls, sensor_id: str, metric: str, stats) -> "SensorStatsOut":
+        """ Convert the RunningStats of a sensor metric to SensorStatsOut schema instance """
+        return cls(
+            sensor_id=sensor_id,
+            metric=metric,
+            count=stats.count,
+            mean=stats.mean,
+            variance=stats.variance,
+            stddev=math.sqrt(stats.variance),
+            min=stats.min,
+            max=stats.max,
+        )
+
+
+class HistogramBin(BaseModel):
+    """A value histogram bin."""
+
+    lower: float = Field(title="Lower bound of the bin (inclusive)")
+    upper: float = Field(title="Upper bound of the bin")
+    count: int = Field(title="Number of measurements in the bin")
+
+
+class SensorPercentilesOut(BaseModel):
+    """Output schema of approximate percentiles and value histogram of a sensor metric."""
+
+    sensor_id: str = Field(title="Sensor ID")
+    metric: MetricEnum = Field(title="Metric category")
+    count: int = Field(title="Number of measurements")
+    min: Optional[float] = Field(default=None, title="Exact minimum value")
+    max: Optional[float] = Field(default=None, title="Exact maximum value")
+    relative_accuracy: float = Field(
+        title="Error bound: every percentile estimate is within this relative error of the true value"
+    )
+    percentiles: dict[str, Optional[float]] = Field(title="Percentile estimates keyed by name, e.g. 'p95'")
+    histogram: List[HistogramBin] = Field(default_factory=list, title="Equal width value histogram")
+
+
+class SensorLivenessOut(BaseModel):
+    """Output schema of the liveness of a sensor metric."""
+
+    sensor_id: str = Field(title="Sensor ID")
+    metric: MetricEnum = Field(title="Metric category")
+    first_seen: datetime = Field(title="Timestamp of the earliest reading (UTC)")
+    last_seen: datetime = Field(title="Timestamp of the latest reading (UTC)")
+    readings: int = Field(title="Number of readings")
+    expected_interval_s: Optional[float] = Field(
+        default=None, title="Expected seconds between readings, learned from the recent intervals"
+    )
+    stale_after: Optional[datetime] = Field(default=None, title="Point in time the sensor metric became stale (UTC)")
+    silent_s: float = Field(title="Seconds since the latest reading")
+
+
+class SensorGapOut(BaseModel):
+    """Output schema of a data gap of a sensor metric."""
+
+    sensor_id: str = Field(title="Sensor ID")
+    metric: MetricEnum = Field(title="Metric category")
+    start: datetime = Field(title="Timestamp of the last reading before the gap (UTC)")
+    end: Optional[datetime] = Field(default=None, title="Timestamp of the first reading after the gap, None when ongoing")
+    duration_s: float = Field(title="Length of the gap in seconds, until now when ongoing")
+    expected_interval_s: float = Field(title="Expected seconds between readings when the gap was detected")
+
+
+class AnomalyOut(BaseModel):
+    """A reading flagged by the anomaly scan."""
+
+    sensor_id: str = Field(title="Sensor ID")
+    metric: MetricEnum = Field(title="Metric category")
+    timestamp: datetime = Field(title="Timestamp of the reading")
+    value: float = Field(title="Value of the reading")
+    checks: List[str] = Field(title="Failed checks: 'zscore', 'ewma' or 'rate'")
+    zscore: Optional[float] = Field(default=None, title="Z-score against the rolling window of previous values")
+    ewma_score: Optional[float] = Field(default=None, title="Deviation from the EWMA in EW standard deviations")
+    rate: Optional[float] = Field(default=None, title="Rate of change per second against the previous reading")
+
+
+class AnomalyScanResponse(BaseModel):
+    """Response schema of the anomaly scan endpoint."""
+
+    scanned: int = Field(title="Number of readings scanned")
+    truncated: bool = Field(title="True when more anomalies were found than returned")
+    anomalies: List[AnomalyOut] = Field(default_factory=list, title="Flagged readings")
+
+
+class ExportFormat(str, Enum):
+    """File format of the raw data export."""
+
+    CSV = "csv"
+    PARQUET = "parquet"
+
+
+class AlignedSeriesOut(BaseModel):
+    """A series of the aligned matrix."""
+
+    sensor_id: str = Field(title="Sensor ID")
+    metric: MetricEnum = Field(title="Metric category")
+    values: List[Optional[float]] = Field(title="Bucket values on the time axis, null for empty buckets")
+
+
+class AlignedMatrixOut(BaseModel):
+    """
+    Columnar, gap-filled matrix of sensor series on a common time grid.
+    The time axis is implicit: bucket i starts at start + i * interval_seconds.
+    """
+
+    start: datetime = Field(title="Start of the first bucket (UTC)")
+    interval_seconds: float = Field(title="Bucket size in seconds")
+    length: int = Field(title="Number of buckets (length of every values column)")
+    fill: str = Field(title="Fill method of the empty buckets: null, previous or linear")
+    series: List[AlignedSeriesOut] = Field(default_factory=list, title="One column per sensor metric")
+
+
+BATCH_GET_MAX_IDS = 100_000
+
+
 class BatchGetRequest(BaseModel):
     """Request schema for batch retrieval of sensor data by sensor IDs."""
 
-    sensor_ids: List[str] = Field(title="List of sensor IDs to retrieve data for", min_length=1, max_length=1000)
+    sensor_ids: List[str] = Field(
+        title="List of sensor IDs to retrieve data for", min_length=1, max_length=BATCH_GET_MAX_IDS
+    )
 
 
 class AskRequest(BaseModel):
@@ -68,6 +221,17 @@ class AskRequest(BaseModel):
     question: str = Field(title="Question about sensor records", min_length=5, max_length=1000)
 
 
+ASK_BATCH_MAX_QUESTIONS = 200
+
+
+class AskBatchRequest(BaseModel):
+    """Request schema for answering many natural language questions in one call."""
+
+    questions: List[AskRequest] = Field(
+        title="Questions to answer", min_length=1, max_length=ASK_BATCH_MAX_QUESTIONS
+    )
+
+
 class AskResponse(BaseModel):
     """Response schema for LLM-based sensor data queries, including LLM response summary,
     row list, and aggregations."""
@@ -87,3 +251,129 @@ class AskResponse(BaseModel):
         default=None,
         title="A followup question the user could ask, if any."
     )
+
+
+class AskBatchItem(BaseModel):
+    """One line of the batch ask response stream: the answer or the error of a question."""
+
+    index: int = Field(title="Position of the question in the request")
+    question: str = Field(title="The question")
+    status: int = Field(title="HTTP status the single /sensors/ask call would have returned")
+    response: Optional[AskResponse] = Field(default=None, title="The answer, when the status is 200")
+    error: Optional[str] = Field(default=None, title="Error detail, when the status is not 200")
+
+
+class EdgePartitionOut(BaseModel):
+    """Response schema of a daily partition of the embedded edge mode."""
+
+    day: date = Field(title="Day of the readings (UTC)")
+    table: str = Field(title="Partition table name")
+    rows: int = Field(title="Stored readings")
+    closed: bool = Field(title="Whether the day is closed, no more readings are expected")
+    version: int = Field(title="Write version, bumped by every ingest transaction writing to the partition")
+    synced_version: Optional[int] = Field(default=None, title="Version last shipped upstream")
+    synced_at: Optional[datetime] = Field(default=None, title="When the partition was last shipped upstream (UTC)")
+    synced_rows: Optional[int] = Field(default=None, title="Readings shipped by the last sync")
+
+
+class SlowQueryOut(BaseModel):
+    """Response schema of a captured slow SQL statement."""
+
+    captured_at: datetime = Field(title="When the statement was captured (UTC)")
+    engine: str = Field(title="Database engine the statement ran on")
+    duration_ms: float = Field(title="Statement execution time in milliseconds")
+    statement: str = Field(title="SQL statement")
+    parameters: Any = Field(default=None, title="Bound parameters of the statement")
+    plan: Any = Field(
+        default=None,
+        title="Execution plan. EXPLAIN (ANALYZE, BUFFERS) JSON on PostgreSQL, EXPLAIN QUERY PLAN rows on SQLite.",
+    )
+    plan_error: Optional[str] = Field(default=None, title="Error raised while collecting the plan, if any.")
+    chunks_scanned: Optional[List[str]] = Field(
+        default=None, title="TimescaleDB hypertable chunks scanned by the statement."
+    )
+    chunks_excluded: Optional[int] = Field(
+        default=None, title="TimescaleDB chunks excluded at executor startup or runtime."
+    )
+
+
+class SqlTemplateOut(BaseModel):
+    """Response schema of a reusable SQL template of /sensors/ask questions."""
+
+    key: str = Field(title="Normalized question form, parameters in braces")
+    sql: str = Field(title="Agent generated SQL with the parameter positions")
+    answer_kind: str = Field(title="aggregation or id_list")
+    created_at: datetime = Field(title="When the template was captured (UTC)")
+    last_used_at: Optional[datetime] = Field(default=None, title="Last replay (UTC)")
+    uses: int = Field(title="Questions answered, or attempted, with the template")
+    successes: int = Field(title="Replays that answered the question")
+    failures: int = Field(title="Replays that failed or found nothing and fell back to the agent")
+    mean_replay_ms: Optional[float] = Field(default=None, title="Mean latency of the successful replays")
+    agent_ms: float = Field(title="Latency of the agent run the template was captured from")
+
+
+class JobKind(str, Enum):
+    """Kinds of asynchronous jobs."""
+
+    LIST = "list"  # Sensor data records, like /sensors/list.
+    AGGREGATE = "aggregate"  # Statistics per sensor metric, like /sensors/stats.
+    ASK = "ask"  # Natural language question, like /sensors/ask.
+
+
+class JobStatus(str, Enum):
+    """Lifecycle of an asynchronous job."""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class JobRequest(BaseModel):
+    """Request schema of an asynchronous list, aggregate or ask job."""
+
+    kind: JobKind = Field(title="Job kind")
+    sensor_ids: Optional[List[str]] = Field(default=None, title="Sensor IDs to filter (list, aggregate)")
+    metrics: Optional[List[MetricEnum]] = Field(default=None, title="Metrics to filter (list, aggregate)")
+    date_from: Optional[str] = Field(default=None, title="Start date (inclusive) in ISO format (list, aggregate)")
+    date_to: Optional[str] = Field(default=None, title="End date (inclusive) in ISO format (list, aggregate)")
+    question: Optional[str] = Field(default=None, title="Natural language question (ask)")
+
+    @model_validator(mode="after")
+    def check_kind_parameters(self) -> "JobRequest":
+        """ Ask jobs need a question, the other kinds the filters only """
+        if (self.kind == JobKind.ASK) != (self.question is not None):
+            raise ValueError("question is required for ask jobs and not allowed for the other kinds")
+        return self
+
+    def key(self) -> str:
+        """ Canonical form of the request: submissions with equal keys have the same result and are coalesced """
+        return json.dumps(
+            {
+                "kind": self.kind.value,
+                "sensor_ids": sorted(set(self.sensor_ids)) if self.sensor_ids else None,
+                "metrics": sorted({metric.value for metric in self.metrics}) if self.metrics else None,
+                "date_from": self.date_from,
+                "date_to": self.date_to,
+                "question": " ".join(self.question.split()) if self.question is not None else None,
+            },
+            sort_keys=True,
+        )
+
+
+class JobOut(BaseModel):
+    """Response schema of an asynchronous job. The result is kept for a limited time after completion."""
+
+    id: str = Field(title="Job ID")
+    kind: JobKind = Field(title="Job kind")
+    status: JobStatus = Field(title="Job status")
+    created_at: datetime = Field(title="Submission time (UTC)")
+    started_at: Optional[datetime] = Field(default=None, title="Execution start (UTC)")
+    finished_at: Optional[datetime] = Field(default=None, title="Completion time (UTC)")
+    expires_at: Optional[datetime] = Field(default=None, title="The job and its result are dropped after this time (UTC)")
+    result: Any = Field(
+        default=None,
+        title="Result of a succeeded job: list of sensor data records, list of statistics or the ask response",
+    )
+    error: Optional[str] = Field(default=None, title="Error of a failed job")
+    error_status: Optional[int] = Field(default=None, title="HTTP status the error maps to, e.g. 400 or 500")
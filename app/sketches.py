@@ -0,0 +1,305 @@
+"""
+Mergeable quantile sketches of sensor metrics.
+
+A DDSketch (Masson, Rim, Lee: "DDSketch: A Fast and Fully-Mergeable Quantile Sketch with
+Relative-Error Guarantees", VLDB 2019) is maintained per sensor, metric and hour on ingest.
+Percentiles and histograms over a time range are answered by merging the hourly sketches,
+without scanning the raw rows.
+
+Ingest only appends the sketch of a batch as a delta row per hour, so it neither reads nor locks stored
+sketches. A background compaction (SKETCH_COMPACTION_INTERVAL_S) merges the deltas of each hour into one row;
+readers merge whatever rows exist, so results do not depend on whether an hour is compacted yet.
+
+Error bounds: every quantile estimate x' of the true quantile x satisfies |x' - x| <= alpha * |x|,
+where alpha is the relative accuracy (default 1%). Values with absolute value below 1e-9 are treated as 0.
+The time range is applied with hour granularity: buckets overlapping the range are merged whole.
+"""
+
+import json
+import logging
+import math
+import threading
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import Session
+from app import models
+from app.config import get_settings
+from app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+SKETCH_BUCKET = timedelta(hours=1)
+DEFAULT_RELATIVE_ACCURACY = 0.01
+_MIN_INDEXABLE = 1e-9
+
+
+class DDSketch:
+    """Quantile sketch with relative accuracy guarantees, mergeable across time buckets."""
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+        """
+        Args:
+            relative_accuracy (float): Maximum relative error (alpha) of the quantile estimates.
+        """
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive: Dict[int, int] = defaultdict(int)
+        self.negative: Dict[int, int] = defaultdict(int)
+        self.zero_count = 0
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _index(self, value: float) -> int:
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def _value(self, index: int) -> float:
+        """Representative value of a bucket, within alpha relative error of every value in it."""
+        return 2 * self.gamma**index / (self.gamma + 1)
+
+    def add(self, value: float, count: int = 1) -> None:
+        """Add a value to the sketch."""
+        if value > _MIN_INDEXABLE:
+            self.positive[self._index(value)] += count
+        elif value < -_MIN_INDEXABLE:
+            self.negative[self._index(-value)] += count
+        else:
+            self.zero_count += count
+        self.count += count
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: "DDSketch") -> None:
+        """Merge another sketch with the same relative accuracy into this one."""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Only sketches with the same relative accuracy can be merged")
+        for index, count in other.positive.items():
+            self.positive[index] += count
+        for index, count in other.negative.items():
+            self.negative[index] += count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def _buckets(self) -> List[Tuple[float, int]]:
+        """(representative value, count) pairs in ascending value order."""
+        buckets = [(-self._value(i), c) for i, c in sorted(self.negative.items(), reverse=True)]
+        if self.zero_count:
+            buckets.append((0.0, self.zero_count))
+        buckets.extend((self._value(i), c) for i, c in sorted(self.positive.items()))
+        return buckets
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Estimate the q-quantile.
+
+        Args:
+            q (float): Quantile between 0 and 1, e.g. 0.95.
+
+        Returns:
+            Optional[float]: The estimate, clamped to the exact min and max. None for an empty sketch.
+        """
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for value, count in self._buckets():
+            seen += count
+            if seen > rank:
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def histogram(self, bins: int) -> List[Tuple[float, float, int]]:
+        """
+        Equal width histogram between the exact min and max.
+
+        Args:
+            bins (int): Number of bins.
+
+        Returns:
+            List[Tuple[float, float, int]]: (lower, upper, count) per bin. Values are placed by their
+                bucket's representative value, so a value may fall into a neighbour bin within alpha relative error.
+        """
+        if self.count == 0:
+            return []
+        width = (self.max - self.min) / bins
+        counts = [0] * bins
+        for value, count in self._buckets():
+            position = int((min(max(value, self.min), self.max) - self.min) / width) if width else 0
+            counts[min(position, bins - 1)] += count
+        return [(self.min + i * width, self.min + (i + 1) * width, c) for i, c in enumerate(counts)]
+
+    def to_json(self) -> str:
+        """Compact JSON serialization stored in the database."""
+        return json.dumps(
+            {
+                "a": self.relative_accuracy,
+                "p": self.positive,
+                "n": self.negative,
+                "z": self.zero_count,
+                "c": self.count,
+                "min": self.min,
+                "max": self.max,
+            },
+            separators=(",", ":"),
+        )
+
+    @classmethod
+    def from_json(cls, data: str) -> "DDSketch":
+        """Deserialize a sketch created by to_json."""
+        raw = json.loads(data)
+        sketch = cls(raw["a"])
+        sketch.positive.update({int(k): v for k, v in raw["p"].items()})
+        sketch.negative.update({int(k): v for k, v in raw["n"].items()})
+        sketch.zero_count, sketch.count = raw["z"], raw["c"]
+        sketch.min, sketch.max = raw["min"], raw["max"]
+        return sketch
+
+
+def hour_bucket(timestamp: datetime) -> datetime:
+    """Start of the (naive UTC) hour bucket of a timestamp. Naive timestamps are taken as UTC."""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+COMPACTED = ""  # Part of the merged sketch of an hour.
+
+
+def update_sketches(session: Session, rows: Iterable[models.SensorData]) -> None:
+    """
+    Append the sketches of newly written rows, one delta row per hour bucket, in the caller's transaction.
+
+    Args:
+        session (Session): The write session of the ingest transaction.
+        rows (Iterable[models.SensorData]): The written sensor readings.
+    """
+    batch: Dict[Tuple[str, str, datetime], DDSketch] = defaultdict(DDSketch)
+    for row in rows:
+        metric = getattr(row.metric, "value", row.metric)
+        batch[(row.sensor_id, metric, hour_bucket(row.timestamp))].add(row.value)
+    if not batch:
+        return
+    session.execute(
+        insert(models.SensorSketch),
+        [
+            {"sensor_id": s, "metric": m, "bucket_start": b, "part": uuid.uuid4().hex, "sketch": sketch.to_json()}
+            for (s, m, b), sketch in sorted(batch.items())
+        ],
+    )
+
+
+def compact_sketches(session: Session, limit: int = 10000) -> int:
+    """
+    Merge the delta rows of hour buckets into one row per bucket. Deltas appended concurrently are left for the
+    next run.
+
+    Args:
+        session (Session): A write session. The caller commits.
+        limit (int): Maximum number of buckets merged.
+
+    Returns:
+        int: The number of merged buckets.
+    """
+    table = models.SensorSketch
+    keys = session.execute(
+        select(table.sensor_id, table.metric, table.bucket_start)
+        .group_by(table.sensor_id, table.metric, table.bucket_start)
+        .having(func.count() > 1)
+        .order_by(table.sensor_id, table.metric, table.bucket_start)
+        .limit(limit)
+    ).all()
+    for sensor_id, metric, bucket_start in keys:
+        stored = session.execute(
+            select(table)
+            .where(table.sensor_id == sensor_id, table.metric == metric, table.bucket_start == bucket_start)
+            .with_for_update()
+        ).scalars().all()
+        merged = DDSketch()
+        for row in stored:
+            merged.merge(DDSketch.from_json(row.sketch))
+        compacted = next((row for row in stored if row.part == COMPACTED), None)
+        for row in stored:
+            if row is not compacted:
+                session.delete(row)
+        if compacted is None:
+            session.add(table(
+                sensor_id=sensor_id, metric=metric, bucket_start=bucket_start, part=COMPACTED, sketch=merged.to_json()
+            ))
+        else:
+            compacted.sketch = merged.to_json()
+    session.flush()
+    return len(keys)
+
+
+def rebuild_sketches(session: Session) -> None:
+    """
+    Rebuild all sketches from the raw rows. Used to backfill data that was not written through the ingest path.
+
+    Args:
+        session (Session): A write session. The caller commits.
+    """
+    session.query(models.SensorSketch).delete()
+    rows = session.execute(
+        select(models.SensorData.sensor_id, models.SensorData.metric, models.SensorData.timestamp, models.SensorData.value)
+        .execution_options(yield_per=10000)
+    )
+    for partition in rows.partitions():
+        update_sketches(session, partition)
+    while compact_sketches(session):
+        pass
+
+
+class SketchCompactor:
+    """Background thread merging the sketch deltas appended by the ingest."""
+
+    def __init__(self, session_factory, interval: float):
+        self.session_factory = session_factory
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> int:
+        with self.session_factory() as session:
+            merged = compact_sketches(session)
+            session.commit()
+        return merged
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._loop, name="sketch-compaction", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Sketch compaction failed")
+
+
+_compactor: Optional[SketchCompactor] = None
+
+
+def start_sketch_compaction() -> None:
+    """Start the compaction thread. Called on application startup."""
+    global _compactor  # pylint: disable=global-statement
+    _compactor = SketchCompactor(SessionLocal, get_settings().sketch_compaction_interval_s)
+    _compactor.start()
+
+
+def stop_sketch_compaction() -> None:
+    """Stop the compaction thread on application shutdown."""
+    global _compactor  # pylint: disable=global-statement
+    if _compactor is not None:
+        _compactor.stop()
+        _compactor = None
@@ -0,0 +1,254 @@
+"""
+Slow query recorder.
+
+Captures SQL statements slower than a configurable threshold, together with their bound parameters
+and execution plan, into a bounded in-memory ring. On PostgreSQL the plan is collected by
+EXPLAIN (ANALYZE, BUFFERS) and the TimescaleDB chunk exclusion details are extracted from it.
+EXPLAIN ANALYZE runs the statement again, so at most SLOW_QUERY_EXPLAIN_QUEUE plans are pending and a
+statement is explained at most once per SLOW_QUERY_EXPLAIN_COOLDOWN_S; the others are captured without a plan.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from .config import get_settings
+from .metrics import SLOW_QUERY_EXPLAINS
+
+logger = logging.getLogger(__name__)
+
+# Only read statements are explained with ANALYZE, because ANALYZE executes the statement again.
+_EXPLAINABLE = ("SELECT", "WITH")
+_CHUNK_EXCLUSION_KEYS = ("Chunks excluded during startup", "Chunks excluded during runtime")
+
+
+@dataclass
+class SlowQuery:
+    """A captured slow SQL statement."""
+
+    captured_at: datetime
+    engine: str
+    duration_ms: float
+    statement: str
+    parameters: Any
+    plan: Optional[Any] = None
+    plan_error: Optional[str] = None
+    chunks_scanned: Optional[List[str]] = None
+    chunks_excluded: Optional[int] = None
+
+
+def _json_safe(value: Any) -> Any:
+    """Convert bound parameters (UUIDs, datetimes, enums, ...) to JSON friendly values."""
+    if isinstance(value, dict):
+        return {k: _json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(v) for v in value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def chunk_exclusion_info(plan: Any) -> Dict[str, Any]:
+    """
+    Extract the TimescaleDB chunk details from an EXPLAIN (FORMAT JSON) plan.
+
+    Args:
+        plan (Any): The parsed JSON plan returned by PostgreSQL.
+
+    Returns:
+        Dict[str, Any]: "chunks_scanned" the scanned hypertable chunk names and
+            "chunks_excluded" the number of chunks excluded at executor startup or runtime.
+    """
+    scanned = set()
+    excluded = 0
+    stack = [entry.get("Plan", {}) for entry in plan] if isinstance(plan, list) else [plan]
+    while stack:
+        node = stack.pop()
+        relation = node.get("Relation Name")
+        if relation and relation.startswith("_hyper_"):
+            scanned.add(relation)
+        for key in _CHUNK_EXCLUSION_KEYS:
+            excluded += node.get(key, 0) or 0
+        stack.extend(node.get("Plans", []))
+    return {"chunks_scanned": sorted(scanned), "chunks_excluded": excluded}
+
+
+class SlowQueryRecorder:
+    """
+    Records statements slower than the threshold into a bounded ring buffer.
+    Execution plans are collected on a background thread, so the slow request is not delayed further.
+    """
+
+    COOLDOWN_KEYS = 1024  # Explained statements remembered for the cooldown, expired ones are pruned above.
+
+    def __init__(
+        self, threshold_ms: float, capacity: int, explain: bool = True, max_pending: int = 4, cooldown_s: float = 300.0
+    ):
+        """
+        Args:
+            threshold_ms (float): Statements running longer than this are captured.
+            capacity (int): Maximum number of captured statements kept, oldest are dropped first.
+            explain (bool): Collect the execution plan of the captured statements.
+            max_pending (int): Maximum number of queued and running EXPLAIN runs, further ones are skipped.
+            cooldown_s (float): Seconds before the same statement is explained again.
+        """
+        self.threshold_ms = threshold_ms
+        self.explain = explain
+        self.max_pending = max_pending
+        self.cooldown_s = cooldown_s
+        self._ring: deque = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._engines: Dict[str, Engine] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slow-query-explain")
+        self._pending = 0
+        self._explained_at: Dict[str, float] = {}
+        self._closed = False
+
+    def attach(self, engine: Engine, name: str) -> None:
+        """
+        Hook the recorder into the statement execution events of an engine.
+
+        Args:
+            engine (Engine): The SQLAlchemy engine to watch.
+            name (str): Engine label stored with the captured statements.
+        """
+        self._engines[name] = engine
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("slow_query_start_time", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            elapsed_ms = (time.perf_counter() - conn.info["slow_query_start_time"].pop()) * 1000
+            if elapsed_ms >= self.threshold_ms and not statement.lstrip().upper().startswith("EXPLAIN"):
+                self.record(name, statement, parameters, elapsed_ms, executemany)
+
+        @event.listens_for(engine, "handle_error")
+        def _handle_error(context):
+            if context.connection is not None and context.connection.info.get("slow_query_start_time"):
+                context.connection.info["slow_query_start_time"].pop()
+
+    def record(self, engine_name: str, statement: str, parameters: Any, duration_ms: float, executemany: bool = False) -> SlowQuery:
+        """
+        Store a slow statement and schedule its EXPLAIN.
+
+        Returns:
+            SlowQuery: The captured entry. The plan fields are filled in asynchronously.
+        """
+        entry = SlowQuery(
+            captured_at=datetime.now(timezone.utc),
+            engine=engine_name,
+            duration_ms=round(duration_ms, 3),
+            statement=statement,
+            parameters=_json_safe(parameters),
+        )
+        with self._lock:
+            self._ring.append(entry)
+        logger.warning(json.dumps({"event": "slow_query", "engine": engine_name, "duration_ms": entry.duration_ms, "sql": statement[:500]}))
+
+        if self.explain and not executemany and statement.lstrip().upper().startswith(_EXPLAINABLE):
+            self._schedule_explain(entry, parameters)
+        return entry
+
+    def _schedule_explain(self, entry: SlowQuery, parameters: Any) -> None:
+        """Queue the EXPLAIN of an entry, unless the queue is full or the statement was explained recently."""
+        now = time.monotonic()
+        with self._lock:
+            if self._closed:
+                outcome = "closed"
+            elif self._pending >= self.max_pending:
+                outcome = "queue_full"
+            elif now - self._explained_at.get(entry.statement, float("-inf")) < self.cooldown_s:
+                outcome = "cooldown"
+            else:
+                outcome = "queued"
+                self._pending += 1
+                self._explained_at[entry.statement] = now
+                if len(self._explained_at) > self.COOLDOWN_KEYS:
+                    self._explained_at = {k: t for k, t in self._explained_at.items() if now - t < self.cooldown_s}
+        if outcome == "queued":
+            try:
+                self._executor.submit(self._explain, entry, parameters)
+            except RuntimeError:  # Shut down concurrently, the statement itself must not fail.
+                outcome = "closed"
+                with self._lock:
+                    self._pending -= 1
+        if outcome != "queued":
+            entry.plan_error = f"Not explained: {outcome.replace('_', ' ')}"
+        SLOW_QUERY_EXPLAINS.labels(outcome).inc()
+
+    def _explain(self, entry: SlowQuery, parameters: Any) -> None:
+        """Collect the execution plan of a captured statement in a rolled back, read only transaction."""
+        try:
+            self._run_explain(entry, parameters)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _run_explain(self, entry: SlowQuery, parameters: Any) -> None:
+        engine = self._engines.get(entry.engine)
+        if engine is None:
+            return
+        try:
+            with engine.connect() as conn:
+                if engine.dialect.name == "postgresql":
+                    conn.exec_driver_sql("SET TRANSACTION READ ONLY")
+                    plan = conn.exec_driver_sql(
+                        f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {entry.statement}", parameters
+                    ).scalar()
+                    if isinstance(plan, str):
+                        plan = json.loads(plan)
+                    entry.plan = plan
+                    info = chunk_exclusion_info(plan)
+                    entry.chunks_scanned = info["chunks_scanned"]
+                    entry.chunks_excluded = info["chunks_excluded"]
+                else:
+                    rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {entry.statement}", parameters).all()
+                    entry.plan = [_json_safe(list(row)) for row in rows]
+                conn.rollback()
+        except Exception as e:  # pylint: disable=broad-except
+            entry.plan_error = str(e)
+
+    def entries(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Return the captured statements, newest first.
+
+        Args:
+            limit (Optional[int]): Maximum number of entries to return.
+        """
+        with self._lock:
+            items = list(reversed(self._ring))
+        return [asdict(e) for e in items[:limit]]
+
+    def clear(self) -> None:
+        """Drop all captured statements."""
+        with self._lock:
+            self._ring.clear()
+
+    def close(self) -> None:
+        """Wait for the pending EXPLAIN runs and stop the background thread. Later captures are not explained."""
+        with self._lock:
+            self._closed = True
+        self._executor.shutdown(wait=True)
+
+
+slow_query_recorder = SlowQueryRecorder(
+    threshold_ms=get_settings().slow_query_threshold_ms,
+    capacity=get_settings().slow_query_capacity,
+    explain=get_settings().slow_query_explain,
+    max_pending=get_settings().slow_query_explain_queue,
+    cooldown_s=get_settings().slow_query_explain_cooldown_s,
+)
+
+
+def get_slow_query_recorder() -> SlowQueryRecorder:
+    """Get the application wide slow query recorder for DI."""
+    return slow_query_recorder
@@ -0,0 +1,110 @@
+"""
+Pre-execution guard for LLM generated SQL.
+
+The guard accepts single read statements only, asks the planner for the estimated cost and row count
+(EXPLAIN on PostgreSQL), adds a LIMIT to queries that would return too many rows, and rejects queries
+whose estimated cost is still above the configured limit. The rejection message is meant for the agent,
+so it can reformulate the query.
+"""
+
+import json
+import re
+from typing import NamedTuple, Optional
+from sqlalchemy.engine import Connection
+from .config import get_settings
+from .metrics import LLM_SQL_GUARD
+
+_READ_STATEMENT = re.compile(r"^\s*(select|with)\b", re.IGNORECASE)
+# Row limiting clause at the end of a query: LIMIT [OFFSET], OFFSET LIMIT, or FETCH FIRST|NEXT [OFFSET].
+_TRAILING_LIMIT = re.compile(
+    r"(\blimit\s+(\d+|all)(\s+offset\s+\d+(\s+rows?)?)?"
+    r"|\boffset\s+\d+(\s+rows?)?\s+limit\s+(\d+|all)"
+    r"|\bfetch\s+(first|next)(\s+\d+)?\s+rows?\s+(only|with\s+ties)(\s+offset\s+\d+(\s+rows?)?)?)\s*$",
+    re.IGNORECASE,
+)
+_QUOTED = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"")
+
+
+class QueryRejected(Exception):
+    """Raised when the guard refuses to run a LLM generated query."""
+
+
+class QueryEstimate(NamedTuple):
+    """Planner estimates of a query."""
+
+    cost: float
+    rows: float
+
+
+class QueryGuard:
+    """Checks, and if needed rewrites, LLM generated SQL before it is executed."""
+
+    def __init__(self, max_cost: float, max_rows: int):
+        """
+        Args:
+            max_cost (float): Maximum accepted planner total cost.
+            max_rows (int): Queries estimated to return more rows get a LIMIT of this size.
+        """
+        self.max_cost = max_cost
+        self.max_rows = max_rows
+
+    @classmethod
+    def from_settings(cls) -> "QueryGuard":
+        """Create a guard with the limits defined in the application settings."""
+        settings = get_settings()
+        return cls(settings.agent_max_query_cost, settings.agent_max_query_rows)
+
+    def estimate(self, conn: Connection, statement: str) -> Optional[QueryEstimate]:
+        """
+        Ask the planner for the estimated cost and rows of a statement.
+
+        Returns:
+            Optional[QueryEstimate]: The estimates, or None when the database has no cost based EXPLAIN (SQLite).
+        """
+        if conn.dialect.name != "postgresql":
+            return None
+        plan = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}").scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        top = plan[0]["Plan"]
+        return QueryEstimate(cost=float(top["Total Cost"]), rows=float(top["Plan Rows"]))
+
+    def review(self, conn: Connection, sql: str) -> str:
+        """
+        Validate a query and return the statement that is safe to execute.
+
+        Args:
+            conn (Connection): Connection used to run EXPLAIN.
+            sql (str): The LLM generated query.
+
+        Raises:
+            QueryRejected: The query is not a single read statement, or is too expensive even with a LIMIT.
+
+        Returns:
+            str: The original statement, or a rewritten one with a LIMIT appended.
+        """
+        statement = sql.strip().rstrip(";").strip()
+        if ";" in _QUOTED.sub("", statement):
+            LLM_SQL_GUARD.labels("rejected").inc()
+            raise QueryRejected("Query rejected: only a single SQL statement can be executed at a time.")
+        if not _READ_STATEMENT.match(statement):
+            LLM_SQL_GUARD.labels("rejected").inc()
+            raise QueryRejected("Query rejected: only read queries (SELECT or WITH) are allowed.")
+
+        decision = "accepted"
+        estimate = self.estimate(conn, statement)
+        if not _TRAILING_LIMIT.search(statement) and (estimate is None or estimate.rows > self.max_rows):
+            statement = f"{statement}\nLIMIT {self.max_rows}"
+            decision = "rewritten"
+            estimate = self.estimate(conn, statement)
+
+        if estimate is not None and estimate.cost > self.max_cost:
+            LLM_SQL_GUARD.labels("rejected").inc()
+            raise QueryRejected(
+                f"Query rejected: estimated cost {estimate.cost:.0f} exceeds the limit {self.max_cost:.0f} "
+                f"(estimated rows {estimate.rows:.0f}). Narrow the query: add a time bound on the timestamp "
+                "column (e.g. timestamp >= NOW() - INTERVAL '7 days'), filter by sensor_id or metric, "
+                "or aggregate with time_bucket() instead of reading raw rows."
+            )
+        LLM_SQL_GUARD.labels(decision).inc()
+        return statement
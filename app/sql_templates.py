@@ -0,0 +1,476 @@
+"""
+Reusable SQL templates of answered /sensors/ask questions.
+
+Cached answers go stale as soon as new readings arrive, the SQL that produced them does not. After a successful
+agent run the last executed query is turned into a template: string literals that are sensor IDs or metrics
+named in the question, and intervals matching a relative time window of the question ("last week",
+"past 24 hours") become parameters. The question is normalized the same way, e.g.
+"give me the average {metric0} for {sensor0} in the {window0}". A later question of the same form
+("... humidity for boiler-2 in the last 3 days") re-executes the SQL with its own values against the current
+data, skipping the multi-iteration agent loop.
+
+Only templates that can be replayed faithfully are stored: the answer must be the single value of the query
+(aggregation) or exactly the row IDs it returned (id list), and the query must not contain absolute dates.
+The answer text of an aggregation is reused with the replayed value, sensor and metric substituted; answers
+that name a time window get a generic text instead, as their wording cannot be rewritten reliably.
+Parameter values are restricted to identifier characters, numbers and known units before they are written
+into the SQL, which runs through the same guard and read only engine as the agent queries. A replay that
+fails or finds nothing falls back to the agent; templates that keep failing are dropped.
+"""
+
+import logging
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+from app import schemas
+from app.config import get_settings
+from app.llm_sql import AgentQuery, AskResponseFormater, execute_agent_query
+from app.metrics import ASK_TEMPLATES
+
+logger = logging.getLogger(__name__)
+
+MAX_CONSECUTIVE_FAILURES = 3
+METRICS = frozenset(metric.value for metric in schemas.MetricEnum)
+UNITS = ("minute", "hour", "day", "week", "month", "year")
+
+_TOKEN = re.compile(r"[\w.:-]+")
+_NUMBER = re.compile(r"^\d+$")
+_WINDOW_WORDS = ("last", "past", "previous")
+_SQL_LITERAL = re.compile(r"'((?:[^']|'')*)'")
+_SQL_DATE = re.compile(r"'\s*\d{4}-\d{2}-\d{2}")
+# PostgreSQL INTERVAL '7 days' and SQLite date modifiers '-7 days'.
+_SQL_INTERVAL = re.compile(
+    r"(?P<pg>interval\s*)?'\s*(?P<sign>-?)\s*(?P<n>\d+)\s*(?P<unit>minute|hour|day|week|month|year)s?\s*'",
+    re.IGNORECASE,
+)
+_UUID = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}", re.IGNORECASE)
+_SINGLE_VALUE = re.compile(r"^\[\((?P<value>[^,()]*),\)\]$")
+
+Window = Tuple[int, str]  # Canonical (count, unit), weeks are counted in days.
+Element = Tuple[str, Union[str, int, Window]]  # (kind, word, slot index or window)
+
+
+def _canonical_window(count: int, unit: str) -> Window:
+    unit = unit.lower()
+    return (count * 7, "day") if unit == "week" else (count, unit)
+
+
+def tokenize(question: str) -> List[Element]:
+    """
+    Split a question into words, metrics and relative windows. Punctuation is dropped, so are the
+    trailing dots and colons of words.
+
+    Returns:
+        List[Element]: ("word", text), ("metric", name) and ("window", (count, unit)) elements.
+    """
+    tokens = [token.rstrip(".:-") for token in _TOKEN.findall(question)]
+    tokens = [token for token in tokens if token]
+    elements: List[Element] = []
+    i = 0
+    while i < len(tokens):
+        lower = tokens[i].lower()
+        if lower in _WINDOW_WORDS and i + 1 < len(tokens):
+            count, j = 1, i + 1
+            if _NUMBER.match(tokens[j]) and j + 1 < len(tokens):
+                count, j = int(tokens[j]), j + 1
+            unit = tokens[j].lower().rstrip("s")
+            if unit in UNITS and count > 0:
+                elements.append(("window", _canonical_window(count, unit)))
+                i = j + 1
+                continue
+        elements.append(("metric", lower) if lower in METRICS else ("word", tokens[i]))
+        i += 1
+    return elements
+
+
+def _shape(elements: Sequence[Element]) -> Tuple[str, ...]:
+    """Element kinds of a question, the index key of the templates. Sensor slots hold words."""
+    return tuple("word" if kind == "sensor" else kind for kind, _ in elements)
+
+
+@dataclass
+class Slot:
+    """A parameter position of the SQL text."""
+
+    kind: str  # sensor, metric or window
+    index: int
+    interval: str = ""  # Window slots: "pg" (INTERVAL 'n unit') or "sqlite" ('-n unit').
+
+
+@dataclass
+class SqlTemplate:
+    """A parametrized agent query, the question form it answers, and its replay statistics."""
+
+    key: str
+    question: List[Element]  # Words stay literal, slots hold ("sensor" | "metric" | "window", index).
+    sql_parts: List[str]  # SQL text around the slots: parts[0] slot[0] parts[1] ... parts[-1].
+    slots: List[Slot]
+    answer_kind: str  # aggregation or id_list
+    decimals: Optional[int]  # Aggregations the agent rounded are rounded alike.
+    highlights: List[Element]  # Answer text, see _highlight_elements(), or empty for a generic text.
+    followup_question: Optional[str]
+    agent_seconds: float
+    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    uses: int = 0
+    successes: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    replay_seconds: float = 0.0
+    last_used_at: Optional[datetime] = None
+
+    def match(self, elements: Sequence[Element]) -> Optional[Dict[str, dict]]:
+        """The parameter values (by kind and slot index) of a question of this form, None when it does not fit."""
+        values: Dict[str, dict] = {"sensor": {}, "metric": {}, "window": {}}
+        for (kind, expected), (actual_kind, actual) in zip(self.question, elements):
+            if kind == "word":
+                if actual_kind != "word" or actual.lower() != expected.lower():
+                    return None
+                continue
+            if kind == "sensor" and actual_kind != "word":
+                return None
+            if kind in ("metric", "window") and actual_kind != kind:
+                return None
+            if values[kind].setdefault(expected, actual) != actual:  # The same slot appears twice in the question.
+                return None
+        return values
+
+    def render(self, values: Dict[str, dict]) -> str:
+        """The SQL text with the parameter values."""
+        out = [self.sql_parts[0]]
+        for slot, part in zip(self.slots, self.sql_parts[1:]):
+            value = values[slot.kind][slot.index]
+            if slot.kind == "window":
+                count, unit = value
+                out.append(f"INTERVAL '{count} {unit}s'" if slot.interval == "pg" else f"'-{count} {unit}s'")
+            else:
+                out.append("'" + value.replace("'", "''") + "'")
+            out.append(part)
+        return "".join(out)
+
+    def to_out(self) -> schemas.SqlTemplateOut:
+        """ Convert the template to its SqlTemplateOut schema instance """
+        names = [f"{{{slot.kind}{slot.index}}}" for slot in self.slots]
+        sql = self.sql_parts[0] + "".join(name + part for name, part in zip(names, self.sql_parts[1:]))
+        return schemas.SqlTemplateOut(
+            key=self.key,
+            sql=sql,
+            answer_kind=self.answer_kind,
+            created_at=self.created_at,
+            last_used_at=self.last_used_at,
+            uses=self.uses,
+            successes=self.successes,
+            failures=self.failures,
+            mean_replay_ms=self.replay_seconds / self.successes * 1000 if self.successes else None,
+            agent_ms=self.agent_seconds * 1000,
+        )
+
+
+def _question_key(question: Sequence[Element]) -> str:
+    words = []
+    for kind, value in question:
+        words.append(value.lower() if kind == "word" else f"{{{kind}{value}}}")
+    return " ".join(words)
+
+
+def _same_value(aggregation: str, raw: str) -> Tuple[bool, Optional[int]]:
+    """Whether the agent's aggregation is the query value, possibly rounded. Returns the rounding decimals."""
+    raw = raw.strip().strip("'")
+    try:
+        expected, actual = float(aggregation), float(raw)
+    except ValueError:
+        return aggregation.strip() == raw, None
+    if expected == actual:
+        return True, None
+    decimals = len(aggregation.split(".", 1)[1]) if "." in aggregation else 0
+    return round(actual, decimals) == expected, decimals
+
+
+def _highlight_elements(
+    answer: str, aggregation: str, sensor_slots: Dict[str, int], metrics: List[str]
+) -> List[Element]:
+    """
+    Split the answer text of an aggregation into ("text", str), ("sensor" | "metric", slot index) and ("value", 0)
+    elements, so a replay names its own sensor, metric and value.
+
+    Returns:
+        List[Element]: The elements, empty when the value is not exactly once in the text or the text names a
+        time window (e.g. "over the last 7 days"), which the replay could not rewrite.
+    """
+    parts = answer.split(aggregation)
+    if len(parts) != 2 or any(token.lower().rstrip("s") in UNITS for token in _TOKEN.findall(answer)):
+        return []
+    names: Dict[str, Element] = {metric: ("metric", index) for index, metric in enumerate(metrics)}
+    names.update((sensor.lower(), ("sensor", index)) for sensor, index in sensor_slots.items())
+    alternatives = "|".join(re.escape(name) for name in sorted(names, key=len, reverse=True))
+    pattern = re.compile(rf"(?<![\w-])({alternatives})(?![\w-])", re.IGNORECASE) if names else None
+
+    elements: List[Element] = []
+    for i, part in enumerate(parts):
+        if i:
+            elements.append(("value", 0))
+        pieces = pattern.split(part) if pattern else [part]
+        for j, piece in enumerate(pieces):
+            if j % 2:
+                elements.append(names[piece.lower()])
+            elif piece:
+                elements.append(("text", piece))
+    return elements
+
+
+def build_template(
+    question: str, query: AgentQuery, parsed: AskResponseFormater, agent_seconds: float
+) -> Optional[SqlTemplate]:
+    """
+    Turn a successful agent run into a template.
+
+    Args:
+        question (str): The user question.
+        query (AgentQuery): The last query the agent executed, and its result text.
+        parsed (AskResponseFormater): The structured answer of the agent.
+        agent_seconds (float): Duration of the agent run.
+
+    Returns:
+        Optional[SqlTemplate]: The template, or None when the run cannot be replayed faithfully.
+    """
+    sql = query.sql.strip().rstrip(";")
+    if _SQL_DATE.search(sql):
+        return None  # Absolute dates, e.g. "last week" resolved by the agent.
+
+    if parsed.id_list:
+        found = {match.lower() for match in _UUID.findall(query.output)}
+        if found != {row_id.lower() for row_id in parsed.id_list} or len(_UUID.findall(query.output)) != len(found):
+            return None
+        answer_kind, decimals = "id_list", None
+    elif parsed.aggregation:
+        single = _SINGLE_VALUE.match(query.output.strip())
+        if single is None:
+            return None
+        same, decimals = _same_value(parsed.aggregation, single.group("value"))
+        if not same:
+            return None
+        answer_kind = "aggregation"
+    else:
+        return None
+
+    elements = tokenize(question)
+    words = {value for kind, value in elements if kind == "word"}
+    metrics = list(dict.fromkeys(value for kind, value in elements if kind == "metric"))
+    windows = list(dict.fromkeys(value for kind, value in elements if kind == "window"))
+
+    sensor_slots: Dict[str, int] = {}
+    used_metrics, used_windows = set(), set()
+    parts, slots, position = [], [], 0
+    spans = sorted(
+        [(m.start(), m.end(), "interval", m) for m in _SQL_INTERVAL.finditer(sql)]
+        + [(m.start(), m.end(), "literal", m) for m in _SQL_LITERAL.finditer(sql)]
+    )
+    for start, end, kind, match in spans:
+        if start < position:
+            continue  # Literal inside an interval.
+        slot = None
+        if kind == "interval":
+            window = _canonical_window(int(match.group("n")), match.group("unit"))
+            if window in windows and (match.group("pg") or match.group("sign")):
+                slot = Slot("window", windows.index(window), "pg" if match.group("pg") else "sqlite")
+                used_windows.add(window)
+        else:
+            value = match.group(1).replace("''", "'")
+            if value.lower() in metrics:
+                slot = Slot("metric", metrics.index(value.lower()))
+                used_metrics.add(value.lower())
+            elif value in words:
+                slot = Slot("sensor", sensor_slots.setdefault(value, len(sensor_slots)))
+        if slot is not None:
+            parts.append(sql[position:start])
+            slots.append(slot)
+            position = end
+    parts.append(sql[position:])
+
+    # Every metric and window of the question must be a parameter, otherwise the SQL ignores it.
+    if used_metrics != set(metrics) or used_windows != set(windows):
+        return None
+
+    highlights = []
+    if answer_kind == "aggregation":
+        highlights = _highlight_elements(parsed.answer, parsed.aggregation, sensor_slots, metrics)
+
+    template_question: List[Element] = []
+    for kind, value in elements:
+        if kind == "word" and value in sensor_slots:
+            template_question.append(("sensor", sensor_slots[value]))
+        elif kind == "metric":
+            template_question.append(("metric", metrics.index(value)))
+        elif kind == "window":
+            template_question.append(("window", windows.index(value)))
+        else:
+            template_question.append((kind, value))
+
+    return SqlTemplate(
+        key=_question_key(template_question),
+        question=template_question,
+        sql_parts=parts,
+        slots=slots,
+        answer_kind=answer_kind,
+        decimals=decimals,
+        highlights=highlights,
+        followup_question=parsed.followup_question,
+        agent_seconds=agent_seconds,
+    )
+
+
+class SqlTemplateCache:
+    """Thread safe LRU of the SQL templates, indexed by the shape of the normalized question."""
+
+    def __init__(self, capacity: int, execute: Callable[[str], List[tuple]] = execute_agent_query):
+        """
+        Args:
+            capacity (int): Maximum number of templates.
+            execute (Callable[[str], List[tuple]]): Runs a replayed query, guarded and read only.
+        """
+        self.capacity = capacity
+        self.execute = execute
+        self._templates: "OrderedDict[str, SqlTemplate]" = OrderedDict()
+        self._by_shape: Dict[Tuple[str, ...], Dict[str, SqlTemplate]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+    def lookup(self, question: str) -> Optional[Tuple[SqlTemplate, Dict[str, dict]]]:
+        """The most recently used template matching a question, and the parameter values of the question."""
+        elements = tokenize(question)
+        with self._lock:
+            candidates = self._by_shape.get(_shape(elements), {})
+            for template in sorted(candidates.values(), key=lambda t: t.last_used_at or t.created_at, reverse=True):
+                values = template.match(elements)
+                if values is not None:
+                    self._templates.move_to_end(template.key)
+                    return template, values
+        return None
+
+    def answer(self, question: str, dal) -> Optional[schemas.AskResponse]:
+        """
+        Answer a question by replaying a matching template.
+
+        Args:
+            question (str): The user question.
+            dal (SensorDataDAL): The data access layer, used to load the rows of id list answers.
+
+        Returns:
+            Optional[schemas.AskResponse]: The answer, or None when no template matches or the replay found nothing.
+        """
+        found = self.lookup(question)
+        if found is None:
+            ASK_TEMPLATES.labels("miss").inc()
+            return None
+        template, values = found
+        start = time.perf_counter()
+        try:
+            rows = self.execute(template.render(values))
+            response = self._response(template, values, rows, dal)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Replay of SQL template %r failed", template.key)
+            response = None
+        self._record(template, response is not None, time.perf_counter() - start)
+        ASK_TEMPLATES.labels("fallback" if response is None else "hit").inc()
+        return response
+
+    def capture(self, question: str, query: AgentQuery, parsed: AskResponseFormater, agent_seconds: float) -> None:
+        """Store the template of a successful agent run, replacing the template of the same question form."""
+        template = build_template(question, query, parsed, agent_seconds)
+        if template is None:
+            return
+        with self._lock:
+            previous = self._templates.pop(template.key, None)
+            if previous is not None:
+                self._by_shape[_shape(previous.question)].pop(previous.key, None)
+            self._templates[template.key] = template
+            self._by_shape.setdefault(_shape(template.question), {})[template.key] = template
+            while len(self._templates) > self.capacity:
+                _, evicted = self._templates.popitem(last=False)
+                self._unindex(evicted)
+        ASK_TEMPLATES.labels("stored").inc()
+
+    def entries(self) -> List[SqlTemplate]:
+        """The templates, most recently used first."""
+        with self._lock:
+            return list(reversed(self._templates.values()))
+
+    def clear(self) -> None:
+        """Drop all templates."""
+        with self._lock:
+            self._templates.clear()
+            self._by_shape.clear()
+
+    def _response(
+        self, template: SqlTemplate, values: Dict[str, dict], rows: List[tuple], dal
+    ) -> Optional[schemas.AskResponse]:
+        """The API response of replayed rows, None when they do not hold an answer."""
+        followup = template.followup_question
+        if template.answer_kind == "aggregation":
+            if len(rows) != 1 or len(rows[0]) != 1 or rows[0][0] is None:
+                return None
+            value = rows[0][0]
+            if template.decimals is not None and isinstance(value, (int, float)):
+                value = round(value, template.decimals)
+            aggregation = str(value)
+            highlights = "".join(
+                text if kind == "text" else aggregation if kind == "value" else values[kind][text]
+                for kind, text in template.highlights
+            ) or f"Result: {aggregation}"
+            return schemas.AskResponse(llm_highlights=highlights, aggregation=aggregation, followup_question=followup)
+
+        ids = list(_row_ids(rows))
+        if not ids:
+            return None
+        return schemas.AskResponse(
+            llm_highlights=f"{len(ids)} matching records.",
+            sensors=schemas.SensorDataOut.from_models(dal.get_sensor_rows_by_ids(ids)),
+            followup_question=followup,
+        )
+
+    def _record(self, template: SqlTemplate, success: bool, seconds: float) -> None:
+        with self._lock:
+            template.uses += 1
+            template.last_used_at = datetime.now(timezone.utc)
+            if success:
+                template.successes += 1
+                template.consecutive_failures = 0
+                template.replay_seconds += seconds
+                return
+            template.failures += 1
+            template.consecutive_failures += 1
+            if template.consecutive_failures >= MAX_CONSECUTIVE_FAILURES and self._templates.get(template.key) is template:
+                del self._templates[template.key]
+                self._unindex(template)
+
+    def _unindex(self, template: SqlTemplate) -> None:
+        bucket = self._by_shape.get(_shape(template.question), {})
+        bucket.pop(template.key, None)
+        if not bucket:
+            self._by_shape.pop(_shape(template.question), None)
+
+
+def _row_ids(rows: List[tuple]) -> Iterator[str]:
+    """The first UUID value of every row."""
+    for row in rows:
+        for value in row:
+            if isinstance(value, uuid.UUID):
+                yield str(value)
+                break
+            if isinstance(value, str) and _UUID.fullmatch(value):
+                yield value
+                break
+
+
+sql_template_cache = SqlTemplateCache(get_settings().ask_template_capacity)
+
+
+def get_sql_template_cache() -> Optional[SqlTemplateCache]:
+    """Get the application wide template cache for DI. None when ASK_TEMPLATE_CAPACITY is 0."""
+    return sql_template_cache if sql_template_cache.capacity > 0 else None
@@ -0,0 +1,162 @@
+"""
+Incremental running statistics of sensor metrics.
+
+Count, mean, variance, min and max are kept as mergeable accumulators (Welford's online algorithm,
+merged with the parallel formula of Chan et al.). Ingest merges the statistics of each written batch
+into per day and all time rows with a single upsert per key, so statistics queries never scan raw data.
+"""
+
+import math
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from typing import Dict, Iterable, List, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app import models
+from app.database import dialect_insert
+
+
+@dataclass
+class RunningStats:
+    """Mergeable accumulator of count, mean, sum of squared deviations (m2), min and max."""
+
+    count: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+    min: float = math.inf
+    max: float = -math.inf
+
+    def add(self, value: float) -> None:
+        """Add a single value (Welford's update)."""
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: "RunningStats") -> None:
+        """Merge another accumulator into this one (Chan et al. parallel update)."""
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.count, self.mean, self.m2, self.min, self.max = other.count, other.mean, other.m2, other.min, other.max
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def variance(self) -> float:
+        """Population variance."""
+        return self.m2 / self.count if self.count else math.nan
+
+    @property
+    def sample_variance(self) -> float:
+        """Sample (Bessel corrected) variance."""
+        return self.m2 / (self.count - 1) if self.count > 1 else math.nan
+
+    @classmethod
+    def from_row(cls, row) -> "RunningStats":
+        """Create an accumulator from a SensorStats or SensorStatsTotal row."""
+        return cls(count=row.count, mean=row.mean, m2=row.m2, min=row.min, max=row.max)
+
+
+def day_bucket(timestamp: datetime) -> date:
+    """UTC day of a timestamp. Naive timestamps are taken as UTC."""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc)
+    return timestamp.date()
+
+
+def _merge_upsert(session: Session, model, values: List[dict], key: List[str]) -> None:
+    """
+    Merge accumulators into the stats table with a single atomic INSERT ... ON CONFLICT DO UPDATE,
+    so concurrent ingest requests do not lose updates.
+    """
+    if not values:
+        return
+    insert = dialect_insert(session.get_bind())
+    if insert is None:
+        _merge_locked(session, model, values, key)
+        return
+    stmt = insert(model).values(values)
+    table, new = model.__table__.c, stmt.excluded
+    count = table.count + new.count
+    delta = new.mean - table.mean
+    least, greatest = (func.least, func.greatest) if session.get_bind().dialect.name == "postgresql" else (func.min, func.max)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=key,
+        set_={
+            "count": count,
+            "mean": table.mean + delta * new.count / count,
+            "m2": table.m2 + new.m2 + delta * delta * table.count * new.count / count,
+            "min": least(table.min, new.min),
+            "max": greatest(table.max, new.max),
+        },
+    )
+    session.execute(stmt)
+
+
+def _merge_locked(session: Session, model, values: List[dict], key: List[str]) -> None:
+    """Fallback of _merge_upsert on databases without ON CONFLICT: lock the stored rows, merge, insert the rest."""
+    for value in values:
+        stored = (
+            session.query(model)
+            .filter(*[getattr(model, name) == value[name] for name in key])
+            .with_for_update()
+            .one_or_none()
+        )
+        if stored is None:
+            session.add(model(**value))
+            continue
+        merged = RunningStats.from_row(stored)
+        merged.merge(RunningStats(**{name: value[name] for name in ("count", "mean", "m2", "min", "max")}))
+        for name, column_value in _columns(merged).items():
+            setattr(stored, name, column_value)
+    session.flush()
+
+
+def update_running_stats(session: Session, rows: Iterable[models.SensorData]) -> None:
+    """
+    Merge the statistics of newly written rows into the day bucket and all time statistics.
+    Runs in the caller's transaction, so statistics and raw rows are committed together.
+
+    Args:
+        session (Session): The write session of the ingest transaction.
+        rows (Iterable[models.SensorData]): The written sensor readings.
+    """
+    daily: Dict[Tuple[str, str, date], RunningStats] = defaultdict(RunningStats)
+    for row in rows:
+        metric = getattr(row.metric, "value", row.metric)
+        daily[(row.sensor_id, metric, day_bucket(row.timestamp))].add(row.value)
+
+    totals: Dict[Tuple[str, str], RunningStats] = defaultdict(RunningStats)
+    for (sensor_id, metric, _), stats in daily.items():
+        totals[(sensor_id, metric)].merge(stats)
+
+    # Sorted keys give a stable lock order between concurrent ingest transactions.
+    _merge_upsert(
+        session,
+        models.SensorStats,
+        [
+            {"sensor_id": s, "metric": m, "bucket": b, **_columns(stats)}
+            for (s, m, b), stats in sorted(daily.items())
+        ],
+        ["sensor_id", "metric", "bucket"],
+    )
+    _merge_upsert(
+        session,
+        models.SensorStatsTotal,
+        [{"sensor_id": s, "metric": m, **_columns(stats)} for (s, m), stats in sorted(totals.items())],
+        ["sensor_id", "metric"],
+    )
+
+
+def _columns(stats: RunningStats) -> dict:
+    return {"count": stats.count, "mean": stats.mean, "m2": stats.m2, "min": stats.min, "max": stats.max}
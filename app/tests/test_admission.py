@@ -0,0 +1,125 @@
+"""Test module for the ingest admission control, including a burst replay load test."""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import pytest
+from fastapi.testclient import TestClient
+from app.admission import BACKLOG, REALTIME, AdmissionController, AdmissionRejected, get_admission_controller
+from app.dal import IngestResult, get_sensor_data_dal
+from app.main import app
+
+
+class FakeClock:
+    """Manually advanced monotonic clock."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_buckets_and_lanes():
+    """Per sensor and global rates are enforced, Retry-After follows the refill time, backlog yields to real-time."""
+    clock = FakeClock()
+    controller = AdmissionController(
+        global_rate=100, global_burst=100, sensor_rate=1, sensor_burst=5,
+        queue_capacity=50, queue_high_water=10, clock=clock,
+    )
+    controller.release(controller.try_admit({"s1": 5}, REALTIME))
+    with pytest.raises(AdmissionRejected) as e:
+        controller.try_admit({"s1": 2}, REALTIME)
+    assert (e.value.reason, e.value.retry_after) == ("rate_limited", 2)
+    clock.now += 2
+    controller.release(controller.try_admit({"s1": 2}, REALTIME))
+
+    # Backlog is admitted up to the high-water mark only, real-time up to the capacity.
+    held = controller.try_admit({f"b{i}": 1 for i in range(10)}, BACKLOG)
+    with pytest.raises(AdmissionRejected) as e:
+        controller.try_admit({"b10": 1}, BACKLOG)
+    assert e.value.reason == "queue_full" and e.value.retry_after >= 1
+    controller.try_admit({f"r{i}": 1 for i in range(40)}, REALTIME)
+    controller.release(held)
+    assert controller.depth == 40
+
+    now = datetime.now(timezone.utc)
+    assert controller.lane([now]) == REALTIME
+    assert controller.lane([now, now - timedelta(hours=1)]) == BACKLOG
+    assert controller.lane([now - timedelta(hours=1)], "realtime") == REALTIME
+
+
+def test_backlog_debt_does_not_delay_realtime():
+    """A backlog replay larger than the burst leaves only the backlog buckets in debt, with its real Retry-After."""
+    clock = FakeClock()
+    controller = AdmissionController(
+        global_rate=20000, global_burst=40000, sensor_rate=10, sensor_burst=3600,
+        queue_capacity=50000, queue_high_water=20000, clock=clock,
+    )
+    controller.release(controller.try_admit({"s1": 10000}, BACKLOG))
+    for _ in range(5):
+        controller.release(controller.try_admit({"s1": 1}, REALTIME))
+        clock.now += 0.1
+    with pytest.raises(AdmissionRejected) as e:
+        controller.try_admit({"s1": 1}, BACKLOG)
+    assert (e.value.reason, e.value.retry_after) == ("rate_limited", 640)  # (6400 debt - 5 refilled + 1) / 10 per second.
+
+
+def test_burst_replay_load():
+    """
+    Replays a burst of backlog batches from many gateways while sensors keep sending real-time readings.
+    The database sees a bounded number of readings at a time, backlog batches get 429 with Retry-After once
+    the queue or their rate is exhausted, real-time readings are not rejected.
+    """
+    controller = AdmissionController(
+        global_rate=2000, global_burst=2000, sensor_rate=10, sensor_burst=100,
+        queue_capacity=2000, queue_high_water=1000,
+    )
+    in_db, max_in_db, lock = [0], [0], threading.Lock()
+
+    class SlowDAL:
+        """Stands in for a database that needs time per batch."""
+
+        def create_sensor_data_bulk(self, rows):
+            with lock:
+                in_db[0] += len(rows)
+                max_in_db[0] = max(max_in_db[0], in_db[0])
+            time.sleep(0.02)
+            with lock:
+                in_db[0] -= len(rows)
+            return IngestResult(received=len(rows), inserted=len(rows))
+
+    app.dependency_overrides[get_sensor_data_dal] = SlowDAL
+    app.dependency_overrides[get_admission_controller] = lambda: controller
+    client = TestClient(app)
+    now = datetime.now(timezone.utc)
+
+    def send(gateway: int, backlog: bool):
+        start = now - timedelta(hours=6) if backlog else now
+        readings = [
+            {
+                "sensor_id": f"sensor_{gateway}_{i}",
+                "metric": "temperature",
+                "value": 20.0,
+                "timestamp": (start + timedelta(seconds=i)).isoformat(),
+            }
+            for i in range(250 if backlog else 5)
+        ]
+        return backlog, client.post("/api/v1/sensors/data/bulk", json={"readings": readings})
+
+    try:
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            jobs = [pool.submit(send, i, i % 4 != 0) for i in range(200)]
+            results = [job.result() for job in jobs]
+    finally:
+        app.dependency_overrides.clear()
+
+    backlog_codes = [r.status_code for backlog, r in results if backlog]
+    realtime_codes = [r.status_code for backlog, r in results if not backlog]
+    assert set(realtime_codes) == {200}
+    assert 429 in backlog_codes and 200 in backlog_codes
+    rejected = next(r for backlog, r in results if r.status_code == 429)
+    assert 1 <= int(rejected.headers["Retry-After"]) <= 60
+    assert max_in_db[0] <= controller.queue_capacity
+    assert controller.depth == 0
@@ -0,0 +1,82 @@
+"""Test module for the aligned, gap-filled series matrix."""
+
+from datetime import datetime, timedelta
+import numpy as np
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app import models
+from app.alignment import FillMethod, fill_gaps, grid_start
+from app.api import endpoints
+from app.dal import SensorDataDAL, get_sensor_data_dal
+from app.main import app
+
+
+def test_fill_gaps():
+    """Fill methods do not extrapolate beyond the first and last non-empty bucket."""
+    values = np.array([np.nan, 1.0, np.nan, np.nan, 4.0, np.nan])
+    assert np.array_equal(fill_gaps(values, FillMethod.NULL), values, equal_nan=True)
+    assert np.array_equal(
+        fill_gaps(values, FillMethod.PREVIOUS), [np.nan, 1.0, 1.0, 1.0, 4.0, 4.0], equal_nan=True
+    )
+    assert np.array_equal(
+        fill_gaps(values, FillMethod.LINEAR), [np.nan, 1.0, 2.0, 3.0, 4.0, np.nan], equal_nan=True
+    )
+    # Buckets follow Timescale time_bucket() alignment.
+    assert grid_start(datetime(2025, 1, 1, 8, 7, 30), timedelta(minutes=5)) == datetime(2025, 1, 1, 8, 5)
+
+
+def test_aligned_matrix_endpoint(tmp_path, monkeypatch):
+    """Two metrics of a sensor are lined up on a minute grid, across DAL chunk boundaries."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'matrix.db'}", connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    start = datetime(2025, 1, 1, 8, 0)
+    readings = [
+        (models.MetricEnum.TEMPERATURE, start + timedelta(seconds=s), v) for s, v in ((0, 20.0), (30, 22.0), (180, 24.0))
+    ] + [(models.MetricEnum.HUMIDITY, start + timedelta(minutes=m), 40.0 + m) for m in (1, 3)]
+    SensorDataDAL(session).create_sensor_data_bulk(
+        [models.SensorData(sensor_id="sensor_1", metric=m, timestamp=t, value=v) for m, t, v in readings]
+    )
+
+    class ChunkedDAL(SensorDataDAL):
+        """Small chunks, so series continue across chunks."""
+
+        def iter_sensor_values(self, *args, **kwargs):
+            return super().iter_sensor_values(*args, **{**kwargs, "chunk_size": 2})
+
+    app.dependency_overrides[get_sensor_data_dal] = lambda: ChunkedDAL(session)
+    try:
+        response = TestClient(app).get(
+            "/api/v1/sensors/matrix",
+            params={"date_from": "2025-01-01T08:00:10Z", "date_to": "2025-01-01T08:05:00Z", "fill": "linear"},
+        )
+        assert response.status_code == 200
+        matrix = response.json()
+        assert matrix["start"].startswith("2025-01-01T08:00:00")
+        assert (matrix["interval_seconds"], matrix["length"]) == (60, 5)
+        assert [(s["metric"], s["values"]) for s in matrix["series"]] == [
+            ("humidity", [None, 41.0, 42.0, 43.0, None]),
+            ("temperature", [21.0, 22.0, 23.0, 24.0, None]),
+        ]
+
+        response = TestClient(app).get(
+            "/api/v1/sensors/matrix",
+            params={"date_from": "2025-01-01T08:00:00", "date_to": "2025-03-01T08:00:00", "interval_seconds": 1},
+        )
+        assert response.status_code == 400
+
+        # Oversized matrices are rejected before any reading is aligned.
+        class UnreadDAL(SensorDataDAL):
+            def get_aligned_series(self, *args, **kwargs):
+                raise AssertionError("The readings must not be read")
+
+        app.dependency_overrides[get_sensor_data_dal] = lambda: UnreadDAL(session)
+        monkeypatch.setattr(endpoints, "MATRIX_MAX_CELLS", 9)
+        response = TestClient(app).get(
+            "/api/v1/sensors/matrix", params={"date_from": "2025-01-01T08:00:00", "date_to": "2025-01-01T08:05:00"}
+        )
+        assert response.status_code == 400 and "9 values" in response.json()["detail"]
+    finally:
+        app.dependency_overrides.clear()
+        session.close()
@@ -0,0 +1,94 @@
+"""Test module for the streaming anomaly scan."""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app import models
+from app.anomaly import AnomalyParams, scan_anomalies
+from app.dal import SensorDataDAL
+
+
+def _readings():
+    """Two noisy series with a spike, a level shift and a fast jump at known positions."""
+    rng = np.random.default_rng(7)
+    start = datetime(2025, 1, 1)
+    rows = []
+    for sensor_id in ("sensor1", "sensor2"):
+        values = 20 + rng.normal(0, 0.5, 500)
+        if sensor_id == "sensor1":
+            values[300] += 15
+        else:
+            values[400:] += 10
+        rows.extend(
+            (sensor_id, "temperature", start + timedelta(seconds=10 * i), float(v)) for i, v in enumerate(values)
+        )
+    return rows
+
+
+def _chunks(rows, size):
+    return (rows[i : i + size] for i in range(0, len(rows), size))
+
+
+def test_scan_flags_injected_anomalies():
+    """The spike and the level shift are flagged, the noise is not."""
+    rows = _readings()
+    params = AnomalyParams(window=60, z_threshold=5, ewma_threshold=5, max_rate=1.0)
+    scanned, anomalies, truncated = scan_anomalies(_chunks(rows, 10000), params)
+
+    assert scanned == len(rows) and not truncated
+    flagged = {(a.sensor_id, a.timestamp) for a in anomalies}
+    assert ("sensor1", rows[300][2]) in flagged
+    assert ("sensor2", rows[900][2]) in flagged
+    positions = {(a.sensor_id, int((a.timestamp - rows[0][2]).total_seconds()) // 10) for a in anomalies}
+    assert {p for s, p in positions if s == "sensor1"} <= {300, 301}  # the spike and the drop back
+    assert min(p for s, p in positions if s == "sensor2") == 400
+    spike = next(a for a in anomalies if a.timestamp == rows[300][2])
+    assert set(spike.checks) == {"zscore", "ewma", "rate"}
+
+
+def test_scan_does_not_depend_on_chunking():
+    """Carried state gives the same result for any chunk size, inline and in worker processes."""
+    rows = _readings()
+    params = AnomalyParams(window=30, z_threshold=3, ewma_threshold=3, max_rate=0.5)
+    _, expected, _ = scan_anomalies(_chunks(rows, len(rows)), params)
+    assert expected
+
+    _, small, _ = scan_anomalies(_chunks(rows, 7), params)
+    with ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("spawn")) as executor:
+        _, pooled, _ = scan_anomalies(_chunks(rows, 128), params, executor)
+
+    for result in (small, pooled):
+        assert [(a.sensor_id, a.timestamp, a.checks) for a in result] == [
+            (a.sensor_id, a.timestamp, a.checks) for a in expected
+        ]
+        assert np.allclose([a.zscore or 0 for a in result], [a.zscore or 0 for a in expected])
+
+    _, limited, truncated = scan_anomalies(_chunks(rows, 7), params, max_results=1)
+    assert len(limited) == 1 and truncated
+
+
+def test_scan_over_dal_stream():
+    """The DAL streams the readings ordered by series and time in chunks."""
+    engine = create_engine("sqlite:///:memory:")
+    models.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        dal = SensorDataDAL(session)
+        dal.create_sensor_data_bulk(
+            [
+                models.SensorData(sensor_id=s, metric=models.MetricEnum(m), timestamp=t, value=v)
+                for s, m, t, v in reversed(_readings())
+            ]
+        )
+        chunks = list(dal.iter_sensor_values(sensor_ids=["sensor1"], chunk_size=100))
+        assert [len(c) for c in chunks] == [100] * 5
+        flat = [row for chunk in chunks for row in chunk]
+        assert [row[2] for row in flat] == sorted(row[2] for row in flat)
+
+        _, anomalies, _ = scan_anomalies(iter(chunks), AnomalyParams(z_threshold=5, ewma_threshold=5))
+        assert [a.value for a in anomalies] == [max(row[3] for row in flat)]
+    finally:
+        session.close()
@@ -5,8 +5,9 @@ from datetime import datetime, timedelta
 import pytest
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from app import models
+from app import database, liveness, models, stats
 from app.dal import SensorDataDAL
+from app.dedup import RecentKeyFilter, fingerprint
 
 # Setup in-memory SQLite for testing
 engine = create_engine("sqlite:///:memory:")
@@ -120,3 +121,180 @@ def test_list_sensor_data(sensor_dal: SensorDataDAL):
     date_to_str = (now + timedelta(days=1)).isoformat()
     results = sensor_dal.list_sensor_data(date_from=date_from_str, date_to=date_to_str)
     assert len(results) == 2
+
+    # Ordered by timestamp, then ID.
+    results = sensor_dal.list_sensor_data()
+    assert [(r.timestamp, r.id) for r in results] == sorted((r.timestamp, r.id) for r in results)
+    assert results[0].id == data1.id
+
+
+def test_read_write_split(db_session):
+    """Writes go to the primary session, list and id lookups to the read session."""
+    replica_engine = create_engine("sqlite:///:memory:")
+    models.Base.metadata.create_all(bind=replica_engine)
+    replica_session = sessionmaker(bind=replica_engine)()
+    try:
+        dal = SensorDataDAL(db_session, replica_session)
+        data = models.SensorData(
+            id=uuid.uuid4(),
+            sensor_id="sensor1",
+            metric=models.MetricEnum.TEMPERATURE,
+            value=20,
+            timestamp=datetime.now(),
+        )
+        dal.create_sensor_data(data)
+
+        # Row is on the primary only, the (not replicated) read side does not see it.
+        assert db_session.query(models.SensorData).count() == 1
+        assert dal.list_sensor_data(sensor_ids=["sensor1"]) == []
+        assert dal.get_sensor_rows_by_ids([str(data.id)]) == []
+    finally:
+        replica_session.close()
+
+
+def test_running_stats(sensor_dal: SensorDataDAL):
+    """Statistics maintained at ingest match the statistics of the raw values."""
+    day1 = datetime(2025, 1, 1, 12, 0)
+    day2 = datetime(2025, 1, 2, 12, 0)
+    minute = timedelta(minutes=1)
+    values = [(day1 + minute, 10.0), (day1 + 2 * minute, 12.0), (day2, 20.0), (day2 + minute, 30.0), (day2 + 2 * minute, 40.0)]
+    sensor_dal.create_sensor_data(
+        models.SensorData(
+            id=uuid.uuid4(),
+            sensor_id="sensor1",
+            metric=models.MetricEnum.TEMPERATURE,
+            value=5.0,
+            timestamp=day1,
+        )
+    )
+    written = sensor_dal.create_sensor_data_bulk(
+        [
+            models.SensorData(sensor_id="sensor1", metric=models.MetricEnum.TEMPERATURE, value=v, timestamp=ts)
+            for ts, v in values
+        ]
+    )
+    assert written.inserted == 5
+
+    ((sensor_id, metric, stats),) = sensor_dal.get_sensor_stats(sensor_ids=["sensor1"])
+    all_values = [5.0] + [v for _, v in values]
+    mean = sum(all_values) / len(all_values)
+    assert (sensor_id, metric) == ("sensor1", "temperature")
+    assert stats.count == 6
+    assert stats.mean == pytest.approx(mean)
+    assert stats.variance == pytest.approx(sum((v - mean) ** 2 for v in all_values) / len(all_values))
+    assert (stats.min, stats.max) == (5.0, 40.0)
+
+    # Day range merges only the buckets of the range.
+    ((_, _, day2_stats),) = sensor_dal.get_sensor_stats(date_from="2025-01-02", date_to="2025-01-02")
+    assert day2_stats.count == 3
+    assert day2_stats.mean == pytest.approx(30.0)
+
+
+def test_idempotent_ingest(db_session):
+    """Retried readings are dropped within the batch, by the filter and by the unique index."""
+    recent_keys = RecentKeyFilter(capacity=100)
+    dal = SensorDataDAL(db_session, recent_keys=recent_keys)
+    start = datetime(2025, 1, 1)
+
+    def reading(minute, value=1.0):
+        return models.SensorData(
+            sensor_id="sensor1",
+            metric=models.MetricEnum.TEMPERATURE,
+            value=value,
+            timestamp=start + timedelta(minutes=minute),
+        )
+
+    result = dal.create_sensor_data_bulk([reading(0), reading(1), reading(1)])
+    assert (result.inserted, result.batch_duplicates) == (2, 1)
+
+    result = dal.create_sensor_data_bulk([reading(1), reading(2)])
+    assert (result.inserted, result.filtered, result.stored_duplicates) == (1, 1, 0)
+
+    # A new process starts with an empty filter, the unique index still catches the duplicates.
+    recent_keys.clear()
+    result = dal.create_sensor_data_bulk([reading(0), reading(3)])
+    assert (result.inserted, result.filtered, result.stored_duplicates) == (1, 0, 1)
+
+    recent_keys.clear()
+    first = dal.create_sensor_data(reading(4, 10.0))
+    retried = reading(4, 99.0)
+    stored = dal.create_sensor_data(retried)
+    assert stored is not retried and stored.id == first.id and stored.value == 10.0
+    assert dal.create_sensor_data(reading(4)).id == first.id  # Dropped by the filter.
+
+    # A filter hit without a stored row (fingerprint collision) is written, not reported as stored.
+    recent_keys.add_many([fingerprint("sensor1", models.MetricEnum.TEMPERATURE, start + timedelta(minutes=5))])
+    collided = dal.create_sensor_data(reading(5, 50.0))
+    assert db_session.query(models.SensorData).filter_by(id=collided.id).one().value == 50.0
+
+    assert db_session.query(models.SensorData).count() == 6
+    ((_, _, stats),) = dal.get_sensor_stats(sensor_ids=["sensor1"])
+    assert stats.count == 6
+
+
+def test_ingest_without_on_conflict(db_session, monkeypatch):
+    """On databases without ON CONFLICT the ingest falls back to select-then-insert and locked merges."""
+    monkeypatch.setattr(database, "dialect_insert", lambda bind: None)
+    monkeypatch.setattr(stats, "dialect_insert", lambda bind: None)
+    monkeypatch.setattr(liveness, "dialect_insert", lambda bind: None)
+    dal = SensorDataDAL(db_session)
+    start = datetime(2025, 1, 1)
+    readings = lambda minutes: [  # noqa: E731
+        models.SensorData(sensor_id="sensor1", metric=models.MetricEnum.TEMPERATURE, value=float(minute),
+                          timestamp=start + timedelta(minutes=minute))
+        for minute in minutes
+    ]
+
+    assert dal.create_sensor_data_bulk(readings([0, 1, 2])).inserted == 3
+    result = dal.create_sensor_data_bulk(readings([2, 3]))
+    assert (result.inserted, result.stored_duplicates) == (1, 1)
+    ((_, _, merged),) = dal.get_sensor_stats(sensor_ids=["sensor1"])
+    assert (merged.count, merged.mean, merged.max) == (4, 1.5, 3.0)
+    (state,) = db_session.query(models.SensorLiveness).all()
+    assert (state.readings, state.last_seen) == (4, start + timedelta(minutes=3))
+
+
+def test_iter_sensor_rows_by_ids(sensor_dal: SensorDataDAL):
+    """Large ID lookups are split into bounded chunks, unknown and repeated IDs are ignored."""
+    start = datetime(2025, 1, 1)
+    rows = [
+        models.SensorData(
+            sensor_id="sensor1",
+            metric=models.MetricEnum.TEMPERATURE,
+            value=float(i),
+            timestamp=start + timedelta(seconds=i),
+        )
+        for i in range(1200)
+    ]
+    sensor_dal.create_sensor_data_bulk(rows)
+    ids = [str(row.id) for row in rows] + [str(rows[0].id), str(uuid.uuid4())]
+
+    chunks = list(sensor_dal.iter_sensor_rows_by_ids(ids, chunk_size=250))
+    assert all(len(chunk) <= 250 for chunk in chunks)
+    assert sorted(row.value for chunk in chunks for row in chunk) == [float(i) for i in range(1200)]
+
+    with pytest.raises(ValueError):
+        sensor_dal.iter_sensor_rows_by_ids(["not-a-uuid"])
+
+
+def test_ingest_watermark(sensor_dal: SensorDataDAL):
+    """The watermark of a range moves when readings arrive in it, and only then."""
+    day = datetime(2025, 1, 1, 12, 0)
+
+    def ingest(timestamp, value):
+        sensor_dal.create_sensor_data_bulk(
+            [
+                models.SensorData(
+                    sensor_id="sensor1", metric=models.MetricEnum.TEMPERATURE, value=value, timestamp=timestamp
+                )
+            ]
+        )
+
+    ingest(day, 10.0)
+    before = sensor_dal.get_ingest_watermark(["sensor1"], None, "2025-01-01", "2025-01-01")
+    assert before == (1, 1, 10.0)
+    ingest(day, 10.0)  # Duplicate
+    ingest(day + timedelta(days=1), 11.0)  # Outside the range
+    assert sensor_dal.get_ingest_watermark(["sensor1"], None, "2025-01-01", "2025-01-01") == before
+    ingest(day + timedelta(minutes=1), 12.0)  # Late reading in the range
+    assert sensor_dal.get_ingest_watermark(["sensor1"], None, "2025-01-01", "2025-01-01") == (1, 2, 22.0)
@@ -0,0 +1,140 @@
+"""Test module for the embedded edge mode (SQLite WAL with daily partitions)."""
+
+import uuid
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from app import models
+from app.dal import SensorDataDAL
+from app.database import configure_sqlite
+from app.edge import DailyPartitions, EdgeSync, ReadingOutOfRange, init_edge
+
+NOW = datetime(2026, 3, 10, 12, 0)
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class FakeUpstream:
+    """Records the bulk ingest requests, answers with the queued status codes."""
+
+    def __init__(self):
+        self.requests = []
+        self.statuses = []
+
+    def post(self, url, json, headers, timeout):
+        self.requests.append((url, json, headers))
+        return FakeResponse(self.statuses.pop(0) if self.statuses else 200, {"Retry-After": "7"})
+
+
+@pytest.fixture(scope="function")
+def edge(tmp_path):
+    """Edge database file with the clock at NOW."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'edge.db'}")
+    configure_sqlite(engine)
+    clock = {"now": NOW}
+    partitions = DailyPartitions(engine, clock=lambda: clock["now"])
+    init_edge(partitions)
+    yield partitions, sessionmaker(bind=engine), clock
+    engine.dispose()
+
+
+def readings(sensor_id, start, count, step=timedelta(hours=6)):
+    return [
+        models.SensorData(sensor_id=sensor_id, metric=models.MetricEnum.TEMPERATURE, value=i, timestamp=start + i * step)
+        for i in range(count)
+    ]
+
+
+def test_partitioned_ingest_and_reads(edge):
+    """Readings land in their daily partitions and are read back through the sensor_data view."""
+    partitions, session_factory, _ = edge
+    with session_factory() as session:
+        dal = SensorDataDAL(session, partitions=partitions)
+        first = dal.create_sensor_data_bulk(readings("s1", NOW - timedelta(days=2), 8))
+        retried = dal.create_sensor_data_bulk(readings("s1", NOW - timedelta(days=2), 10))
+        assert (first.inserted, retried.inserted, retried.stored_duplicates) == (8, 2, 8)
+        assert dal.create_sensor_data(readings("s2", NOW, 1)[0]).sensor_id == "s2"
+
+        assert session.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert [day.day for day in partitions.days()] == [8, 9, 10, 11]
+        rows = dal.list_sensor_data(["s1"], None, (NOW - timedelta(days=1)).isoformat(), NOW.isoformat())
+        assert sorted(row.value for row in rows) == [4, 5, 6, 7, 8]
+        ids = [str(row.id) for row in rows[:2]]
+        assert sorted(str(row.id) for row in dal.get_sensor_rows_by_ids(ids)) == sorted(ids)
+        assert dal.get_sensor_stats(["s1"])[0][2].count == 10
+
+
+def test_readings_outside_retention_are_dropped(edge):
+    """Readings before the retention window or after tomorrow create no partitions and are counted."""
+    partitions, session_factory, _ = edge
+    partitions.retention_days = 3
+    with session_factory() as session:
+        dal = SensorDataDAL(session, partitions=partitions)
+        rows = readings("s1", NOW - timedelta(days=4), 3, step=timedelta(days=3))  # 4 days ago, yesterday, in 2 days
+        rows += readings("s2", NOW - timedelta(days=400 * 365), 1)
+        result = dal.create_sensor_data_bulk(rows)
+        assert (result.inserted, result.out_of_range, result.stored_duplicates) == (1, 3, 0)
+        with pytest.raises(ReadingOutOfRange):
+            dal.create_sensor_data(readings("s3", NOW + timedelta(days=30), 1)[0])
+        assert partitions.insert_new(session, [{
+            "id": uuid.uuid4(), "timestamp": NOW + timedelta(days=5), "sensor_id": "s4",
+            "metric": models.MetricEnum.TEMPERATURE, "value": 1.0,
+        }]) == set()
+    assert [day.day for day in partitions.days()] == [9, 10, 11]
+
+
+def test_sync_caps_sensor_readings_and_resumes(edge):
+    """Requests hold at most sensor_batch_size readings of a sensor, a throttled pass resumes where it stopped."""
+    partitions, session_factory, _ = edge
+    day = datetime(2026, 3, 8)
+    with session_factory() as session:
+        dal = SensorDataDAL(session, partitions=partitions)
+        dal.create_sensor_data_bulk(readings("s1", day, 4) + readings("s2", day, 4))
+
+    upstream = FakeUpstream()
+    upstream.statuses = [200, 429]
+    sync = EdgeSync(partitions, "http://central:8000", batch_size=5, timeout=5, http=upstream, sensor_batch_size=3)
+    assert sync.run() == {}
+    assert sync.run() == {day.date(): 8}
+    sent = [[r["sensor_id"] for r in body["readings"]] for _, body, _ in upstream.requests]
+    assert sent == [["s1"] * 3, ["s1", "s2", "s2", "s2"], ["s1", "s2", "s2", "s2"], ["s2"]]
+
+
+def test_sync_and_prune(edge):
+    """Closed partitions are shipped once per version, expired ones are dropped only after they are shipped."""
+    partitions, session_factory, clock = edge
+    with session_factory() as session:
+        dal = SensorDataDAL(session, partitions=partitions)
+        dal.create_sensor_data_bulk(readings("s1", NOW - timedelta(days=3), 14))
+
+        upstream = FakeUpstream()
+        sync = EdgeSync(partitions, "http://central:8000/", batch_size=3, timeout=5, http=upstream)
+        assert sync.run() == {(NOW - timedelta(days=3)).date(): 2, (NOW - timedelta(days=2)).date(): 4,
+                              (NOW - timedelta(days=1)).date(): 4}
+        url, body, headers = upstream.requests[0]
+        assert url == "http://central:8000/api/v1/sensors/data/bulk" and headers["X-Ingest-Priority"] == "backlog"
+        assert body["readings"][0] == {"sensor_id": "s1", "metric": "temperature", "value": 0.0,
+                                       "timestamp": "2026-03-07T12:00:00"}
+        assert sync.run() == {}
+
+        # A late reading makes its day ship again. Throttling pauses the sync.
+        dal.create_sensor_data_bulk(readings("s2", NOW - timedelta(days=2), 1))
+        upstream.statuses = [429]
+        assert sync.run() == {}
+        assert partitions.unsynced() == [(NOW - timedelta(days=2)).date()]
+
+    clock["now"] = NOW + timedelta(days=2)
+    assert partitions.prune(retention_days=3, synced_only=True) == [(NOW - timedelta(days=3)).date()]
+    assert sync.run() == {(NOW - timedelta(days=2)).date(): 5, NOW.date(): 4, (NOW + timedelta(days=1)).date(): 0}
+    assert partitions.prune(retention_days=3, synced_only=True) == [(NOW - timedelta(days=2)).date()]
+    with session_factory() as session:
+        assert len(SensorDataDAL(session).list_sensor_data(["s1"])) == 8
@@ -1,6 +1,11 @@
 """Test module for API endpoints."""
 
+import asyncio
+import json
+import threading
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 import pytest
 from fastapi.testclient import TestClient
@@ -10,8 +15,11 @@ from app.database import Base
 from app.models import SensorData, MetricEnum
 from app.main import app
 from app import schemas
-from app.api.endpoints import get_llm_agent
-from app.dal import get_sensor_data_dal, SensorDataDAL
+from app.api.endpoints import ask_sensor_data_batch, get_llm_agent
+from app.dal import get_sensor_data_dal, get_sensor_data_dal_factory, SensorDataDAL
+from app.ingest_events import notify_ingested
+from app.result_cache import result_cache
+from app.sql_templates import get_sql_template_cache
 
 client = TestClient(app)
 
@@ -63,6 +71,9 @@ def test_list_sensor_data():
 
     # Create a mock DAL class
     class MockSensorDataDAL:
+        def get_ingest_watermark(self, sensor_ids, metrics, date_from, date_to):
+            return (1, 1, 25.5)
+
         def list_sensor_data(self, sensor_ids, metrics, date_from, date_to):
             return [
                 schemas.SensorDataOut(
@@ -101,8 +112,8 @@ def test_batch_get_sensor_data():
 
     # Create a mock DAL class
     class MockSensorDataDAL:
-        def get_sensor_rows_by_ids(self, sensor_ids):
-            return [
+        def iter_sensor_rows_by_ids(self, sensor_ids):
+            return iter([[
                 schemas.SensorDataOut(
                     id="acff4f6d-6e51-4b20-be91-35571be93e0a",
                     sensor_id="sensor1",
@@ -110,7 +121,7 @@ def test_batch_get_sensor_data():
                     value=25.5,
                     timestamp=datetime(2025, 1, 1),
                 )
-            ]
+            ]])
 
     def mock_get_sensor_data_dal():
         return MockSensorDataDAL()
@@ -269,3 +280,146 @@ def test_ask_sensor_data():
     finally:
         # Clean up the dependency override
         app.dependency_overrides.clear()
+
+
+def test_metrics_endpoint():
+    """Test Prometheus metrics exposure including the per route request latency."""
+
+    class MockSensorDataDAL:
+        def get_ingest_watermark(self, sensor_ids, metrics, date_from, date_to):
+            return (0, 0, 0.0)
+
+        def list_sensor_data(self, sensor_ids, metrics, date_from, date_to):
+            return []
+
+    app.dependency_overrides[get_sensor_data_dal] = lambda: MockSensorDataDAL()
+
+    try:
+        client.get("/api/v1/sensors/list")
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert "sensory_http_request_duration_seconds" in response.text
+        assert 'sensors/list"' in response.text
+        assert "sensory_llm_agent_duration_seconds" in response.text
+    finally:
+        app.dependency_overrides.clear()
+
+
+def test_conditional_get_of_closed_range():
+    """
+    A closed range is cacheable, a current ETag is answered with 304 without running the query.
+    Repeated queries are served from the result cache until readings are ingested into the range.
+    """
+
+    class MockSensorDataDAL:
+        watermark = (1, 10, 200.0)
+        queries = 0
+        lookups = 0
+
+        def get_ingest_watermark(self, sensor_ids, metrics, date_from, date_to):
+            MockSensorDataDAL.lookups += 1
+            return self.watermark
+
+        def list_sensor_data(self, sensor_ids, metrics, date_from, date_to):
+            MockSensorDataDAL.queries += 1
+            return []
+
+    app.dependency_overrides[get_sensor_data_dal] = MockSensorDataDAL
+
+    try:
+        params = {"sensor_id": "sensor1", "date_from": "2020-01-01", "date_to": "2020-01-02"}
+        response = client.get("/api/v1/sensors/list", params=params)
+        assert response.status_code == 200
+        assert response.headers["cache-control"].startswith("public, max-age=")
+        etag = response.headers["etag"]
+
+        response = client.get("/api/v1/sensors/list", params=params, headers={"If-None-Match": etag})
+        assert response.status_code == 304 and response.headers["etag"] == etag
+        response = client.get("/api/v1/sensors/list", params=params)
+        assert response.status_code == 200 and response.headers["etag"] == etag
+        assert MockSensorDataDAL.queries == 1
+        # An equivalent query in another notation shares the cache entry and the ETag.
+        equivalent = {"sensor_id": ["sensor1", "sensor1"], "date_from": "2020-01-01T00:00:00Z",
+                      "date_to": "2020-01-02T00:00:00+00:00"}
+        response = client.get("/api/v1/sensors/list", params=equivalent, headers={"If-None-Match": etag})
+        assert response.status_code == 304 and response.headers["etag"] == etag
+
+        # Late data in other series or outside the range keeps the cached result.
+        late = SensorData(sensor_id="sensor2", metric=MetricEnum.TEMPERATURE, timestamp=datetime(2020, 1, 1, 12))
+        notify_ingested([late, SensorData(sensor_id="sensor1", metric="humidity", timestamp=datetime(2020, 3, 1))])
+        client.get("/api/v1/sensors/list", params=params)
+        assert MockSensorDataDAL.queries == 1
+
+        # Late data arrives in the range.
+        MockSensorDataDAL.watermark = (1, 11, 215.0)
+        late.sensor_id = "sensor1"
+        notify_ingested([late])
+        response = client.get("/api/v1/sensors/list", params=params, headers={"If-None-Match": etag})
+        assert response.status_code == 200 and response.headers["etag"] != etag
+        assert MockSensorDataDAL.queries == 2
+
+        # Open ranges are revalidated on every use, unconditional requests skip the watermark lookup.
+        lookups = MockSensorDataDAL.lookups
+        response = client.get("/api/v1/sensors/list", params={"sensor_id": "sensor1"})
+        assert response.headers["cache-control"] == "no-cache" and "etag" not in response.headers
+        assert MockSensorDataDAL.lookups == lookups
+        response = client.get("/api/v1/sensors/list", params={"sensor_id": "sensor2"}, headers={"If-None-Match": etag})
+        assert response.status_code == 200 and "etag" in response.headers
+        assert MockSensorDataDAL.lookups == lookups + 1
+    finally:
+        app.dependency_overrides.clear()
+        result_cache.clear()
+
+
+def test_ask_sensor_data_batch():
+    """Batch questions run concurrently, stream in completion order, equal prompts share one agent run."""
+    prompts = []
+    release = threading.Event()
+
+    class MockAgent:
+        def invoke(self, args):
+            prompts.append(args["input"])
+            if "slow" in args["input"]:
+                assert release.wait(5)
+            if "broken" in args["input"]:
+                return {"output": "not JSON"}
+            return {"output": '{"answer": "ok", "followup_question": "", "aggregation": "1"}'}
+
+    @contextmanager
+    def mock_dal():
+        yield None  # Aggregation answers do not touch the DAL.
+
+    questions = ["slow question one", "fast question", "fast  question ", "broken question"]
+    batch = schemas.AskBatchRequest(questions=[{"question": q} for q in questions])
+
+    async def stream():
+        response = ask_sensor_data_batch(
+            batch, dal_factory=mock_dal, llm_agent=MockAgent(), templates=None, executor=executor
+        )
+        lines = response.body_iterator
+        # The other questions are answered while the slow one is still running.
+        first = [json.loads(await anext(lines)) for _ in range(3)]
+        release.set()
+        return first, [json.loads(line) async for line in lines]
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        first, rest = asyncio.run(stream())
+    assert sorted(item["index"] for item in first) == [1, 2, 3] and [item["index"] for item in rest] == [0]
+    by_index = {item["index"]: item for item in first + rest}
+    assert by_index[2]["question"] == "fast  question " and by_index[2]["response"]["aggregation"] == "1"
+    assert (by_index[3]["status"], by_index[3]["error"]) == (500, "Invalid JSON response from LLM")
+    assert len(prompts) == 3
+
+    app.dependency_overrides[get_llm_agent] = MockAgent
+    app.dependency_overrides[get_sensor_data_dal_factory] = lambda: mock_dal
+    app.dependency_overrides[get_sql_template_cache] = lambda: None
+    try:
+        response = client.post("/api/v1/sensors/ask/batch", json={"questions": [{"question": "fast question"}]})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        assert json.loads(response.text)["response"]["aggregation"] == "1"
+
+        assert client.post("/api/v1/sensors/ask/batch", json={"questions": []}).status_code == 422
+    finally:
+        app.dependency_overrides.clear()
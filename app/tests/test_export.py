@@ -0,0 +1,119 @@
+"""Test module for the streaming raw data export."""
+
+import csv
+import io
+from datetime import datetime, timedelta
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app import models
+from app.api import endpoints
+from app.dal import SensorDataDAL, get_sensor_data_dal
+from app.export import copy_to_stdout, negotiate_encoding, rows_to_parquet
+from app.main import app
+
+
+@pytest.fixture(name="export_dal")
+def fixture_export_dal(tmp_path):
+    """DAL over a file database with 2500 readings, served to the API."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'export.db'}", connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    start = datetime(2025, 1, 1)
+    SensorDataDAL(session).create_sensor_data_bulk(
+        [
+            models.SensorData(
+                sensor_id=f"sensor_{i % 2}",
+                metric=models.MetricEnum.TEMPERATURE,
+                value=float(i),
+                timestamp=start + timedelta(seconds=i),
+            )
+            for i in range(2500)
+        ]
+    )
+    dal = SensorDataDAL(session)
+    app.dependency_overrides[get_sensor_data_dal] = lambda: dal
+    yield dal
+    app.dependency_overrides.clear()
+    session.close()
+
+
+def test_csv_export(export_dal):
+    """The filtered rows are streamed as CSV, gzip or zstd compressed on request."""
+    client = TestClient(app)
+    params = {"sensor_id": "sensor_1", "date_from": "2025-01-01T00:00:00"}
+
+    plain = client.get("/api/v1/sensors/export", params=params, headers={"Accept-Encoding": "identity"})
+    assert plain.status_code == 200 and "content-encoding" not in plain.headers
+    rows = list(csv.reader(io.StringIO(plain.text)))
+    assert rows[0] == ["id", "timestamp", "sensor_id", "metric", "value"]
+    assert len(rows) == 1 + 1250
+    assert {row[2] for row in rows[1:]} == {"sensor_1"} and rows[1][3] == "temperature"
+
+    gzipped = client.get("/api/v1/sensors/export", params=params, headers={"Accept-Encoding": "gzip"})
+    assert gzipped.headers["content-encoding"] == "gzip"
+    assert gzipped.text == plain.text  # Decoded by the client.
+
+    zstandard = pytest.importorskip("zstandard")
+    headers = {"Accept-Encoding": "zstd, gzip"}
+    with client.stream("GET", "/api/v1/sensors/export", params=params, headers=headers) as response:
+        assert response.headers["content-encoding"] == "zstd"
+        raw = b"".join(response.iter_raw())
+    assert zstandard.ZstdDecompressor().decompressobj().decompress(raw).decode() == plain.text
+
+    assert client.get("/api/v1/sensors/export", params={"date_from": "yesterday"}).status_code == 400
+
+
+def test_negotiate_encoding():
+    """zstd is preferred over gzip, refused encodings are skipped."""
+    assert negotiate_encoding(None) is None
+    assert negotiate_encoding("gzip, deflate, br") == "gzip"
+    assert negotiate_encoding("zstd;q=0, gzip") == "gzip"
+    assert negotiate_encoding("identity") is None
+
+
+def test_copy_to_stdout_streams_with_backpressure():
+    """COPY output is handed over chunk by chunk, closing the stream aborts the COPY."""
+    written = []
+
+    class FakeCursor:
+        """Writes like psycopg2 copy_expert: many small chunks into the given file."""
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            return False
+
+        def copy_expert(self, sql, file):
+            for i in range(1000):
+                file.write(f"{i}\n")
+                written.append(i)
+
+    class FakeConnection:
+        def cursor(self):
+            return FakeCursor()
+
+    stream = copy_to_stdout(FakeConnection(), "COPY (SELECT 1) TO STDOUT", max_buffered_chunks=4)
+    assert [next(stream) for _ in range(3)] == [b"0\n", b"1\n", b"2\n"]
+    stream.close()
+    assert len(written) < 1000  # The COPY stopped, not more than the buffer was produced ahead.
+
+    assert b"".join(copy_to_stdout(FakeConnection(), "COPY")).count(b"\n") == 1000
+
+
+def test_parquet_export(export_dal):
+    """Row groups are written per partition and read back as one table."""
+    pq = pytest.importorskip("pyarrow.parquet")
+    data = b"".join(rows_to_parquet(export_dal.export_rows(chunk_size=1000)))
+    table = pq.read_table(io.BytesIO(data))
+    assert table.num_rows == 2500
+    assert pq.ParquetFile(io.BytesIO(data)).num_row_groups == 3
+
+
+def test_parquet_export_without_pyarrow(export_dal, monkeypatch):
+    """Without pyarrow the Parquet export answers 501 instead of failing mid-stream."""
+    monkeypatch.setattr(endpoints, "parquet_available", lambda: False)
+    response = TestClient(app).get("/api/v1/sensors/export", params={"format": "parquet"})
+    assert response.status_code == 501
@@ -0,0 +1,118 @@
+"""Test module for the asynchronous jobs."""
+
+import asyncio
+import threading
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+import pytest
+from app import schemas
+from app.jobs import JobManager, JobQueueFull, get_job_manager
+from app.main import app
+
+
+def _list_job(sensor_ids):
+    return schemas.JobRequest(kind="list", sensor_ids=sensor_ids)
+
+
+def test_coalescing_limits_and_expiry():
+    """Equal requests in flight share a job, the pending limit is enforced, finished jobs expire."""
+    release = threading.Event()
+    runs = []
+    now = [0.0]
+
+    def run(request):
+        runs.append(request.sensor_ids)
+        release.wait(5)
+        if request.sensor_ids == ["bad"]:
+            raise HTTPException(status_code=400, detail="Bad sensor")
+        return request.sensor_ids
+
+    async def scenario():
+        manager = JobManager(run, workers=2, max_pending=2, result_ttl=60, clock=lambda: now[0])
+        first, coalesced = manager.submit(_list_job(["a", "b"]))
+        assert not coalesced
+        same, coalesced = manager.submit(_list_job(["b", "a", "a"]))
+        assert coalesced and same is first
+        failing, _ = manager.submit(_list_job(["bad"]))
+        with pytest.raises(JobQueueFull):
+            manager.submit(_list_job(["c"]))
+
+        assert not await manager.wait(first, timeout=0.01)
+        release.set()
+        assert await manager.wait(first, timeout=5) and await manager.wait(failing, timeout=5)
+        assert (first.status, first.result) == (schemas.JobStatus.SUCCEEDED, ["a", "b"])
+        assert (failing.status, failing.error, failing.error_status) == (schemas.JobStatus.FAILED, "Bad sensor", 400)
+        assert len(runs) == 2
+
+        # A finished job is not joined, the submission runs again.
+        again, coalesced = manager.submit(_list_job(["a", "b"]))
+        assert not coalesced and again is not first
+        assert await manager.wait(again, timeout=5)
+
+        now[0] = 61
+        assert manager.get(first.id) is None and manager.get(again.id) is None
+        manager.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_shutdown_fails_queued_jobs():
+    """On shutdown the queued jobs fail and release their waiters, the running job finishes."""
+    started, release = threading.Event(), threading.Event()
+
+    def run(request):
+        started.set()
+        release.wait(5)
+        return request.sensor_ids
+
+    async def scenario():
+        manager = JobManager(run, workers=1, max_pending=2, result_ttl=60)
+        running, _ = manager.submit(_list_job(["a"]))
+        queued, _ = manager.submit(_list_job(["b"]))
+        assert started.wait(5)
+        waiter = asyncio.create_task(manager.wait(queued, timeout=5))
+        await asyncio.sleep(0)
+        manager.shutdown()
+        assert await waiter
+        assert (queued.status, queued.error_status) == (schemas.JobStatus.FAILED, 503)
+        assert running.status == schemas.JobStatus.RUNNING and manager.pending == 1
+        release.set()
+        assert await manager.wait(running, timeout=5)
+        assert running.status == schemas.JobStatus.SUCCEEDED and manager.pending == 0
+
+    asyncio.run(scenario())
+
+
+def test_job_endpoints():
+    """A job is submitted, long polled and followed on its event stream."""
+    release = threading.Event()
+
+    def run(request):
+        release.wait(5)
+        return [{"question": request.question}]
+
+    manager = JobManager(run, workers=1, max_pending=10, result_ttl=60)
+    app.dependency_overrides[get_job_manager] = lambda: manager
+    client = TestClient(app)
+    try:
+        response = client.post("/api/v1/jobs", json={"kind": "ask", "question": "Max temperature?"})
+        assert response.status_code == 202
+        job = response.json()
+        assert job["status"] in ("queued", "running") and response.headers["Location"].endswith(f"/jobs/{job['id']}")
+        duplicate = client.post("/api/v1/jobs", json={"kind": "ask", "question": " Max   temperature? "})
+        assert duplicate.json()["id"] == job["id"] and duplicate.headers["X-Coalesced"] == "true"
+
+        assert client.get(f"/api/v1/jobs/{job['id']}", params={"wait": 0.05}).json()["status"] != "succeeded"
+        release.set()
+        with client.stream("GET", f"/api/v1/jobs/{job['id']}/events") as events:
+            body = "".join(events.iter_text())
+        assert "event: done" in body and '"status":"succeeded"' in body
+        polled = client.get(f"/api/v1/jobs/{job['id']}", params={"wait": 5}).json()
+        assert polled["result"] == [{"question": "Max temperature?"}]
+
+        assert client.get("/api/v1/jobs/unknown").status_code == 404
+        assert client.post("/api/v1/jobs", json={"kind": "ask"}).status_code == 422
+        assert client.post("/api/v1/jobs", json={"kind": "list", "date_from": "yesterday"}).status_code == 400
+    finally:
+        app.dependency_overrides.clear()
+        manager.shutdown()
@@ -0,0 +1,109 @@
+"""Test module for the line protocol ingest listener."""
+
+import asyncio
+import socket
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+from app import models
+from app.admission import AdmissionController
+from app.dal import SensorDataDAL
+from app.dedup import RecentKeyFilter
+from app.line_protocol import LineProtocolServer, ReadingBatcher, parse_line, parse_lines
+
+
+def test_parse_lines():
+    """Valid lines become readings, invalid lines are counted, comments and empty lines are skipped."""
+    reading = parse_line(b"boiler-1,temperature 21.5 1700000000123456789")
+    assert (reading.sensor_id, reading.metric, reading.value) == ("boiler-1", models.MetricEnum.TEMPERATURE, 21.5)
+    assert reading.timestamp == datetime(2023, 11, 14, 22, 13, 20, 123456)
+    assert parse_line(b"a,b,level 3 1700000000", precision="s").sensor_id == "a,b"
+    received = datetime(2024, 1, 1)
+    assert parse_line(b"s1,speed -4e3", received=received).timestamp == received
+
+    data = b"\n".join(
+        [
+            b"# gateway 7",
+            b"s1,humidity 40",
+            b"",
+            b"s1,colour 1",  # Unknown metric
+            b"s1,humidity nan",
+            b",humidity 1",
+            b"s1,humidity 1 yesterday",
+            b"s2,binary 1\r",
+        ]
+    )
+    readings, invalid = parse_lines(data)
+    assert [(r.sensor_id, r.metric.value) for r in readings] == [("s1", "humidity"), ("s2", "binary")]
+    assert invalid == 4
+    with pytest.raises(ValueError):
+        parse_line(b"s1,humidity")
+
+
+def test_tcp_and_udp_ingest(tmp_path):
+    """Readings sent over TCP and UDP are written in batches, retried readings are stored once."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'line.db'}", connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+    recent_keys = RecentKeyFilter(1000)
+    batches = []
+
+    def write(readings):
+        batches.append(len(readings))
+        with session_factory() as session:
+            return SensorDataDAL(session, recent_keys=recent_keys).write_readings(readings)
+
+    async def written(count: int):
+        for _ in range(200):
+            if sum(batches) >= count:
+                return
+            await asyncio.sleep(0.01)
+
+    async def run():
+        batcher = ReadingBatcher(write, batch_size=100, flush_interval=0.05, writers=1)
+        server = LineProtocolServer(batcher, "127.0.0.1", tcp_port=0, udp_port=0, precision="s")
+        await server.start()
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", server.tcp_port)
+            lines = [b"s%d,temperature %d %d\n" % (i % 10, i, 1700000000 + i) for i in range(250)]
+            data = b"".join(lines + lines[:200])  # The retried readings are duplicates.
+            writer.write(data[:1001])  # Split inside a line.
+            writer.write(data[1001:])
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+            await written(450)
+
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as udp:
+                udp.sendto(b"u1,level 1.5 1700000000\nu1,level 2.5 1700000001", ("127.0.0.1", server.udp_port))
+            await written(452)
+        finally:
+            await server.stop()
+
+    asyncio.run(run())
+
+    with session_factory() as session:
+        assert session.scalar(select(func.count()).select_from(models.SensorData)) == 252
+        assert session.scalar(select(func.sum(models.SensorStatsTotal.count))) == 252
+    assert max(batches) <= 100
+
+
+def test_batcher_admission_control():
+    """Readings go through the ingest admission control, throttled UDP readings are dropped."""
+    admission = AdmissionController(
+        global_rate=0, global_burst=0, sensor_rate=0, sensor_burst=0, queue_capacity=3, queue_high_water=3
+    )
+    written = []
+    readings = parse_lines(b"s1,temperature 1 1700000000\ns2,temperature 2 1700000000")[0]
+
+    async def run():
+        batcher = ReadingBatcher(written.extend, batch_size=100, flush_interval=10, writers=1, admission=admission)
+        assert batcher.offer(readings) == 0
+        assert admission.depth == 2
+        assert batcher.offer(readings) == 2  # The queue would exceed its capacity.
+        await batcher.close()
+
+    asyncio.run(run())
+    assert len(written) == 2
+    assert admission.depth == 0
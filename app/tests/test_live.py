@@ -0,0 +1,85 @@
+"""Test module for the live subscription stream."""
+
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+from app import models
+from app.live import SLOW_CONSUMER, LiveHub, get_live_hub
+from app.main import app
+
+
+def _reading(sensor_id: str, metric: str, value: float = 1.0) -> models.SensorData:
+    return models.SensorData(
+        id=uuid.uuid4(), sensor_id=sensor_id, metric=models.MetricEnum(metric), value=value,
+        timestamp=datetime(2025, 1, 1),
+    )
+
+
+def test_fan_out_and_slow_consumers():
+    """Readings reach the matching subscribers only, a subscriber with a full queue is dropped."""
+
+    async def run():
+        hub = LiveHub(queue_size=2, max_subscribers=10)
+        boiler = hub.subscribe(["boiler"])
+        boiler_level = hub.subscribe(["boiler", "tank"], ["level"])
+        humidity = hub.subscribe(None, ["humidity"])
+        everything = hub.subscribe()
+
+        hub.publish([_reading("boiler", "temperature", 80.5), _reading("tank", "level", 3), _reading("room", "humidity")])
+        await asyncio.sleep(0)  # Delivery is scheduled on the loop.
+        received = {}
+        for name, subscriber in [("boiler", boiler), ("level", boiler_level), ("humidity", humidity), ("all", everything)]:
+            received[name] = [(r["sensor_id"], r["metric"]) for r in json.loads(await subscriber.get(timeout=1))]
+        assert received == {
+            "boiler": [("boiler", "temperature")],
+            "level": [("tank", "level")],
+            "humidity": [("room", "humidity")],
+            "all": [("boiler", "temperature"), ("tank", "level"), ("room", "humidity")],
+        }
+
+        # "everything" does not consume: two batches fill its queue, the third drops it.
+        for _ in range(3):
+            hub.publish([_reading("boiler", "temperature")])
+            await asyncio.sleep(0)
+            assert await boiler.get(timeout=1) is not None
+        assert everything.closed == SLOW_CONSUMER and await everything.get() is None
+        assert len(hub) == 3
+
+        hub.unsubscribe(boiler)
+        hub.publish([_reading("boiler", "temperature")])
+        await asyncio.sleep(0)
+        assert await boiler.get(timeout=0.01) is None and len(hub) == 2
+
+    asyncio.run(run())
+
+
+def test_websocket_stream():
+    """Published readings are pushed to a WebSocket subscriber, the subscriber limit is enforced."""
+    hub = LiveHub(queue_size=10, max_subscribers=1)
+    app.dependency_overrides[get_live_hub] = lambda: hub
+    client = TestClient(app)
+    try:
+        with client.websocket_connect("/api/v1/sensors/live/ws?sensor_id=s1&metric=speed") as websocket:
+            for _ in range(100):  # Wait until the endpoint has subscribed.
+                if len(hub):
+                    break
+                time.sleep(0.01)
+            with pytest.raises(WebSocketDisconnect) as rejected:
+                with client.websocket_connect("/api/v1/sensors/live/ws"):
+                    pass
+            assert rejected.value.code == 1013
+
+            hub.publish([_reading("s1", "temperature"), _reading("s1", "speed", 7.5)])
+            assert json.loads(websocket.receive_text())[0]["value"] == 7.5
+        for _ in range(100):
+            if not len(hub):
+                break
+            time.sleep(0.01)
+        assert len(hub) == 0
+    finally:
+        app.dependency_overrides.clear()
@@ -0,0 +1,99 @@
+"""Test module for the incremental sensor liveness and data gap index."""
+
+import json
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app import models
+from app.dal import SensorDataDAL, get_sensor_data_dal
+from app.liveness import rebuild_liveness
+from app.main import app
+
+START = datetime(2025, 1, 1)
+
+
+def readings(sensor_id, minutes):
+    return [
+        models.SensorData(
+            sensor_id=sensor_id, metric=models.MetricEnum.TEMPERATURE, value=float(minute),
+            timestamp=START + timedelta(minutes=minute),
+        )
+        for minute in minutes
+    ]
+
+
+def gaps(dal, **kwargs):
+    return [(gap.sensor_id, gap.start, gap.end) for gap in dal.get_data_gaps(**kwargs)]
+
+
+def test_liveness_and_gaps_maintained_on_ingest():
+    """Gaps are detected against the learned interval, late readings split them, a rebuild gives the same index."""
+    engine = create_engine("sqlite:///:memory:")
+    models.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        dal = SensorDataDAL(session)
+        dal.create_sensor_data_bulk(readings("sensor1", range(0, 10)) + readings("sensor2", range(0, 61)))
+        dal.create_sensor_data_bulk(readings("sensor1", range(30, 40)))
+        at = START + timedelta(minutes=60)
+        assert gaps(dal, now=at) == [
+            ("sensor1", START + timedelta(minutes=9), START + timedelta(minutes=30)),
+            ("sensor1", START + timedelta(minutes=39), None),  # Silent since, the threshold is 3 minutes.
+        ]
+
+        # A late backfill closes most of the gap, the rest stays.
+        for row in readings("sensor1", range(10, 21)):
+            dal.create_sensor_data(row)
+        assert gaps(dal, now=at, date_to=(START + timedelta(minutes=35)).isoformat()) == [
+            ("sensor1", START + timedelta(minutes=20), START + timedelta(minutes=30)),
+        ]
+        assert gaps(dal, now=at, min_duration_s=900) == [("sensor1", START + timedelta(minutes=39), None)]
+
+        (stale,) = dal.get_stale_sensors(at=at)
+        assert (stale.sensor_id, stale.readings, stale.interval_s) == ("sensor1", 31, 60.0)
+        assert stale.stale_after == START + timedelta(minutes=42)
+        assert dal.get_stale_sensors(at=START + timedelta(minutes=41)) == []
+        # The gap is not a regular interval: only the 60 s inter-arrival times are kept.
+        state = session.get(models.SensorLiveness, ("sensor1", "temperature"))
+        assert set(json.loads(state.recent_intervals)) == {60.0}
+
+        before = gaps(dal, now=at)
+        rebuild_liveness(session)
+        assert gaps(dal, now=at) == before
+        assert [(row.sensor_id, row.readings, row.interval_s) for row in session.query(models.SensorLiveness)] == [
+            ("sensor1", 31, 60.0), ("sensor2", 61, 60.0),
+        ]
+    finally:
+        session.close()
+
+
+def test_stale_and_gaps_endpoints():
+    """The endpoints serve the stale sensor metrics and the gaps of a range."""
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        SensorDataDAL(session).create_sensor_data_bulk(readings("sensor1", [0, 1, 2, 3, 10, 11]))
+        app.dependency_overrides[get_sensor_data_dal] = lambda: SensorDataDAL(session)
+        client = TestClient(app)
+
+        response = client.get("/api/v1/sensors/stale", params={"metric": "temperature"})
+        assert response.status_code == 200
+        (stale,) = response.json()
+        assert stale["sensor_id"] == "sensor1" and stale["expected_interval_s"] == 60.0
+        assert stale["silent_s"] > 0
+
+        response = client.get(
+            "/api/v1/sensors/gaps", params={"sensor_id": "sensor1", "date_to": "2025-01-01T00:05:00"}
+        )
+        assert response.status_code == 200
+        assert response.json() == [
+            {"sensor_id": "sensor1", "metric": "temperature", "start": "2025-01-01T00:03:00",
+             "end": "2025-01-01T00:10:00", "duration_s": 420.0, "expected_interval_s": 60.0},
+        ]
+        assert client.get("/api/v1/sensors/gaps", params={"date_from": "yesterday"}).status_code == 400
+    finally:
+        app.dependency_overrides.clear()
+        session.close()
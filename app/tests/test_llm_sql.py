@@ -0,0 +1,162 @@
+"""Test module for the guarded LLM SQL agent, using a stub LLM instead of OpenAI."""
+
+import json
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import List
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeMessagesListChatModel
+from langchain_core.messages import AIMessage, ToolMessage
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from pydantic import ValidationError
+from app import models
+from app.config import Settings
+from app.database import create_agent_engine
+from app.llm_replay import ReplayChatModel, TranscriptRecorder
+from app.llm_sql import GuardedSQLDatabase, get_prompt, load_sql_agent, parse_response
+from app.sql_guard import QueryEstimate, QueryGuard, QueryRejected
+
+EXAMPLES = Path(__file__).resolve().parents[2] / "examples"
+
+class StubChatModel(FakeMessagesListChatModel):
+    """Replays the given messages and records the tool results sent back to the model."""
+
+    tool_results: List[str] = []
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if isinstance(messages[-1], ToolMessage):
+            self.tool_results.append(messages[-1].content)
+        return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+
+def tool_call(query: str) -> AIMessage:
+    """AI message calling the SQL query tool."""
+    return AIMessage(
+        content="",
+        tool_calls=[{"name": "sql_db_query", "args": {"query": query}, "id": str(uuid.uuid4())}],
+    )
+
+
+FINAL_ANSWER = AIMessage(content='{"answer": "done", "followup_question": "none"}')
+
+
+@pytest.fixture(scope="function")
+def agent_engine(tmp_path):
+    """File database with a couple of rows, opened through the read only agent engine factory."""
+    url = f"sqlite:///{tmp_path / 'agent.db'}"
+    engine = create_engine(url)
+    models.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    for i in range(5):
+        session.add(
+            models.SensorData(
+                id=uuid.uuid4(),
+                sensor_id="sensor1",
+                metric=models.MetricEnum.TEMPERATURE,
+                value=20 + i,
+                timestamp=datetime(2025, 1, 1, 0, i),
+            )
+        )
+    session.commit()
+    session.close()
+    engine.dispose()
+    return create_agent_engine(
+        url, statement_timeout_ms=1000, pool_size=1, max_overflow=0, pool_timeout=1, pool_recycle=60
+    )
+
+
+class ExpensiveGuard(QueryGuard):
+    """Guard with fixed planner estimates, since SQLite has no cost based EXPLAIN."""
+
+    def estimate(self, conn, statement):
+        return QueryEstimate(cost=5e9, rows=1e8)
+
+
+def run_agent(db, *responses):
+    """Run the SQL agent with a stub LLM and return the tool results the LLM received."""
+    llm = StubChatModel(responses=[*responses, FINAL_ANSWER], tool_results=[])
+    load_sql_agent(llm=llm, db=db).invoke({"input": "question"})
+    return llm.tool_results
+
+
+def test_agent_query_gets_row_limit(agent_engine):
+    """Queries without LIMIT run with the configured row limit appended."""
+    db = GuardedSQLDatabase(engine=agent_engine, guard=QueryGuard(max_cost=1e6, max_rows=2))
+
+    observations = run_agent(db, tool_call("SELECT value FROM sensor_data ORDER BY timestamp"))
+
+    assert observations == ["[(20.0,), (21.0,)]"]
+
+
+def test_existing_row_limit_is_kept():
+    """Queries ending in any row limiting clause are not given a second one."""
+    guard = ExpensiveGuard(max_cost=1e10, max_rows=100)
+    for sql in (
+        "SELECT value FROM sensor_data LIMIT 10 OFFSET 5",
+        "SELECT value FROM sensor_data OFFSET 5 LIMIT 10",
+        "SELECT value FROM sensor_data ORDER BY timestamp FETCH FIRST 10 ROWS ONLY",
+        "SELECT value FROM sensor_data OFFSET 5 ROWS FETCH NEXT 10 ROWS ONLY",
+    ):
+        assert guard.review(None, sql) == sql
+    assert guard.review(None, "SELECT value FROM sensor_data OFFSET 5").endswith("OFFSET 5\nLIMIT 100")
+
+
+def test_agent_expensive_query_is_rejected(agent_engine):
+    """Rejections are reported back to the agent as tool errors."""
+    db = GuardedSQLDatabase(engine=agent_engine, guard=ExpensiveGuard(max_cost=1e6, max_rows=1000))
+
+    observations = run_agent(db, tool_call("SELECT * FROM sensor_data"))
+
+    assert len(observations) == 1
+    assert observations[0].startswith("Error: Query rejected: estimated cost")
+    assert "time bound" in observations[0]
+
+
+def test_agent_connection_is_read_only(agent_engine):
+    """Write statements are refused by the guard, and by the read only connection itself."""
+    guard = QueryGuard(max_cost=1e6, max_rows=1000)
+    with agent_engine.connect() as conn:
+        with pytest.raises(QueryRejected):
+            guard.review(conn, "DELETE FROM sensor_data")
+        with pytest.raises(QueryRejected):
+            guard.review(conn, "SELECT 1; DELETE FROM sensor_data")
+        with pytest.raises(OperationalError):
+            conn.exec_driver_sql("DELETE FROM sensor_data")
+
+
+def test_replayed_transcript_uses_current_rows(agent_engine, tmp_path):
+    """A recorded run is replayed on the current data, and recording the replay gives the same transcript."""
+    query = {"sqlite": "SELECT id, value FROM sensor_data ORDER BY timestamp LIMIT 2", "postgresql": "-"}
+    transcript = [
+        {"tool_calls": [{"name": "sql_db_query", "args": {"query": query}}]},
+        {"content": '{"answer": "Two rows", "followup_question": "More?", "id_list": $tool_ids}'},
+    ]
+    llm = ReplayChatModel(transcripts={"first two rows": transcript}, dialect="sqlite")
+    db = GuardedSQLDatabase(engine=agent_engine, guard=QueryGuard(max_cost=1e6, max_rows=1000))
+    recorder = TranscriptRecorder(str(tmp_path / "recorded.jsonl"))
+    agent = load_sql_agent(llm=llm, db=db).with_config(callbacks=[recorder])
+
+    output = agent.invoke({"input": get_prompt().substitute(userquestion="First  two ROWS")})["output"]
+
+    with agent_engine.connect() as conn:
+        expected = [row[0] for row in conn.exec_driver_sql("SELECT id FROM sensor_data ORDER BY timestamp")]
+    assert parse_response(output).id_list == [str(uuid.UUID(row_id)) for row_id in expected[:2]]
+    [recorded] = [json.loads(line) for line in (tmp_path / "recorded.jsonl").read_text(encoding="utf-8").splitlines()]
+    assert recorded["question"] == "First  two ROWS"
+    assert recorded["messages"][0]["tool_calls"][0]["args"]["query"] == query["sqlite"]
+    assert recorded["messages"][1]["content"] == output
+    with pytest.raises(ValueError, match="No recorded transcript"):
+        agent.invoke({"input": get_prompt().substitute(userquestion="unknown question")})
+
+
+def test_replay_configuration():
+    """The bundled example transcripts load, an unknown LLM provider is a configuration error."""
+    assert len(ReplayChatModel.from_file(str(EXAMPLES / "transcripts.jsonl")).transcripts) == 4
+    with pytest.raises(ValidationError):
+        Settings(llm_provider="replayed")
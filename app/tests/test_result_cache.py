@@ -0,0 +1,70 @@
+"""Test module for the query result cache."""
+
+from datetime import datetime, timedelta
+from app.ingest_events import series_spans
+from app.models import MetricEnum, SensorData
+from app.result_cache import ENTRY_OVERHEAD, QueryKey, ResultCache
+
+
+class FakeClock:
+    """Manually advanced monotonic clock."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _fill(cache: ResultCache, key: QueryKey, body: bytes = b"[]") -> None:
+    cache.put(cache.begin_fill(key), body, {"ETag": 'W/"1"'})
+
+
+def _written(sensor_id: str, metric: str, timestamp: datetime):
+    return series_spans([SensorData(sensor_id=sensor_id, metric=MetricEnum(metric), timestamp=timestamp)])
+
+
+def test_invalidation_by_series_and_range():
+    """Ingest drops exactly the entries covering the written series and time, including wildcard filters."""
+    cache = ResultCache(max_bytes=1_000_000, ttl=60)
+    day = datetime(2024, 5, 1)
+    s1_temperature = QueryKey.from_filters(["s1", "s1"], ["temperature"], "2024-05-01", "2024-05-02T00:00:00Z")
+    s1_any = QueryKey.from_filters(["s1"], None, None, None)
+    any_humidity = QueryKey.from_filters(None, ["humidity"], None, None)
+    s2_april = QueryKey.from_filters(["s2"], None, "2024-04-01", "2024-04-30")
+    for key in (s1_temperature, s1_any, any_humidity, s2_april):
+        _fill(cache, key)
+    assert QueryKey.from_filters(["s1"], ["temperature"], "2024-05-01T00:00:00+00:00", "2024-05-02") == s1_temperature
+
+    assert cache.invalidate(_written("s1", "humidity", day)) == 2  # s1_any and any_humidity
+    assert cache.get(s1_temperature) is not None and cache.get(s1_any) is None
+    assert cache.invalidate(_written("s2", "temperature", day)) == 0  # After the range of s2_april.
+    assert cache.invalidate(_written("s1", "temperature", day + timedelta(hours=3))) == 1
+    assert len(cache) == 1 and cache.get(s2_april) is not None
+
+    # A result computed while overlapping readings were committed is not cached.
+    token = cache.begin_fill(s1_any)
+    cache.invalidate(_written("s1", "speed", day))
+    cache.put(token, b"[]", {})
+    assert cache.get(s1_any) is None
+
+
+def test_memory_budget_and_lifetime():
+    """Least recently used entries are evicted over the budget, entries expire after the lifetime."""
+    clock = FakeClock()
+    body = b"x" * 1000
+    cache = ResultCache(max_bytes=4 * (len(body) + ENTRY_OVERHEAD), ttl=60, clock=clock)
+    keys = [QueryKey.from_filters([f"s{i}"], None, None, None) for i in range(5)]
+    for key in keys[:4]:
+        _fill(cache, key, body)
+    assert cache.get(keys[0]).body == body  # keys[1] is now the least recently used.
+    _fill(cache, keys[4], body)
+    assert cache.get(keys[1]) is None and len(cache) == 4
+    assert cache.size == cache.max_bytes
+
+    _fill(cache, QueryKey.from_filters(["big"], None, None, None), b"x" * 2000)
+    assert len(cache) == 4 and cache.get(keys[0]) is not None  # Larger than a quarter of the budget.
+
+    clock.now += 61
+    assert cache.get(keys[0]) is None
+    assert cache.size == 3 * (len(body) + ENTRY_OVERHEAD)
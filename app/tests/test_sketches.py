@@ -0,0 +1,84 @@
+"""Test module for the mergeable quantile sketches."""
+
+import json
+import random
+import uuid
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app import models
+from app.dal import SensorDataDAL
+from app.sketches import DDSketch, compact_sketches, rebuild_sketches
+
+
+def test_quantiles_within_relative_error():
+    """Estimates of a merged sketch stay within the relative accuracy of the exact percentiles."""
+    rng = random.Random(42)
+    values = [rng.lognormvariate(3, 1) for _ in range(20000)] + [-5.0, 0.0]
+    first, second = DDSketch(0.01), DDSketch(0.01)
+    for i, value in enumerate(values):
+        (first if i % 2 else second).add(value)
+    first.merge(DDSketch.from_json(second.to_json()))
+
+    assert first.count == len(values)
+    assert (first.min, first.max) == (min(values), max(values))
+    for q in (0.01, 0.5, 0.95, 0.99):
+        exact = np.quantile(values, q, method="lower")
+        assert first.quantile(q) == pytest.approx(exact, rel=0.0101)
+
+    histogram = first.histogram(10)
+    assert len(histogram) == 10
+    assert sum(count for _, _, count in histogram) == len(values)
+
+
+def test_sketches_maintained_on_ingest():
+    """Ingest appends hourly sketch deltas, range queries merge them, compaction and rebuild give the same result."""
+    engine = create_engine("sqlite:///:memory:")
+    models.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        dal = SensorDataDAL(session)
+        start = datetime(2025, 1, 1)
+        dal.create_sensor_data_bulk(
+            [
+                models.SensorData(
+                    sensor_id="sensor1",
+                    metric=models.MetricEnum.TEMPERATURE,
+                    value=float(i),
+                    timestamp=start + timedelta(minutes=i),
+                )
+                for i in range(1, 181)
+            ]
+        )
+        dal.create_sensor_data(
+            models.SensorData(
+                id=uuid.uuid4(),
+                sensor_id="sensor1",
+                metric=models.MetricEnum.TEMPERATURE,
+                value=1000.0,
+                timestamp=start + timedelta(minutes=30, seconds=30),
+            )
+        )
+        # One delta per batch and hour, merged into one row per hour by the compaction.
+        assert session.query(models.SensorSketch).count() == 5
+        ((_, _, uncompacted),) = dal.get_sensor_sketches()
+        assert compact_sketches(session) == 1
+        assert session.query(models.SensorSketch).count() == 4
+        ((_, _, compacted),) = dal.get_sensor_sketches()
+        assert json.loads(compacted.to_json()) == json.loads(uncompacted.to_json())
+
+        ((_, _, first_hour),) = dal.get_sensor_sketches(
+            sensor_ids=["sensor1"], date_from="2025-01-01T00:00:00", date_to="2025-01-01T00:59:00"
+        )
+        assert first_hour.count == 60  # minutes 1-59 and the 1000.0 reading
+        assert first_hour.max == 1000.0
+        assert first_hour.quantile(0.5) == pytest.approx(30, rel=0.01)
+
+        ((_, _, before),) = dal.get_sensor_sketches()
+        rebuild_sketches(session)
+        ((_, _, after),) = dal.get_sensor_sketches()
+        assert json.loads(before.to_json()) == json.loads(after.to_json())
+    finally:
+        session.close()
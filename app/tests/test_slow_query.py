@@ -0,0 +1,101 @@
+"""Test module for the slow query recorder."""
+
+import uuid
+from datetime import datetime
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app import models
+from app.dal import SensorDataDAL
+from app.main import app
+from app.slow_query import SlowQueryRecorder, chunk_exclusion_info, get_slow_query_recorder
+
+
+def test_slow_query_capture_with_plan(tmp_path):
+    """Statements above the threshold are captured with parameters and plan, the ring is bounded."""
+    # File database, so the background EXPLAIN runs on its own connection and sees the same tables.
+    # (A shared StaticPool connection would be reset, i.e. rolled back, when the EXPLAIN returns it.)
+    engine = create_engine(f"sqlite:///{tmp_path / 'slow.db'}", connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(bind=engine)
+    recorder = SlowQueryRecorder(threshold_ms=0, capacity=1)
+    recorder.attach(engine, "test")
+    session = sessionmaker(bind=engine)()
+    try:
+        dal = SensorDataDAL(session)
+        dal.create_sensor_data(
+            models.SensorData(
+                id=uuid.uuid4(),
+                sensor_id="sensor1",
+                metric=models.MetricEnum.TEMPERATURE,
+                value=20,
+                timestamp=datetime(2025, 1, 1),
+            )
+        )
+        dal.list_sensor_data(sensor_ids=["sensor1"])
+        recorder.close()
+
+        # The INSERT has been pushed out of the ring by the SELECT.
+        entries = recorder.entries()
+        assert len(entries) == 1
+        assert entries[0]["statement"].lstrip().startswith("SELECT")
+        assert entries[0]["engine"] == "test"
+        assert "sensor1" in entries[0]["parameters"]
+        assert entries[0]["plan"] and entries[0]["plan_error"] is None
+    finally:
+        session.close()
+
+
+def test_chunk_exclusion_info():
+    """Chunk names and excluded chunk counts are extracted from a Timescale JSON plan."""
+    plan = [
+        {
+            "Plan": {
+                "Node Type": "Custom Scan",
+                "Custom Plan Provider": "ChunkAppend",
+                "Chunks excluded during startup": 3,
+                "Plans": [
+                    {"Node Type": "Index Scan", "Relation Name": "_hyper_1_4_chunk"},
+                    {"Node Type": "Seq Scan", "Relation Name": "_hyper_1_5_chunk"},
+                ],
+            }
+        }
+    ]
+
+    info = chunk_exclusion_info(plan)
+
+    assert info == {"chunks_scanned": ["_hyper_1_4_chunk", "_hyper_1_5_chunk"], "chunks_excluded": 3}
+
+
+def test_slow_queries_endpoint():
+    """Admin endpoint lists the captured statements, newest first."""
+    recorder = SlowQueryRecorder(threshold_ms=0, capacity=10, explain=False)
+    recorder.record("primary", "SELECT 1", {}, 1200.0)
+    recorder.record("primary", "SELECT 2", {}, 900.0)
+    app.dependency_overrides[get_slow_query_recorder] = lambda: recorder
+
+    try:
+        response = TestClient(app).get("/api/v1/admin/slow_queries", params={"limit": 1})
+
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data) == 1
+        assert data[0]["statement"] == "SELECT 2"
+        assert data[0]["duration_ms"] == 900.0
+    finally:
+        app.dependency_overrides.clear()
+
+
+def test_explain_bounded_and_safe_after_close():
+    """Repeated statements are explained once per cooldown, and capturing after close() does not fail."""
+    recorder = SlowQueryRecorder(threshold_ms=0, capacity=10, max_pending=1, cooldown_s=60)
+    first = recorder.record("primary", "SELECT 1", {}, 1200.0)
+    repeated = recorder.record("primary", "SELECT 1", {}, 1200.0)
+    recorder.close()
+    after_close = recorder.record("primary", "SELECT 2", {}, 1200.0)
+
+    assert first.plan_error is None
+    assert repeated.plan_error == "Not explained: cooldown"
+    assert after_close.plan_error == "Not explained: closed"
+    assert SlowQueryRecorder(threshold_ms=0, capacity=1, max_pending=0).record(
+        "primary", "SELECT 3", {}, 1200.0
+    ).plan_error == "Not explained: queue full"
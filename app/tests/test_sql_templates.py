@@ -0,0 +1,113 @@
+"""Test module for the reusable SQL templates of /sensors/ask questions."""
+
+import uuid
+from datetime import datetime, timedelta
+from langchain_core.language_models.fake_chat_models import FakeMessagesListChatModel
+from langchain_core.messages import AIMessage
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app import models
+from app.ask import answer_question
+from app.dal import SensorDataDAL
+from app.llm_sql import AgentQuery, AskResponseFormater, GuardedSQLDatabase, load_sql_agent
+from app.sql_guard import QueryGuard
+from app.sql_templates import SqlTemplateCache, build_template
+
+AVERAGE_SQL = (
+    "SELECT AVG(value) FROM sensor_data WHERE sensor_id = '{sensor}' AND metric = '{metric}' "
+    "AND timestamp >= datetime('now', '{modifier}')"
+)
+
+
+class ToolCallingStub(FakeMessagesListChatModel):
+    """Replays the given messages, tools are not bound."""
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+
+class NoAgent:
+    """Agent that must not be invoked."""
+
+    def invoke(self, args):
+        raise AssertionError("The agent should not run")
+
+
+def test_capture_and_replay(tmp_path):
+    """A question of a captured form is answered by the template on the current data, without the agent."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'ask.db'}")
+    models.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    now = datetime.utcnow()
+    for sensor_id, metric, values in [("sensor_1", "temperature", (20, 22, 27)), ("boiler-2", "humidity", (40, 50, 90))]:
+        for age, value in zip((1, 2, 5), values):  # Days
+            session.add(
+                models.SensorData(
+                    id=uuid.uuid4(), sensor_id=sensor_id, metric=models.MetricEnum(metric), value=value,
+                    timestamp=now - timedelta(days=age),
+                )
+            )
+    session.commit()
+    dal = SensorDataDAL(session)
+    guard = QueryGuard(max_cost=1e6, max_rows=1000)
+
+    def execute(sql):
+        with engine.connect() as conn:
+            return [tuple(row) for row in conn.exec_driver_sql(guard.review(conn, sql))]
+
+    templates = SqlTemplateCache(capacity=10, execute=execute)
+    sql = AVERAGE_SQL.format(sensor="sensor_1", metric="temperature", modifier="-7 days")
+    llm = ToolCallingStub(
+        responses=[
+            AIMessage(content="", tool_calls=[{"name": "sql_db_query", "args": {"query": sql}, "id": "1"}]),
+            AIMessage(
+                content='{"answer": "The average Temperature of sensor_1 is 23.0.", "followup_question": "And the maximum?",'
+                ' "aggregation": "23.0"}'
+            ),
+        ]
+    )
+    agent = load_sql_agent(llm=llm, db=GuardedSQLDatabase(engine=engine, guard=guard))
+    response = answer_question("Give me the average temperature for sensor_1 in the last week?", dal, agent, templates)
+    assert response.aggregation == "23.0"
+
+    [template] = templates.entries()
+    assert template.key == "give me the average {metric0} for {sensor0} in the {window0}"
+    assert "sensor_id = {sensor0} AND metric = {metric0} AND timestamp >= datetime('now', {window0})" in template.to_out().sql
+
+    # Other sensor, metric and window: the rows of the last 3 days.
+    response = answer_question("give me the average HUMIDITY for boiler-2 in the past 3 days", dal, NoAgent(), templates)
+    assert (response.aggregation, response.llm_highlights) == ("45.0", "The average humidity of boiler-2 is 45.0.")
+    assert response.followup_question == "And the maximum?"
+
+    # No readings of the sensor: falls back to the agent, the failure is counted.
+    assert templates.answer("Give me the average humidity for sensor_9 in the last week", dal) is None
+    stats = templates.entries()[0].to_out()
+    assert (stats.uses, stats.successes, stats.failures) == (2, 1, 1) and stats.mean_replay_ms is not None
+    session.close()
+
+
+def test_only_faithful_templates_are_built():
+    """Absolute dates, answers that are not the query result and unused question values are not templated."""
+    parsed = AskResponseFormater(answer="It is 23.93.", followup_question="", aggregation="23.93")
+    question = "average temperature for sensor_1 in the last week"
+    sql = AVERAGE_SQL.format(sensor="sensor_1", metric="temperature", modifier="-7 days")
+
+    rounded = build_template(question, AgentQuery(sql, "[(23.931864,)]"), parsed, 1.0)
+    assert rounded is not None and rounded.decimals == 2
+    assert rounded.highlights == [("text", "It is "), ("value", 0), ("text", ".")]
+    # Answers naming the time window get a generic text on replay.
+    windowed = parsed.model_copy(update={"answer": "Over the last 7 days it is 23.93."})
+    assert build_template(question, AgentQuery(sql, "[(23.931864,)]"), windowed, 1.0).highlights == []
+    assert build_template(question, AgentQuery(sql, "[(24.5,)]"), parsed, 1.0) is None
+    assert build_template(question, AgentQuery(sql, "[(23.93,), (1.0,)]"), parsed, 1.0) is None
+    dated = sql.replace("datetime('now', '-7 days')", "'2025-09-01'")
+    assert build_template(question, AgentQuery(dated, "[(23.93,)]"), parsed, 1.0) is None
+    # The window of the question is not in the SQL.
+    assert build_template(question.replace("week", "month"), AgentQuery(sql, "[(23.93,)]"), parsed, 1.0) is None
+
+    row_ids = [str(uuid.uuid4()), str(uuid.uuid4())]
+    listed = AskResponseFormater(answer="Two rows", followup_question="", id_list=row_ids)
+    output = str([(row_id, 1.0) for row_id in row_ids])
+    select = "SELECT id, value FROM sensor_data WHERE sensor_id = 'sensor_1' LIMIT 2"
+    assert build_template("list 2 rows of sensor_1", AgentQuery(select, output), listed, 1.0).answer_kind == "id_list"
+    assert build_template("list 2 rows of sensor_1", AgentQuery(select, output[:60]), listed, 1.0) is None
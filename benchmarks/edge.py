@@ -0,0 +1,138 @@
+"""
+Ingest and range read benchmark of the embedded edge mode (app/edge.py) on the gateway profile.
+
+Writes a backlog of readings (sensors x days at a fixed interval) through SensorDataDAL.write_readings() in
+line protocol sized batches into a SQLite WAL database file with the SQLITE_* pragmas, then times range reads
+through the sensor_data view. The same workload runs against a single unpartitioned sensor_data table for
+comparison. Reports ingest readings per second and read latencies (p50/p95 ms), plus the time to drop one day.
+
+Usage (from the project root):
+
+    python -m benchmarks.edge --sensors 200 --days 7 --interval 300 --batch-size 500
+"""
+
+import argparse
+import random
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app import models
+from app.dal import Reading, SensorDataDAL
+from app.database import configure_sqlite
+from app.edge import DailyPartitions, init_edge
+
+METRICS = [models.MetricEnum.TEMPERATURE, models.MetricEnum.HUMIDITY]
+
+
+def make_batches(sensors: int, days: int, interval: int, batch_size: int, now: datetime):
+    """The readings in time order, as the gateway receives them, cut into batches."""
+    rng = random.Random(42)
+    steps = days * 86400 // interval
+    batch: List[Reading] = []
+    for step in range(steps, 0, -1):
+        timestamp = now - timedelta(seconds=step * interval)
+        for sensor in range(sensors):
+            for metric in METRICS:
+                batch.append(Reading(uuid.uuid4(), timestamp, f"sensor-{sensor}", metric, rng.uniform(0, 100)))
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+    if batch:
+        yield batch
+
+
+def timed(samples: int, query: Callable[[], object]) -> str:
+    durations = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        query()
+        durations.append((time.perf_counter() - started) * 1000)
+    durations.sort()
+    return f"p50 {durations[len(durations) // 2]:8.2f}  p95 {durations[int(len(durations) * 0.95)]:8.2f}  " \
+        f"mean {statistics.mean(durations):8.2f}"
+
+
+def run_layout(layout: str, path: Path, args, now: datetime) -> Dict[str, str]:
+    engine = create_engine(f"sqlite:///{path}")
+    configure_sqlite(engine)
+    partitions: Optional[DailyPartitions] = None
+    if layout == "partitioned":
+        partitions = DailyPartitions(engine, clock=lambda: now)
+        init_edge(partitions)
+    else:
+        with engine.connect() as conn:
+            conn.exec_driver_sql("PRAGMA journal_mode = WAL")
+        models.Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+
+    results = {}
+    written = 0
+    started = time.perf_counter()
+    for batch in make_batches(args.sensors, args.days, args.interval, args.batch_size, now):
+        with session_factory() as session:
+            written += SensorDataDAL(session, partitions=partitions).write_readings(batch).inserted
+    elapsed = time.perf_counter() - started
+    results["ingest"] = f"{written} readings, {written / elapsed:,.0f} per second"
+    results["file size"] = f"{sum(p.stat().st_size for p in path.parent.glob(path.name + '*')) / 1e6:.1f} MB"
+
+    rng = random.Random(7)
+    with session_factory() as session:
+        dal = SensorDataDAL(session)
+
+        def sensor_range(hours: float):
+            def query():
+                start = now - timedelta(hours=rng.uniform(hours, args.days * 24))
+                dal.list_sensor_data(
+                    [f"sensor-{rng.randrange(args.sensors)}"], ["temperature"],
+                    start.isoformat(), (start + timedelta(hours=hours)).isoformat(),
+                )
+            return query
+
+        results["1 sensor, 1 hour"] = timed(args.samples, sensor_range(1))
+        results["1 sensor, 1 day"] = timed(args.samples, sensor_range(24))
+        results["1 sensor, all days"] = timed(args.samples, sensor_range(args.days * 24 - 1))
+        results["all sensors, 10 minutes"] = timed(
+            args.samples,
+            lambda: dal.list_sensor_data(
+                None, None, (now - timedelta(minutes=10)).isoformat(), now.isoformat()
+            ),
+        )
+        ids = [str(row.id) for row in dal.list_sensor_data(None, None, (now - timedelta(hours=2)).isoformat())][:200]
+        results["200 rows by ID"] = timed(args.samples, lambda: dal.get_sensor_rows_by_ids(ids))
+
+    if partitions is not None:
+        started = time.perf_counter()
+        partitions.prune(retention_days=args.days - 1, synced_only=False)
+        results["drop oldest day"] = f"{(time.perf_counter() - started) * 1000:.1f} ms"
+    engine.dispose()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sensors", type=int, default=200)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--interval", type=int, default=300, help="Seconds between the readings of a sensor.")
+    parser.add_argument("--batch-size", type=int, default=500, help="Readings per ingest transaction.")
+    parser.add_argument("--samples", type=int, default=50, help="Executions per read query.")
+    parser.add_argument("--layout", choices=["partitioned", "single", "both"], default="both")
+    args = parser.parse_args()
+
+    now = datetime.utcnow().replace(microsecond=0)
+    layouts = ["partitioned", "single"] if args.layout == "both" else [args.layout]
+    with tempfile.TemporaryDirectory() as directory:
+        for layout in layouts:
+            results = run_layout(layout, Path(directory) / f"{layout}.db", args, now)
+            print(f"{layout} ({args.sensors} sensors x {len(METRICS)} metrics, {args.days} days, {args.interval} s)")
+            for name, value in results.items():
+                print(f"  {name:<24} {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Fan-out benchmark of the live subscription hub (app/live.py).
+
+Thousands of subscribers with mixed filters (single sensors, sensor groups, metrics, everything) consume
+on one event loop while a publisher thread plays the ingest path. A fraction of the subscribers is slow
+on purpose and gets dropped. Reports the messages (one per subscriber and ingest batch) delivered to the
+regular subscribers per second and their publish-to-consume latency.
+
+Usage (from the project root):
+
+    python -m benchmarks.fanout --subscribers 5000 --batches 200 --batch-size 100
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from app.live import SLOW_CONSUMER, LiveHub
+from app.models import MetricEnum
+
+METRICS = [metric.value for metric in MetricEnum]
+
+
+@dataclass
+class FakeRow:
+    """A written row as seen by the hub. The ID carries the batch sequence number."""
+
+    id: str
+    sensor_id: str
+    metric: str
+    value: float
+    timestamp: datetime
+
+
+def make_filters(subscribers: int, sensors: int, rng: random.Random):
+    """Subscription filters: 60% one sensor, 25% a group of 10 sensors, 10% one metric, 5% everything."""
+    for _ in range(subscribers):
+        kind = rng.random()
+        if kind < 0.60:
+            yield [f"sensor-{rng.randrange(sensors)}"], None
+        elif kind < 0.85:
+            yield [f"sensor-{rng.randrange(sensors)}" for _ in range(10)], None
+        elif kind < 0.95:
+            yield None, [rng.choice(METRICS)]
+        else:
+            yield None, None
+
+
+async def consume(subscriber, sent_at, latencies, slow: bool):
+    """Read messages until the subscription ends or stays idle, recording the latency of every message."""
+    while (message := await subscriber.get(timeout=2)) is not None:
+        sequence = int(message[9:message.index('"', 9)])  # [{"id": "<sequence>", ...
+        if slow:
+            await asyncio.sleep(0.5)
+        else:
+            latencies.append((time.perf_counter() - sent_at[sequence], time.perf_counter()))
+    return subscriber.closed
+
+
+async def run(args) -> None:
+    rng = random.Random(42)
+    hub = LiveHub(queue_size=args.queue_size, max_subscribers=args.subscribers)
+    latencies, sent_at = [], {}
+    tasks = []
+    for sensor_ids, metrics in make_filters(args.subscribers, args.sensors, rng):
+        subscriber = hub.subscribe(sensor_ids, metrics)
+        tasks.append(asyncio.create_task(consume(subscriber, sent_at, latencies, rng.random() < args.slow)))
+
+    def publish():
+        now = datetime.now()
+        for sequence in range(args.batches):
+            rows = [
+                FakeRow(str(sequence), f"sensor-{rng.randrange(args.sensors)}", rng.choice(METRICS), 1.0, now)
+                for _ in range(args.batch_size)
+            ]
+            sent_at[sequence] = time.perf_counter()
+            hub.publish(rows)
+            time.sleep(args.interval)
+
+    start = time.perf_counter()
+    publisher = threading.Thread(target=publish)
+    publisher.start()
+    while publisher.is_alive():
+        await asyncio.sleep(0.05)
+    # Consumers stop after 2 seconds without messages.
+    outcomes = await asyncio.gather(*tasks)
+    elapsed = max(received for _, received in latencies) - start
+
+    published = args.batches * args.batch_size
+    delivered = len(latencies)
+    latencies = sorted(latency for latency, _ in latencies)
+    print(f"subscribers            {args.subscribers}")
+    print(f"readings published     {published} in {args.batches} batches")
+    print(f"messages delivered     {delivered} ({delivered / elapsed:,.0f} per second)")
+    print(f"slow consumers dropped {sum(1 for outcome in outcomes if outcome == SLOW_CONSUMER)}")
+    if latencies:
+        quantile = lambda q: latencies[min(int(q * len(latencies)), len(latencies) - 1)] * 1000  # noqa: E731
+        print(
+            f"latency ms             p50 {quantile(0.5):.2f}  p95 {quantile(0.95):.2f}  "
+            f"p99 {quantile(0.99):.2f}  max {latencies[-1] * 1000:.2f}  mean {statistics.mean(latencies) * 1000:.2f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscribers", type=int, default=5000)
+    parser.add_argument("--sensors", type=int, default=2000, help="Distinct sensor IDs in the published readings.")
+    parser.add_argument("--batches", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=100, help="Readings per ingest batch.")
+    parser.add_argument("--interval", type=float, default=0.05, help="Seconds between batches.")
+    parser.add_argument("--queue-size", type=int, default=32, help="Messages queued per subscriber.")
+    parser.add_argument("--slow", type=float, default=0.01, help="Fraction of deliberately slow subscribers.")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()